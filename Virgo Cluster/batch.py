@@ -0,0 +1,174 @@
+## Headless aperture photometry of every Cepheid frame, producing a table of light curves.
+##
+## Usage:
+##     python batch.py [--detect] positions.csv lightcurves.csv [--radius 3] [--inner 2] [--outer 3]
+##
+## positions.csv holds the columns 'Cepheid', 'x' and 'y' (the pixel position of the star in the frame of the
+## first date, which is carried to the other dates by registering the frames), and optionally 'Date' to give
+## the position in an individual frame and 'Star' to measure several stars per field. With --detect, the stars
+## are found and tracked through the dates automatically instead, and their positions are written to
+## positions.csv. The output is written as Parquet if its name ends in '.parquet', and as CSV otherwise.
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from astropy.io import fits
+
+from detection import detect_sources, match_epochs
+from observations import CEPHEIDS, DATES, FITS_DIR, fits_filename
+from photometry import aperture_photometry, check_parameters
+from registration import field_shifts
+
+POSITION_COLUMNS = ['Cepheid', 'Star', 'Date', 'x', 'y']
+LIGHT_CURVE_COLUMNS = ['Cepheid', 'Star', 'Date', 'x', 'y', 'signal', 'sky', 'error']
+
+
+def frame_positions(positions, cepheid, date, shift=(0, 0)):
+    """
+    Returns the (star, x, y) positions to measure on the frame of the given Cepheid and date. Rows of the
+    positions table with a matching 'Date' take precedence over the rows which apply to the whole field. The
+    positions of the latter are given in the reference frame, and are moved by the shift of this frame.
+    """
+
+    rows = positions[positions['Cepheid'] == cepheid]
+    if 'Date' in rows.columns:
+        dated = rows[rows['Date'] == date]
+        if len(dated):
+            shift = (0, 0)
+            rows = dated
+        else:
+            rows = rows[rows['Date'].isna()]
+
+    stars = rows['Star'] if 'Star' in rows.columns else [0] * len(rows)
+    return list(zip(stars, rows['x'] + shift[0], rows['y'] + shift[1]))
+
+
+def measure_frame(task):
+    """
+    Runs aperture photometry at each of the given positions on one fits file. Runs in a worker process, so it
+    only takes and returns plain Python objects.
+    """
+
+    cepheid, date, filename, stars, R, inner_annulus, outer_annulus = task
+
+    with fits.open(filename, memmap=True) as HDUlist:
+        img = HDUlist[0].data
+
+        rows = []
+        for star, x, y in stars:
+            result = aperture_photometry(img, x, y, R, inner_annulus, outer_annulus)
+            rows.append((cepheid, star, date, x, y, float(result.signal), float(result.sky_bckg),
+                         float(result.error)))
+
+    return rows
+
+
+def track_field(task):
+    """
+    Finds the stars on every date of one Cepheid field and tracks them from the first date through the others.
+    Runs in a worker process. Returns rows of the positions table.
+    """
+
+    cepheid, fits_dir, threshold = task
+
+    catalogues = []
+    for date in DATES:
+        with fits.open(fits_filename(cepheid, date, fits_dir), memmap=True) as HDUlist:
+            catalogues.append(detect_sources(HDUlist[0].data, threshold))
+
+    x_tracks, y_tracks = match_epochs(catalogues)
+
+    return [(cepheid, star, date, x_tracks[star, i], y_tracks[star, i])
+            for star in range(len(x_tracks)) for i, date in enumerate(DATES)]
+
+
+def detect_positions(fits_dir=FITS_DIR, threshold=5.0, workers=None):
+    """
+    Finds and tracks the stars of every Cepheid field, one field per worker process. Returns a positions table
+    with one row per star and date.
+    """
+
+    tasks = [(cepheid, fits_dir, threshold) for cepheid in CEPHEIDS]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = [row for field in executor.map(track_field, tasks) for row in field]
+
+    return pd.DataFrame(rows, columns=POSITION_COLUMNS)
+
+
+def light_curves(positions, R=3, inner_annulus=2, outer_annulus=3, fits_dir=FITS_DIR, workers=None,
+                 register=True):
+    """
+    Measures every star in the positions table on all the dates it was observed. Positions which apply to the
+    whole field are carried from the reference frame to the other frames by registering them (unless register
+    is False). The frames are shared out between a pool of processes. Returns a table with one row per star and
+    date.
+    """
+
+    message = check_parameters(R, inner_annulus, outer_annulus)
+    if message is not None:
+        raise ValueError(message)
+
+    cepheids = [cepheid for cepheid in CEPHEIDS if (positions['Cepheid'] == cepheid).any()]
+
+    # Only the fields with positions given in the reference frame need registering:
+    undated = positions[positions['Date'].isna()] if 'Date' in positions.columns else positions
+    shifts = field_shifts(sorted(set(undated['Cepheid'])), fits_dir, workers=workers) if register else {}
+
+    tasks = []
+    for cepheid in cepheids:
+        for date in DATES:
+            stars = frame_positions(positions, cepheid, date, shifts.get((cepheid, date), (0, 0)))
+            if stars:
+                tasks.append((cepheid, date, fits_filename(cepheid, date, fits_dir), stars, R, inner_annulus,
+                              outer_annulus))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = [row for frame in executor.map(measure_frame, tasks) for row in frame]
+
+    return pd.DataFrame(rows, columns=LIGHT_CURVE_COLUMNS)
+
+
+def write_table(table, filename):
+    """
+    Saves the table as Parquet or CSV, depending on the extension of the file name.
+    """
+
+    if os.path.splitext(filename)[1] == '.parquet':
+        table.to_parquet(filename, index=False)
+    else:
+        table.to_csv(filename, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aperture photometry of all the Cepheid frames.')
+    parser.add_argument('positions', help='CSV file with the Cepheid, x and y (and optionally Star and Date) '
+                                          'columns, or the file to write the tracked positions to with --detect')
+    parser.add_argument('output', help='light curve table to write (.csv or .parquet)')
+    parser.add_argument('--radius', type=int, default=3, help='radius of the aperture (in pixels)')
+    parser.add_argument('--inner', type=float, default=2, help='inner annulus multiplier (in radii)')
+    parser.add_argument('--outer', type=float, default=3, help='outer annulus multiplier (in radii)')
+    parser.add_argument('--fits-dir', default=FITS_DIR, help='directory holding the fits files')
+    parser.add_argument('--detect', action='store_true', help='find and track the stars automatically')
+    parser.add_argument('--no-register', action='store_true', help='do not align the frames of each field')
+    parser.add_argument('--threshold', type=float, default=5.0, help='detection threshold (in sky sigmas)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    if args.detect:
+        positions = detect_positions(args.fits_dir, args.threshold, args.workers)
+        positions.to_csv(args.positions, index=False)
+    else:
+        positions = pd.read_csv(args.positions)
+
+    table = light_curves(positions, args.radius, args.inner, args.outer, args.fits_dir, args.workers,
+                         not args.no_register)
+    write_table(table, args.output)
+
+    print(f"Measured {len(table)} points for {table['Cepheid'].nunique()} Cepheids.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+## Automatic detection of the stars in a frame, and tracking of the stars through the frames of all the dates:
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+from photometry import sigma_clip
+
+Sources = namedtuple('Sources', ['x', 'y', 'flux', 'no_pixels'])
+
+
+def background_map(img, box_size=64, clip_sigma=3.0, iterations=5):
+    """
+    Estimates the sky background and its noise across the image. The image is split into boxes of
+    box_size x box_size pixels, the sigma-clipped median and standard deviation of every box are found in one
+    vectorized pass, and the results are interpolated back to the full size of the image.
+    """
+
+    img = np.asarray(img, dtype=float)
+    box_size = min(box_size, *img.shape)
+    ny, nx = -(-img.shape[0] // box_size), -(-img.shape[1] // box_size)  # no. of boxes (rounded up)
+
+    # Pad the image with NaNs to a whole number of boxes, and put the pixels of each box in one row:
+    padded = np.full((ny * box_size, nx * box_size), np.nan)
+    padded[:img.shape[0], :img.shape[1]] = img
+    boxes = padded.reshape(ny, box_size, nx, box_size).swapaxes(1, 2).reshape(ny * nx, -1)
+
+    clipped = sigma_clip(boxes, clip_sigma, iterations)
+    valid = ~np.isnan(clipped)
+    count = np.sum(valid, axis=1)
+    low = np.take_along_axis(clipped, np.maximum((count - 1) // 2, 0)[:, None], axis=1)[:, 0]
+    high = np.take_along_axis(clipped, (count // 2)[:, None], axis=1)[:, 0]
+    sky = ((low + high) / 2).reshape(ny, nx)
+    mean = np.sum(np.where(valid, clipped, 0), axis=1) / count
+    noise = np.sqrt(np.sum(np.where(valid, clipped - mean[:, None], 0) ** 2, axis=1) / count).reshape(ny, nx)
+
+    # Interpolate from the centres of the boxes to every pixel:
+    rows = (np.arange(img.shape[0]) + 0.5) / box_size - 0.5
+    cols = (np.arange(img.shape[1]) + 0.5) / box_size - 0.5
+    coords = np.meshgrid(rows, cols, indexing='ij')
+    sky = ndimage.map_coordinates(sky, coords, order=1, mode='nearest')
+    noise = ndimage.map_coordinates(noise, coords, order=1, mode='nearest')
+
+    return sky, noise
+
+
+def detect_sources(img, threshold=5.0, min_pixels=5, box_size=64, smoothing=1.0):
+    """
+    Finds the stars in the image. The sky background is subtracted, the image is smoothed with a gaussian of
+    width smoothing (in pixels), and groups of at least min_pixels connected pixels which lie more than
+    threshold times the sky noise above the background are taken to be stars. The position of each star is the
+    flux-weighted centroid of its pixels. Returns a Sources tuple of arrays, brightest star first.
+    """
+
+    img = np.asarray(img, dtype=float)
+    sky, noise = background_map(img, box_size)
+    data = img - sky
+
+    if smoothing:
+        smoothed = ndimage.gaussian_filter(data, smoothing)
+        noise = noise / (2 * np.sqrt(np.pi) * smoothing)  # smoothing lowers the pixel-to-pixel noise
+    else:
+        smoothed = data
+
+    labels, no_sources = ndimage.label(smoothed > threshold * noise)
+    if no_sources == 0:
+        return Sources(*(np.empty(0) for _ in Sources._fields))
+
+    index = np.arange(1, no_sources + 1)
+    no_pixels = ndimage.sum_labels(np.ones_like(data), labels, index)
+    flux = ndimage.sum_labels(data, labels, index)
+    centroids = np.array(ndimage.center_of_mass(np.clip(data, 0, None), labels, index)).reshape(-1, 2)
+
+    keep = (no_pixels >= min_pixels) & (flux > 0)
+    order = np.argsort(-flux[keep])
+    y, x = centroids[keep][order].T
+
+    return Sources(x, y, flux[keep][order], no_pixels[keep][order])
+
+
+def match_positions(reference, x, y, radius, offset=(0, 0)):
+    """
+    Matches each reference position (an (n, 2) array of x, y) to the nearest of the positions (x, y) after
+    shifting it by offset, using a KD-tree of the positions. Returns the index of the match for each reference
+    position, or -1 if nothing lies within radius.
+    """
+
+    if len(x) == 0:
+        return np.full(len(reference), -1)
+
+    tree = cKDTree(np.column_stack([x, y]))
+    dist, index = tree.query(reference + np.asarray(offset), distance_upper_bound=radius)
+    return np.where(np.isfinite(dist), index, -1)
+
+
+def match_epochs(catalogues, reference=0, match_radius=2.0, search_radius=20.0, no_bright=50):
+    """
+    Tracks the stars of the reference catalogue through the catalogues of all the other dates. The offset of
+    each frame from the reference frame is first found as the median offset of the brightest stars (matched
+    within search_radius), then every star is matched within match_radius of its shifted reference position.
+    Stars which were not detected on a date are placed at their shifted reference position, so they can still
+    be measured. Returns two (no. of stars, no. of dates) arrays with the x and y positions of the tracks.
+    """
+
+    ref = catalogues[reference]
+    positions = np.column_stack([ref.x, ref.y])
+    x_tracks = np.empty((len(positions), len(catalogues)))
+    y_tracks = np.empty((len(positions), len(catalogues)))
+
+    for i, sources in enumerate(catalogues):
+        # Coarse offset of the frame from the brightest stars:
+        bright = match_positions(positions[:no_bright], sources.x, sources.y, search_radius)
+        found = bright >= 0
+        if found.any():
+            offset = (np.median(sources.x[bright[found]] - positions[:no_bright][found, 0]),
+                      np.median(sources.y[bright[found]] - positions[:no_bright][found, 1]))
+        else:
+            offset = (0, 0)
+
+        # Match every star and fall back to the shifted reference position:
+        x_tracks[:, i] = positions[:, 0] + offset[0]
+        y_tracks[:, i] = positions[:, 1] + offset[1]
+        index = match_positions(positions, sources.x, sources.y, match_radius, offset)
+        found = index >= 0
+        x_tracks[found, i] = sources.x[index[found]]
+        y_tracks[found, i] = sources.y[index[found]]
+
+    return x_tracks, y_tracks
@@ -0,0 +1,165 @@
+## Index of precomputed statistics for the fits files, stored in a sidecar file next to each of them.
+##
+## Usage:
+##     python image_index.py [fits_dir]
+##
+## Indexes every fits file in the directory (the Cepheid fits directory by default). The viewer and the batch
+## tools then read the statistics from the sidecar files instead of scanning the full images again.
+
+import argparse
+import hashlib
+import os
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+from observations import FITS_DIR
+from photometry import sigma_clip
+
+## Extension added to the name of the fits file to get the name of its sidecar file:
+SIDECAR_EXTENSION = '.stats.npz'
+
+## Largest number of pixels used to estimate the sky:
+SKY_SAMPLE_SIZE = 10 ** 6
+
+## The preview pyramid is halved in size until it is no larger than this in both directions:
+PREVIEW_SIZE = 64
+
+ImageStats = namedtuple('ImageStats', ['max', 'percentiles', 'sky', 'noise', 'previews', 'header_digest'])
+
+
+def sidecar_filename(filename):
+    return filename + SIDECAR_EXTENSION
+
+
+def file_stamp(filename):
+    """
+    Returns the size and modification time of the file, which tell whether a sidecar file is out of date.
+    """
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime])
+
+
+def preview_pyramid(img):
+    """
+    Returns copies of the image downsampled by 2, 4, 8, ... (averaging blocks of pixels) until they are no
+    larger than PREVIEW_SIZE in both directions.
+    """
+
+    previews = []
+    level = img
+    while max(level.shape) > PREVIEW_SIZE and min(level.shape) >= 2:
+        ny, nx = level.shape[0] // 2, level.shape[1] // 2
+        level = level[:2 * ny, :2 * nx].reshape(ny, 2, nx, 2).mean(axis=(1, 3))
+        previews.append(level.astype(np.float32))
+    return previews
+
+
+def compute_stats(img, header):
+    """
+    Computes the statistics of an image: its maximum, the value of every whole percentile, the sigma-clipped
+    sky level and noise, the preview pyramid and a digest of the fits header.
+    """
+
+    img = np.asarray(img, dtype=float)
+    finite = img[np.isfinite(img)]
+
+    # Estimate the sky from an evenly spaced sample of the pixels:
+    sample = finite[::max(finite.size // SKY_SAMPLE_SIZE, 1)]
+    clipped = sigma_clip(sample[None, :])[0]
+    clipped = clipped[~np.isnan(clipped)]
+
+    return ImageStats(
+        max=float(np.max(finite)),
+        percentiles=np.percentile(finite, np.arange(101)),
+        sky=float(np.median(clipped)),
+        noise=float(np.std(clipped)),
+        previews=preview_pyramid(img),
+        header_digest=hashlib.sha256(header.tostring().encode()).hexdigest(),
+    )
+
+
+def write_stats(filename, stats):
+    """
+    Saves the statistics of the fits file in its sidecar file, together with the size and modification time of
+    the fits file. The sidecar file is written to a temporary file first and then moved into place, so it is
+    never read half written.
+    """
+
+    previews = {f"preview_{i}": preview for i, preview in enumerate(stats.previews)}
+    sidecar = sidecar_filename(filename)
+    temporary = f"{sidecar}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        np.savez(f, stamp=file_stamp(filename), max=stats.max, percentiles=stats.percentiles, sky=stats.sky,
+                 noise=stats.noise, header_digest=stats.header_digest, **previews)
+    os.replace(temporary, sidecar)
+
+
+def read_stats(filename):
+    """
+    Reads the statistics of the fits file from its sidecar file. Returns None if there is no sidecar file, if it
+    is corrupt, or if the fits file has changed since it was written.
+    """
+
+    try:
+        with np.load(sidecar_filename(filename)) as data:
+            if not np.array_equal(data['stamp'], file_stamp(filename)):
+                return None
+            previews = [data[f"preview_{i}"] for i in range(sum(key.startswith('preview_') for key in data.files))]
+            return ImageStats(float(data['max']), data['percentiles'], float(data['sky']), float(data['noise']),
+                              previews, str(data['header_digest']))
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+def index_file(filename):
+    """
+    Computes the statistics of the fits file and writes its sidecar file. Returns the statistics.
+    """
+
+    with fits.open(filename, memmap=True) as HDUlist:
+        stats = compute_stats(HDUlist[0].data, HDUlist[0].header)
+    write_stats(filename, stats)
+    return stats
+
+
+def load_stats(filename):
+    """
+    Returns the statistics of the fits file, from its sidecar file if it is up to date, otherwise by indexing the
+    file again.
+    """
+
+    stats = read_stats(filename)
+    return stats if stats is not None else index_file(filename)
+
+
+def index_directory(fits_dir=FITS_DIR, workers=None):
+    """
+    Indexes every fits file in the directory whose sidecar file is missing or out of date, sharing the files out
+    between a pool of processes. Returns the number of files indexed.
+    """
+
+    filenames = [os.path.join(fits_dir, name) for name in sorted(os.listdir(fits_dir)) if name.endswith('.fits')]
+    stale = [filename for filename in filenames if read_stats(filename) is None]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(index_file, stale):
+            pass
+
+    return len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the statistics of the fits files.')
+    parser.add_argument('fits_dir', nargs='?', default=FITS_DIR, help='directory holding the fits files')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    print(f"Indexed {index_directory(args.fits_dir, args.workers)} fits files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+## Cached access to the Cepheid FITS frames:
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+
+class ImageStore:
+    """
+    Keeps recently used FITS images in memory so that switching between frames does not go back to the disk.
+    Files are opened memory-mapped and closed straight after their data has been decoded into a native-endian
+    float array. The decoded arrays are kept in a least-recently-used cache whose total size is bounded by
+    max_bytes. Frames which are likely to be needed next can be read in the background with prefetch().
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, workers=2):
+        self.max_bytes = max_bytes  # upper bound on the memory used by the cached arrays
+        self.nbytes = 0  # memory currently used by the cached arrays
+
+        self._images = OrderedDict()  # filename -> array, least recently used first
+        self._pending = {}  # filename -> future, for files being read in the background
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __contains__(self, filename):
+        with self._lock:
+            return filename in self._images
+
+    def __len__(self):
+        with self._lock:
+            return len(self._images)
+
+    def get(self, filename):
+        """
+        Returns the image stored in the fits file. The image is read from the cache if it is there, otherwise it
+        is read from the disk (or from a background read of the same file, if one is already running).
+        """
+
+        with self._lock:
+            if filename in self._images:
+                self._images.move_to_end(filename)  # mark as most recently used
+                return self._images[filename]
+            future = self._pending.get(filename)
+
+        if future is not None:  # the file is already being read in the background
+            return future.result()
+
+        return self._load(filename)
+
+    def prefetch(self, filenames):
+        """
+        Starts reading the given fits files in the background. Files which are cached or already being read
+        are skipped.
+        """
+
+        with self._lock:
+            for filename in filenames:
+                if filename in self._images or filename in self._pending:
+                    continue
+                self._pending[filename] = self._executor.submit(self._load, filename)
+
+    def clear(self):
+        """
+        Empties the cache.
+        """
+
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+    def close(self):
+        """
+        Waits for the background reads to finish and empties the cache.
+        """
+
+        self._executor.shutdown(wait=True)
+        self.clear()
+
+    def _load(self, filename):
+        """
+        Reads the primary HDU of the fits file and stores it in the cache.
+        """
+
+        try:
+            # The context manager closes the file handle (and the memory map) once the data has been decoded:
+            with fits.open(filename, memmap=True) as HDUlist:
+                img = np.array(HDUlist[0].data, dtype=float)
+
+            with self._lock:
+                if filename not in self._images:
+                    self._images[filename] = img
+                    self.nbytes += img.nbytes
+                    self._evict()
+                return self._images.get(filename, img)
+
+        finally:
+            with self._lock:
+                self._pending.pop(filename, None)
+
+    def _evict(self):
+        """
+        Drops the least recently used images until the cache fits in max_bytes. The most recent image is always
+        kept, even if it is larger than max_bytes on its own. Must be called with the lock held.
+        """
+
+        while self.nbytes > self.max_bytes and len(self._images) > 1:
+            _, img = self._images.popitem(last=False)
+            self.nbytes -= img.nbytes
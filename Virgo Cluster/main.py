@@ -8,14 +8,18 @@ from matplotlib.widgets import Button
 
 import numpy as np
 import os
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
 
-from astropy.io import fits
-from io import StringIO
+from image_index import load_stats
+from image_store import ImageStore
+from observations import df, fits_filename
+from photometry import aperture_photometry, check_parameters
+from registration import carry_position, field_shifts
 
-import ipywidgets as widgets
-from ipywidgets import Layout
-from IPython.display import display, HTML, Javascript
+## The notebook modules (ipywidgets and IPython) are only imported by the functions which build or display the
+## widgets, so that importing this module has no side effects and does not need Jupyter.
 
 ## Create a button to show or hide all the code cells within the notebook:
 
@@ -28,6 +32,7 @@ def toggle_code(state):
     Toggles the JavaScript show()/hide() function
     on the div.input element.
     """
+    from IPython.display import display, HTML
 
     output_string = "<script>$(\"div.input\").{}</script>"
     output_args = (javascript_functions[state],)
@@ -47,219 +52,151 @@ def button_action(value):
 
     value.owner.description = button_descriptions[state]
 
-    # Save widget state:
-    display(
-        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
+    save_widget_state()
 
 
-state = False
-toggle_code(state)
-
-## Define and activate button:
-toggle_button = widgets.ToggleButton(state, description=button_descriptions[state])
-toggle_button.observe(button_action, "value")
-
-## Define variables to change widget visibility:
-layout_hidden = widgets.Layout(visibility='hidden')
-layout_visible = widgets.Layout(visibility='visible')
-
-## Define output widgets (they allow greater control over the display):
-out0 = widgets.Output(layout={'border': '1px solid black'})
-out = widgets.Output(layout={'border': '1px solid black'})
-
-## Define widgets to allow the user to change the aperture parameters:
-
-# Radius of the aperture:
-ApertureRadius = widgets.BoundedIntText(
-    value=3,
-    min=0,
-    max=10,
-    step=1,
-    description='Radius of the aperture (in pixels):',
-    style={'description_width': '195px'},
-    layout={'width': '300px'},
-    disabled=False,
-    continuous_update=True
-)
-
-# Inner annulus multiplier:
-InnerAnnulus = widgets.BoundedFloatText(
-    value=2,
-    min=0,
-    max=5,
-    step=0.5,
-    description='Inner annulus multiplier (in radii):',
-    style={'description_width': '195px'},
-    layout={'width': '300px'},
-    disabled=False,
-    continuous_update=True
-)
-
-# Outer annulus multiplier:
-OuterAnnulus = widgets.BoundedFloatText(
-    value=3,
-    min=0,
-    max=5,
-    step=0.5,
-    description='Outer annulus multiplier (in radii):',
-    style={'description_width': '195px'},
-    layout={'width': '300px'},
-    disabled=False,
-    continuous_update=True
-)
-
-## Define widgets to allow the user to change the image viewing options:
-
-# Lower percentile (of the image maximum):
-LowLim = widgets.IntSlider(
-    value=0,
-    min=0,
-    max=100,
-    step=1,
-    description='Lower percentile:',
-    style={'description_width': '100px'},
-    layout={'width': '350px'},
-    disabled=False,
-    continuous_update=True,
-    orientation='horizontal',
-    readout=True,
-    readout_format='d'
-)
-
-# Upper percentile (of the image maximum):
-HiLim = widgets.IntSlider(
-    value=40,
-    min=0,
-    max=100,
-    step=1,
-    description='Upper percentile:',
-    style={'description_width': '100px'},
-    layout={'width': '350px'},
-    disabled=False,
-    continuous_update=True,
-    orientation='horizontal',
-    readout=True,
-    readout_format='d'
-)
-
-# Colour map:
-Cmap = widgets.Dropdown(
-    options=[('Blue-green', 'viridis'), ('Gray', 'gray'), ('Orange', 'afmhot')],  # shows the first one, but
-    # takes the value of the second
-    value='gray',
-    description='Colour map:'
-)
-
-## Define global variables for these parameters (they will change throughout the program):
-
-R = 3  # aperture radius
-inner_annulus = 2  # inner annulus multiplier
-outer_annulus = 3  # outer annulus multiplier
-
-low_lim = 0  # lower percentile
-hi_lim = 40  # upper percentile
-cmap_value = 'gray'  # colour map
-
-
-## Check if these values are correct:
-
-def check_values():
+def save_widget_state():
     """
-    Verifies whether the set of aperture parameters and image viewing values are correct. Prevents the cases
-    in which errors would be raised when plotting or doing aperture photometry.
-
+    Saves the state of the widgets in the notebook.
     """
+    from IPython.display import display, HTML
 
-    if R == 0:  # aperture radius cannot be zero
-        with out:
-            print("Please select a value for the aperture radius.\n")
-        return 0
-
-    elif inner_annulus <= 1:  # inner annulus radius must be larger than aperture radius
-        with out:
-            print("Please make sure that the inner annulus multiplier is larger than one.\n")
-        return 0
-
-    elif outer_annulus <= 1:  # outer annulus radius must be larger than aperture radius
-        with out:
-            print("Please make sure that the outer annulus multiplier is larger than one.\n")
-        return 0
-
-    elif inner_annulus >= outer_annulus:  # outer annulus must be larger than inner annulus
-        with out:
-            print("Please make sure that the outer annulus multiplier is bigger than the inner annulus multiplier.\n")
-        return 0
-
-    elif low_lim >= hi_lim:  # the upper percentile must be larger than the lower percentile
-        with out:
-            print("Please make sure that the lower percentile is smaller than the upper percentile.\n")
-        return 0
-
-    else:
-        return 1
-
-
-## Store all 72 Cepheid images in a table:
-
-# Save them as a 2D string:
-testdata = StringIO("""Apr 23,May 04,May 06,May 09,May 12,May 16,May 20,May 26,May 31,Jun 07,Jun 17,Jun 19
-Cepheid 4,c4apr23.fits,c4may04.fits,c4may06.fits,c4may09.fits,c4may12.fits,c4may16.fits,c4may20.fits,c4may26.fits,c4may31.fits,c4jun07.fits,c4jun17.fits,c4jun19.fits
-Cepheid 5,c5apr23.fits,c5may04.fits,c5may06.fits,c5may09.fits,c5may12.fits,c5may16.fits,c5may20.fits,c5may26.fits,c5may31.fits,c5jun07.fits,c5jun17.fits,c5jun19.fits
-Cepheid 10,c10apr23.fits,c10may04.fits,c10may06.fits,c10may09.fits,c10may12.fits,c10may16.fits,c10may20.fits,c10may26.fits,c10may31.fits,c10jun07.fits,c10jun17.fits,c10jun19.fits
-Cepheid 18,c18apr23.fits,c18may04.fits,c18may06.fits,c18may09.fits,c18may12.fits,c18may16.fits,c18may20.fits,c18may26.fits,c18may31.fits,c18jun07.fits,c18jun17.fits,c18jun19.fits
-Cepheid 32,c32apr23.fits,c32may04.fits,c32may06.fits,c32may09.fits,c32may12.fits,c32may16.fits,c32may20.fits,c32may26.fits,c32may31.fits,c32jun07.fits,c32jun17.fits,c32jun19.fits
-Cepheid 56,c56apr23.fits,c56may04.fits,c56may06.fits,c56may09.fits,c56may12.fits,c56may16.fits,c56may20.fits,c56may26.fits,c56may31.fits,c56jun07.fits,c56jun17.fits,c56jun19.fits
-""")
-
-# Convert the string to a table (rows = cepheids, columns = dates):
-df = pd.read_csv(testdata, sep=",")
-
-## Define dropdown lists for image selection:
-
-# List of the Cepheids:
-dropdown = widgets.Dropdown(
-    options=['Cepheid 4', 'Cepheid 5', 'Cepheid 10', 'Cepheid 18', 'Cepheid 32', 'Cepheid 56'],
-    value='Cepheid 4',
-    description='Cepheid:',
-)
-
-# List of the dates:
-dropdown2 = widgets.Dropdown(
-    options=['Apr 23', 'May 04', 'May 06', 'May 09', 'May 12', 'May 16', 'May 20', 'May 26', 'May 31',
-             'Jun 07', 'Jun 17', 'Jun 19'],
-    value='Apr 23',
-    description='Date:',
-)
+    display(
+        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
 
 
-## Function to get the image frm the dropdown lists:
+## Define the widgets (this is only done when the viewer is created, not on import):
 
-def Dropdown_Menu(value1, value2):
+def create_widgets(state=False):
     """
-    Finds the selected image in the table created above by going to the row and column corresponding to the
-    selected Cepheid and date from the dropdowns. Reads the fits file and stores it in a variable.
+    Creates the widgets of the viewer: the button showing or hiding the code, the output areas, the aperture and
+    image viewing parameters, the dropdown lists for image selection and the buttons. Returns them as the
+    attributes of a namespace.
     """
-
-    # Get the image from the table:
-    fits_image_filename = './fits_for_astropy/' + str(df.loc[value1, value2])
-
-    # Read the fits file:
-    HDUlist = fits.open(fits_image_filename)
-    large = HDUlist[0].data
-
-    # Store the file in an array:
-    global img
-    img = large
-
-    # Get the size of the array:
-    global x_size
-    x_size = img.shape[0]
-    global y_size
-    y_size = img.shape[1]
-
-    # Save widget state:
-    display(
-        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
+    import ipywidgets as widgets
+
+    w = SimpleNamespace()
+
+    ## Define the button (it is activated in main()):
+    w.toggle_button = widgets.ToggleButton(state, description=button_descriptions[state])
+
+    ## Define variables to change widget visibility:
+    w.layout_hidden = widgets.Layout(visibility='hidden')
+    w.layout_visible = widgets.Layout(visibility='visible')
+
+    ## Define output widgets (they allow greater control over the display):
+    w.out0 = widgets.Output(layout={'border': '1px solid black'})
+    w.out = widgets.Output(layout={'border': '1px solid black'})
+
+    ## Define widgets to allow the user to change the aperture parameters:
+
+    # Radius of the aperture:
+    w.ApertureRadius = widgets.BoundedIntText(
+        value=3,
+        min=0,
+        max=10,
+        step=1,
+        description='Radius of the aperture (in pixels):',
+        style={'description_width': '195px'},
+        layout={'width': '300px'},
+        disabled=False,
+        continuous_update=True
+    )
+
+    # Inner annulus multiplier:
+    w.InnerAnnulus = widgets.BoundedFloatText(
+        value=2,
+        min=0,
+        max=5,
+        step=0.5,
+        description='Inner annulus multiplier (in radii):',
+        style={'description_width': '195px'},
+        layout={'width': '300px'},
+        disabled=False,
+        continuous_update=True
+    )
+
+    # Outer annulus multiplier:
+    w.OuterAnnulus = widgets.BoundedFloatText(
+        value=3,
+        min=0,
+        max=5,
+        step=0.5,
+        description='Outer annulus multiplier (in radii):',
+        style={'description_width': '195px'},
+        layout={'width': '300px'},
+        disabled=False,
+        continuous_update=True
+    )
+
+    ## Define widgets to allow the user to change the image viewing options:
+
+    # Lower percentile (of the image maximum):
+    w.LowLim = widgets.IntSlider(
+        value=0,
+        min=0,
+        max=100,
+        step=1,
+        description='Lower percentile:',
+        style={'description_width': '100px'},
+        layout={'width': '350px'},
+        disabled=False,
+        continuous_update=True,
+        orientation='horizontal',
+        readout=True,
+        readout_format='d'
+    )
+
+    # Upper percentile (of the image maximum):
+    w.HiLim = widgets.IntSlider(
+        value=40,
+        min=0,
+        max=100,
+        step=1,
+        description='Upper percentile:',
+        style={'description_width': '100px'},
+        layout={'width': '350px'},
+        disabled=False,
+        continuous_update=True,
+        orientation='horizontal',
+        readout=True,
+        readout_format='d'
+    )
+
+    # Colour map:
+    w.Cmap = widgets.Dropdown(
+        options=[('Blue-green', 'viridis'), ('Gray', 'gray'), ('Orange', 'afmhot')],  # shows the first one, but
+        # takes the value of the second
+        value='gray',
+        description='Colour map:'
+    )
+
+    ## Define dropdown lists for image selection:
+
+    # List of the Cepheids:
+    w.dropdown = widgets.Dropdown(
+        options=['Cepheid 4', 'Cepheid 5', 'Cepheid 10', 'Cepheid 18', 'Cepheid 32', 'Cepheid 56'],
+        value='Cepheid 4',
+        description='Cepheid:',
+    )
+
+    # List of the dates:
+    w.dropdown2 = widgets.Dropdown(
+        options=['Apr 23', 'May 04', 'May 06', 'May 09', 'May 12', 'May 16', 'May 20', 'May 26', 'May 31',
+                 'Jun 07', 'Jun 17', 'Jun 19'],
+        value='Apr 23',
+        description='Date:',
+    )
+
+    ## Define a button which displays the image selected from the dropdown lists:
+    w.button1 = widgets.Button(description="Display image")
+    w.button1.style.button_color = 'lightblue'
+
+    ## Define a button which updates the image corresponding to the newly set widgets:
+    w.button2 = widgets.Button(description="Update values")
+    w.button2.style.button_color = 'wheat'
+
+    return w
 
 
 ## Function which will make interactive matplotlib qt windows pop up in front of the notebook, instead of
@@ -278,342 +215,510 @@ def show_plot(figure_id=None):
     fig.canvas.manager.window.raise_()
 
 
-## Function to draw a circle (useful for aperture and annuli);
+## Function to find the limits of the colour scale (computed once for each version of an image and pair of
+## percentiles, the cache being keyed on the modification time so a changed file is read again):
 
-def circle(R, x, y, color_string):
+def display_limits(filename, low_lim, hi_lim):
     '''
-    This function creates a circle of radius R centred at the point (x,y). The color of the circle must
-    also be specified.
+    Returns the values of the image in the fits file corresponding to the lower and upper percentiles (of the
+    image maximum). The maximum is read from the image index, without scanning the image.
     '''
-    theta = np.linspace(0, 2 * np.pi, 100)
-
-    a = x + R * np.cos(theta)
-    b = y + R * np.sin(theta)
-
-    plt.plot(a, b, color=color_string)
-
-
-## Define the x and y-positions of the mouse click. Start off with them outside the image so that no apertures
-## are plotted at the beginning. Will repeatedly be reset to -1 when the apertures already drawn need to disappear.
-x_center = -1
-y_center = -1
-
-
-## Function which calculates the signal and mean sky background within an aperture and concentric annuli centred
-## on the position of the mouse click.
-
-def Run():
-    """
-    Calculates the signal within an aperture and the mean sky background in a ring of concentric annuli centred
-    on the position of the mouse click. Uses global variables which determine the radius of the aperture and
-    annuli.
-    """
-    global signal, sky_bckg
-
-    if check_values() == 1:  # only proceed if the parameters are correct
-
-        w = np.where(img != None)  # all indices in the img array
-
-        # Calculate the distance (in pixels) from all pixels to the star's centre:
-        dist = np.sqrt((w[0] - y_center) ** 2 + (w[1] - x_center) ** 2)  # popt[0]=cenx and popt[1]=ceny;
-        # w[0] gives y coords., w[1] gives x coords.
-        dist = dist.reshape(x_size, y_size)  # reshape to the shape of the image
-
-        # Find all pixels within the aperture radius:
-        ww = np.where(dist < R)
+    return _display_limits(filename, os.stat(filename).st_mtime, low_lim, hi_lim)
 
-        # Calculate the no. of pixels within the circular aperture:
-        no_pixels = np.array(ww).shape[1]
 
-        # Calculate the total signal within the aperture:
-        total_signal = np.sum(img[ww])
+@lru_cache(maxsize=256)
+def _display_limits(filename, mtime, low_lim, hi_lim):
+    peak = load_stats(filename).max
+    return low_lim / 100 * peak, hi_lim / 100 * peak
 
-        # Find all pixels within the background ring:
-        m = np.where((dist > inner_annulus * R) & (dist < outer_annulus * R))
 
-        # Calculate the total sky background:
-        total_sky_bckg = np.sum(img[m])
+## Points on a circle of unit radius, which are scaled and moved to draw the aperture and annuli:
+theta = np.linspace(0, 2 * np.pi, 100)
+unit_circle = (np.cos(theta), np.sin(theta))
 
-        # Divide by no. of pixels within ring to get the mean background per pixel:
-        sky_bckg = total_sky_bckg / np.array(m).shape[1]
-        plt.text(0.9, 1.1, "Sky: %.4f" % (sky_bckg,), transform=ax.transAxes, \
-                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-        # display this value on the canvas
 
-        # Find the total signal from the star (after background subtraction from each pixel):
-        signal = np.sum(img[ww] - sky_bckg)
-        plt.text(0.9, 1.03, "Star: %.4f" % (signal,), transform=ax.transAxes, \
-                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-        # display this value on the canvas
-
-        # Show the x and y- positions of the click on the canvas:
-        plt.text(0.95, -0.02, "x = %.1f" % (x_center,), transform=ax.transAxes, \
-                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-
-        plt.text(0.95, -0.09, "y = %.1f" % (y_center,), transform=ax.transAxes, \
-                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-
-        plt.draw()
-
-
-
-    else:  # if the parameters are incorrect, prevent from calculating
-        with out:
-            print("Try again.\n")
+## Function to draw a circle (useful for aperture and annuli);
 
+def circle(line, R, x, y):
+    '''
+    This function moves an existing line so that it draws a circle of radius R centred at the point (x,y).
+    '''
+    line.set_data(x + R * unit_circle[0], y + R * unit_circle[1])
 
-## Function which draws the aperture and measures the photometric signal:
 
-def aperture_photom(R, inner_annulus, outer_annulus):
+class Viewer:
     """
-    Draws the aperture and the background ring centred on the position of the mouse click.
-    Calls Run() to measure the photometric signal and mean sky per pixel within these.
+    State of the notebook viewer: its widgets, the image store, the figure and the current aperture parameters,
+    which the callbacks of the widgets and of the figure read and update.
     """
-    ## Display the circular aperture around the star and the ring that contains the sky background:
-    C1 = circle(R, x_center, y_center, 'red')
-    C2 = circle(inner_annulus * R, x_center, y_center, 'orange')
-    C3 = circle(outer_annulus * R, x_center, y_center, 'orange')
-
-    ## Measure the signal and the sky background:
-    Run()
 
+    def __init__(self):
+        self.w = create_widgets()
+
+        ## Keep the images that have already been read in memory, so that flicking between them is instant:
+        self.store = ImageStore()
+
+        ## The frames of each Cepheid are registered once, in the background, as soon as it is selected (like the
+        ## images of the neighbouring dates), so that carrying an aperture over never blocks the widgets.
+        ## Cepheid -> future of its frame shifts:
+        self.shifts = {}
+        self._registration = ThreadPoolExecutor(max_workers=1)
+
+        ## The current image, its fits file and its size:
+        self.img = None
+        self.img_filename = None
+        self.x_size = self.y_size = 0
+
+        ## The aperture and image viewing parameters (they change throughout the program):
+        self.R = 3  # aperture radius
+        self.inner_annulus = 2  # inner annulus multiplier
+        self.outer_annulus = 3  # outer annulus multiplier
+
+        self.low_lim = 0  # lower percentile
+        self.hi_lim = 40  # upper percentile
+        self.cmap_value = 'gray'  # colour map
+
+        ## The image, the circles and the text boxes are created once for each window and then only updated. The
+        ## circles and text boxes are 'animated', so they are left out of the normal drawing of the figure and
+        ## drawn on top of a saved copy of it instead (blitting). A click then only redraws the apertures, not
+        ## the whole image.
+        self.fig = self.ax = None
+        self.image_artist = None
+        self.circle_artists = []
+        self.text_artists = {}
+        self.background = None
+
+        ## The x and y-positions of the mouse click. Start off with them outside the image so that no apertures
+        ## are plotted at the beginning. Will repeatedly be reset to -1 when the apertures already drawn need to
+        ## disappear.
+        self.x_center = -1
+        self.y_center = -1
+
+        ## Remember where the last aperture was placed (Cepheid, date, x, y), so that it can be carried over to
+        ## the frames of the other dates of the same Cepheid. Unlike x_center and y_center, this is kept when the
+        ## image is closed.
+        self.last_aperture = None
+
+        ## Number of times the 'Display image' button has been clicked. Depending on it, the button does
+        ## different things:
+        self.click_count = 0
+
+    ## Check if the parameters are correct:
+
+    def check_values(self):
+        """
+        Verifies whether the set of aperture parameters and image viewing values are correct. Prevents the cases
+        in which errors would be raised when plotting or doing aperture photometry.
+
+        """
+
+        message = check_parameters(self.R, self.inner_annulus, self.outer_annulus)  # aperture and annuli
+
+        if message is not None:
+            with self.w.out:
+                print(message + "\n")
+            return 0
+
+        elif self.low_lim >= self.hi_lim:  # the upper percentile must be larger than the lower percentile
+            with self.w.out:
+                print("Please make sure that the lower percentile is smaller than the upper percentile.\n")
+            return 0
+
+        else:
+            return 1
+
+    ## Function to get the image frm the dropdown lists:
+
+    def Dropdown_Menu(self, value1, value2):
+        """
+        Finds the selected image in the table created above by going to the row and column corresponding to the
+        selected Cepheid and date from the dropdowns. Reads the fits file (or takes it from the image store) and
+        stores it. The images from the neighbouring dates are then read in the background.
+        """
+
+        # Get the image from the table and read the fits file:
+        self.img_filename = fits_filename(value1, value2)
+        self.img = self.store.get(self.img_filename)
+
+        # Read the previous and next dates in the background:
+        i = list(df.columns).index(value2)
+        adjacent = [date for date in df.columns[max(i - 1, 0):i + 2] if date != value2]
+        self.store.prefetch([fits_filename(value1, date) for date in adjacent])
+
+        # Register the frames of the Cepheid in the background:
+        self.prefetch_shifts(value1)
+
+        # Get the size of the array:
+        self.x_size = self.img.shape[0]
+        self.y_size = self.img.shape[1]
+
+        save_widget_state()
+
+    def prefetch_shifts(self, cepheid):
+        """
+        Starts registering the frames of the Cepheid in the background, unless it has been done already.
+        """
+        if cepheid not in self.shifts:
+            self.shifts[cepheid] = self._registration.submit(field_shifts, [cepheid])
+
+    def setup_canvas(self):
+        '''
+        Shows the current image on the new figure and creates the circles and text boxes for the apertures.
+        '''
+        ax = self.ax
+
+        self.background = None
+        vmin, vmax = display_limits(self.img_filename, self.low_lim, self.hi_lim)
+        self.image_artist = ax.imshow(self.img, origin='lower', cmap=self.cmap_value, vmin=vmin, vmax=vmax)
+        ax.set_title(self.w.dropdown.value + '\n' + self.w.dropdown2.value + ', 1994')  # set the right title
+
+        # Circles for the aperture (red) and the background ring (orange):
+        self.circle_artists = [ax.plot([], [], color=color, animated=True, visible=False)[0]
+                               for color in ('red', 'orange', 'orange')]
+
+        # Text boxes for the measurements and the position of the click:
+        style = dict(transform=ax.transAxes, verticalalignment='top', animated=True, visible=False,
+                     bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+        self.text_artists = {
+            'sky': ax.text(0.9, 1.1, '', **style),
+            'star': ax.text(0.9, 1.03, '', **style),
+            'x': ax.text(0.95, -0.02, '', **style),
+            'y': ax.text(0.95, -0.09, '', **style),
+        }
+
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def update_image(self):
+        '''
+        Updates the colour map, the display limits and the title of the image already shown, and redraws the
+        figure.
+        '''
+        vmin, vmax = display_limits(self.img_filename, self.low_lim, self.hi_lim)
+        self.image_artist.set_data(self.img)
+        self.image_artist.set_cmap(self.cmap_value)
+        self.image_artist.set_clim(vmin, vmax)
+        self.ax.set_title(self.w.dropdown.value + '\n' + self.w.dropdown2.value + ', 1994')
+        self.fig.canvas.draw()  # on_draw saves the new figure for blitting
+
+    def aperture_artists(self):
+        '''
+        Returns the artists which are redrawn by blitting.
+        '''
+        return self.circle_artists + list(self.text_artists.values())
+
+    def on_draw(self, event):
+        '''
+        Called after every full redraw of the figure (first display, zoom/pan, resize). Saves a copy of the figure
+        without the apertures for blitting, and draws the apertures on top.
+        '''
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.aperture_artists():
+            self.fig.draw_artist(artist)
+
+    def redraw_apertures(self):
+        '''
+        Redraws only the apertures and text boxes on top of the saved copy of the figure.
+        '''
+        canvas = self.fig.canvas
+        if self.background is None:  # the figure has not been drawn yet; on_draw will draw the apertures
+            canvas.draw_idle()
+            return
+
+        canvas.restore_region(self.background)
+        for artist in self.aperture_artists():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def hide_apertures(self):
+        '''
+        Hides the apertures and text boxes.
+        '''
+        for artist in self.aperture_artists():
+            artist.set_visible(False)
+        self.redraw_apertures()
+
+    ## Function which calculates the signal and mean sky background within an aperture and concentric annuli
+    ## centred on the position of the mouse click.
+
+    def Run(self):
+        """
+        Calculates the signal within an aperture and the mean sky background in a ring of concentric annuli
+        centred on the position of the mouse click, with the current radius of the aperture and annuli. Returns
+        the measurement, or None if the parameters are incorrect.
+        """
+
+        if self.check_values() == 1:  # only proceed if the parameters are correct
+
+            # Measure the signal and the mean sky per pixel using only a small box around the star:
+            measurement = aperture_photometry(self.img, self.x_center, self.y_center, self.R, self.inner_annulus,
+                                              self.outer_annulus)
+
+            # Display these values on the canvas:
+            self.text_artists['sky'].set_text("Sky: %.4f" % (measurement.sky_bckg,))
+            self.text_artists['star'].set_text("Star: %.4f" % (measurement.signal,))
+
+            # Show the x and y- positions of the click on the canvas:
+            self.text_artists['x'].set_text("x = %.1f" % (self.x_center,))
+            self.text_artists['y'].set_text("y = %.1f" % (self.y_center,))
+
+            for artist in self.text_artists.values():
+                artist.set_visible(True)
+
+            return measurement
+
+        else:  # if the parameters are incorrect, prevent from calculating
+            with self.w.out:
+                print("Try again.\n")
+            return None
+
+    ## Function which draws the aperture and measures the photometric signal:
+
+    def aperture_photom(self):
+        """
+        Draws the aperture and the background ring centred on the position of the mouse click.
+        Calls Run() to measure the photometric signal and mean sky per pixel within these.
+        """
+        R = self.R
+
+        ## Move the circular aperture around the star and the ring that contains the sky background:
+        for line, radius in zip(self.circle_artists, (R, self.inner_annulus * R, self.outer_annulus * R)):
+            circle(line, radius, self.x_center, self.y_center)
+            line.set_visible(True)
+
+        ## Measure the signal and the sky background:
+        self.Run()
+
+        ## Redraw only the apertures and the text boxes:
+        self.redraw_apertures()
+
+    ## The next is the main function of the program. It is called whenever there is a mouse click anywhere on
+    ## the canvas. It deals with all sorts of clicks and situations (i.e. left-click, right-click, zoom/pan etc.).
+
+    def on_press(self, event):
+        """
+        Main function of the program. If the user left-clicks on the image, aperture photometry is done at the
+        location of the click. A right click within the image does nothing, but keeps the apertures already
+        drawn in place. A click outside of the image resets everything.
+        """
+
+        if self.check_values() == 1:  # only proceed if the parameters are correct
+
+            # The image itself is not redrawn; only the apertures are, on top of the saved copy of the figure.
+            if self.fig.canvas.cursor().shape() == 0:  # simple click (not zoom/pan) --> 0 is the arrow click
+
+                if ((event.xdata != None and event.ydata != None) and (event.xdata >= 0 and event.ydata >= 0) \
+                        and (event.xdata <= self.x_size and event.ydata <= self.y_size)):
+                    # if you click inside the image
+
+                    if event.button == 1:  # left click
+
+                        ## Centre the aperture and annuli on the position of the click:
+                        self.x_center = event.xdata
+                        self.y_center = event.ydata
+                        self.last_aperture = (self.w.dropdown.value, self.w.dropdown2.value, self.x_center,
+                                              self.y_center)
 
-## The next is the main function of the program. It is called whenever there is a mouse click anywhere on the
-## canvas. It deals with all sorts of clicks and situations (i.e. left-click, right-click, zoom/pan etc.).
+                        ## Do photometry:
+                        self.aperture_photom()
 
-def on_press(event):
-    """
-    Main function of the program. If the user left-clicks on the image, aperture photometry is done at the
-    location of the click. A right click within the image does nothing, but keeps the apertures already drawn in
-    place. A click outside of the image resets everything.
-    """
-
-    if check_values() == 1:  # only proceed if the parameters are correct
 
-        plt.clf()  # clear what was previously drawn
-        plt.title(dropdown.value + '\n' + dropdown2.value + ', 1994')  # add the right title to the image
+                    elif event.button == 3:  # right click
 
-        # Display the image with the updated viewing options:
-        plt.imshow(img, origin='lower', cmap=cmap_value, vmin=low_lim / 100 * np.max(img), \
-                   vmax=hi_lim / 100 * np.max(img), animated=True)
-        plt.draw()
+                        ## Do photometry only if there is an aperture already drawn:
+                        if self.x_center >= 0 and self.y_center >= 0:
+                            self.aperture_photom()
 
-        if fig.canvas.cursor().shape() == 0:  # simple click (not zoom/pan) --> 0 is the arrow click
 
-            if ((event.xdata != None and event.ydata != None) and (event.xdata >= 0 and event.ydata >= 0) \
-                    and (event.xdata <= x_size and event.ydata <= y_size)):
-                # if you click inside the image
+                else:  # if you click outside the img  or button
 
-                if event.button == 1:  # left click
+                    self.x_center = -1  # reset the centre of the aperture
+                    self.y_center = -1
+                    self.last_aperture = None
+                    self.hide_apertures()
 
-                    ## Centre the aperture and annuli on the position of the click:
-                    global x_center, y_center
-                    x_center = event.xdata
-                    y_center = event.ydata
 
-                    ## Do photometry:
-                    aperture_photom(R, inner_annulus, outer_annulus)
 
+            else:  # i.e. fig.canvas.cursor().shape() != 0 (if you zoom/pan)
 
-                elif event.button == 3:  # right click
+                ## Do photometry only if there is an aperture already drawn:
+                if self.x_center >= 0 and self.y_center >= 0:
+                    self.aperture_photom()
 
-                    ## Do photometry only if there is an aperture already drawn:
-                    if x_center >= 0 and y_center >= 0:
-                        aperture_photom(R, inner_annulus, outer_annulus)
+        else:  # prevent the program if the initial parameters are incorrect
+            with self.w.out:
+                print("Try again.\n")
 
+    ## Function to update the values of the aperture and image viewing parameters:
 
-            else:  # if you click outside the img  or button
+    def update_values(self):
+        """
+        Reads the values of the widgets and stores them for later use.
+        """
+        self.R = self.w.ApertureRadius.value
+        self.inner_annulus = self.w.InnerAnnulus.value
+        self.outer_annulus = self.w.OuterAnnulus.value
+        self.low_lim = self.w.LowLim.value
+        self.hi_lim = self.w.HiLim.value
+        self.cmap_value = self.w.Cmap.value
+        save_widget_state()
 
-                x_center = -1  # reset the centre of the aperture
-                y_center = -1
+    ## Function which sets the functionality of the 'Update values' button.
+    def on_update_values_button_clicked(self, b):
+        """
+        Calls update_values() to read the values of the aperture and image viewing widgets.
+        Updates the image depending on these new values.
+        """
+        self.w.out.clear_output()
+        self.update_values()
 
+        if self.check_values() == 1:  # only proceed if the values are correct
 
+            ## Update the image already shown with the new parameters:
+            self.update_image()
+            show_plot()  # make the interactive window pop up
 
-        else:  # i.e. fig.canvas.cursor().shape() != 0 (if you zoom/pan)
+            ## If an aperture was previously drawn somewhere on the image, redraw it and do photometry there.
+            if self.x_center >= 0 and self.y_center >= 0:
+                self.aperture_photom()
 
-            ## Do photometry only if there is an aperture already drawn:
-            if x_center >= 0 and y_center >= 0:
-                aperture_photom(R, inner_annulus, outer_annulus)
+        else:  # prevent plotting the image if the values are incorrect
+            with self.w.out:
+                print("Try again.\n")
 
-    else:  # prevent the program if the initial parameters are incorrect
-        with out:
-            print("Try again.\n")
+        save_widget_state()
 
+    ## Function to hide the existing widgets whenever the image tab is closed:
 
-## Function to update the values of the aperture and image viewing parameters:
-
-def update_values():
-    """
-    Reads the values of the widgets and stores them in global variables for later use.
-    """
-    global R
-    global inner_annulus
-    global outer_annulus
-    global low_lim
-    global hi_lim
-    global cmap_value
-    R = ApertureRadius.value
-    inner_annulus = InnerAnnulus.value
-    outer_annulus = OuterAnnulus.value
-    low_lim = LowLim.value
-    hi_lim = HiLim.value
-    cmap_value = Cmap.value
-    # Save widget state:
-    display(
-        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
+    def on_close(self, event):
+        """
+        When the interactive plot window is closed, hide all aperture and image viewing widgets, so that they
+        cannot be changed when there is no active image.
+        """
+        w = self.w
 
+        # Reset the centre of the aperture:
+        self.x_center = -1
+        self.y_center = -1
 
-## Define a button which displays the image selected from the dropdown lists:
-button1 = widgets.Button(description="Display image")
-button1.style.button_color = 'lightblue'
+        # Hide the widgets and the 'Update values' button:
+        w.out0.layout = w.layout_hidden
+        w.ApertureRadius.layout = w.layout_hidden
+        w.InnerAnnulus.layout = w.layout_hidden
+        w.OuterAnnulus.layout = w.layout_hidden
+        w.LowLim.layout = w.layout_hidden
+        w.HiLim.layout = w.layout_hidden
+        w.Cmap.layout = w.layout_hidden
+        w.button2.layout = w.layout_hidden  # hide 'update values' button
+        w.out.layout = w.layout_hidden
 
-## Define a button which updates the image corresponding to the newly set widgets:
-button2 = widgets.Button(description="Update values")
-button2.style.button_color = 'wheat'
+        w.out.clear_output()
 
+    ## Define what the 'Display image' button does:
 
-## Function which sets the functionality of the 'Update values' button.
-def on_update_values_button_clicked(b):
-    """
-    Calls update_values() to read the values of the aperture and image viewing widgets.
-    Updates the image depending on these new values.
-    """
-    out.clear_output()
-    update_values()
+    def on_display_img_button_clicked(self, b):
+        """
+        Defines what the 'Display image' button does. Upon clicking, erase any images plotted before, show the
+        current image and display or make the image viewing widgets visible.
+        """
+        from IPython.display import display
 
-    if check_values() == 1:  # only proceed if the values are correct
+        w = self.w
 
-        plt.clf()  # clear everything drawn before
-        plt.title(dropdown.value + '\n' + dropdown2.value + ', 1994')  # set the right title
+        ## Delete the previous output:
+        w.out.clear_output()
+        plt.close()
 
-        ## Display the image with the new parameters:
-        plt.imshow(img, origin='lower', cmap=cmap_value, vmin=low_lim / 100 * np.max(img), \
-                   vmax=hi_lim / 100 * np.max(img), animated=True)
+        ## Reset the centre of the aperture:
+        self.x_center = -1
+        self.y_center = -1
+
+        ## Show the current image:
+        self.fig, self.ax = plt.subplots()
+        self.setup_canvas()  # display the image and create the apertures
         show_plot()  # make the interactive window pop up
 
-        ## If an aperture was previously drawn somewhere on the image, redraw it and do photometry there.
-        if x_center >= 0 and y_center >= 0:
-            aperture_photom(R, inner_annulus, outer_annulus)
+        ## If an aperture was placed on another date of the same Cepheid, move it to the same star on this frame
+        ## (the frames are registered against each other) and do photometry there:
+        ## The registration runs in the background, so if it has not finished yet, the aperture is not carried
+        ## over this time rather than blocking the widgets:
+        if self.last_aperture is not None and self.last_aperture[0] == w.dropdown.value:
+            cepheid, date, x, y = self.last_aperture
+            self.prefetch_shifts(cepheid)
+            if self.shifts[cepheid].done():
+                shifts = self.shifts[cepheid].result()
+                self.x_center, self.y_center = carry_position(shifts, cepheid, x, y, date, w.dropdown2.value)
+                self.aperture_photom()
+            else:
+                with w.out:
+                    print("The frames of this Cepheid are still being aligned; display the image again in a moment "
+                          "to carry the aperture over.\n")
 
-    else:  # prevent plotting the image if the values are incorrect
-        with out:
-            print("Try again.\n")
-
-    # Save widget state:
-    display(
-        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
+        if self.click_count == 0:  # if this is the first time the button has been clicked
 
+            display(w.out0)  # display the widgets for the first time
+            display(w.ApertureRadius)  # (doing this on a subsequent clicking would display these widgets
+            display(w.InnerAnnulus)  # again and again)
+            display(w.OuterAnnulus)
+            display(w.LowLim)
+            display(w.HiLim)
+            display(w.Cmap)
+            display(w.button2)  # display the 'Update values' button only after an image is shown
+            display(w.out)
 
-## Function to hide the existing widgets whenever the image tab is closed:
+            ## Activate the 'Update values' button only after an image is shown:
+            w.button2.on_click(self.on_update_values_button_clicked)
 
-def on_close(event):
-    """
-    When the interactive plot window is closed, hide all aperture and image viewing widgets, so that they cannot
-    be changed when there is no active image.
-    """
 
-    # Reset the centre of the aperture:
-    global x_center
-    global y_center
-    x_center = -1
-    y_center = -1
+        else:  # if the button has been clicked before
 
-    # Hide the widgets and the 'Update values' button:
-    out0.layout = layout_hidden
-    ApertureRadius.layout = layout_hidden
-    InnerAnnulus.layout = layout_hidden
-    OuterAnnulus.layout = layout_hidden
-    LowLim.layout = layout_hidden
-    HiLim.layout = layout_hidden
-    Cmap.layout = layout_hidden
-    button2.layout = layout_hidden  # hide 'update values' button
-    out.layout = layout_hidden
+            w.out0.layout = {'border': '1px solid black'}  # only make these widgets visible
+            w.ApertureRadius.layout = w.layout_visible  # (do not display them again, or you will get duplicates)
+            w.InnerAnnulus.layout = w.layout_visible
+            w.OuterAnnulus.layout = w.layout_visible
+            w.LowLim.layout = w.layout_visible
+            w.HiLim.layout = w.layout_visible
+            w.Cmap.layout = w.layout_visible
+            w.button2.layout = w.layout_visible  # show the 'Update values' button only after an image is shown
+            w.out.layout = {'border': '1px solid black'}
 
-    out.clear_output()
+        self.click_count = self.click_count + 1  # increase the no. of click counts
 
+        self.fig.canvas.mpl_connect('button_press_event', self.on_press)  # activate the canvas to the mouse-click fct.
 
-## Activate the interactive dropdown lists and show the 'Display image' button:
-widgets.interact(Dropdown_Menu, value1=dropdown, value2=dropdown2)
-display(button1)
+        self.fig.canvas.mpl_connect('close_event', self.on_close)  # activate the canvas to the closing fct.
 
-## Define what the 'Display image' button does:
+        save_widget_state()
 
-# Initialise a click counter. Depending on the number of times the button has already been clicked,
-# the button does different things:
-click_count = 0
 
+## Show the viewer. Nothing is created, displayed or activated until this is called, so the module can be imported
+## without side effects (run the file, e.g. with %run in the notebook, to show the viewer):
 
-def on_display_img_button_clicked(b):
+def main():
     """
-    Defines what the 'Display image' button does. Upon clicking, erase any images plotted before, show the current
-    image and display or make the image viewing widgets visible.
+    Creates the viewer, hides the code cells, activates the interactive dropdown lists and shows the 'Display
+    image' button. Returns the viewer.
     """
+    import ipywidgets as widgets
+    from IPython.display import display
 
-    ## Delete the previous output:
-    out.clear_output()
-    plt.close()
-
-    ## Reset the centre of the aperture:
-    global x_center, y_center
-
-    x_center = -1
-    y_center = -1
-
-    ## Show the current image:
-    global fig
-    global ax
-    fig, ax = plt.subplots()
-    plt.clf()  # clear anything plotted before
-    plt.title(dropdown.value + '\n' + dropdown2.value + ', 1994')  # set the right title
-    plt.imshow(img, origin='lower', cmap=cmap_value, vmin=low_lim / 100 * np.max(img), \
-               vmax=hi_lim / 100 * np.max(img), animated=True)  # display the image
-    show_plot()  # make the interactive window pop up
-
-    global click_count
-
-    if click_count == 0:  # if this is the first time the button has been clicked
+    viewer = Viewer()
+    w = viewer.w
 
-        display(out0)  # display the widgets for the first time
-        display(ApertureRadius)  # (doing this on a subsequent clicking would display these widgets
-        display(InnerAnnulus)  # again and again)
-        display(OuterAnnulus)
-        display(LowLim)
-        display(HiLim)
-        display(Cmap)
-        display(button2)  # display the 'Update values' button only after an image is shown
-        display(out)
+    toggle_code(False)
+    w.toggle_button.observe(button_action, "value")
 
-        ## Activate the 'Update values' button only after an image is shown:
-        button2.on_click(on_update_values_button_clicked)
+    ## Activate the interactive dropdown lists and show the 'Display image' button:
+    widgets.interact(viewer.Dropdown_Menu, value1=w.dropdown, value2=w.dropdown2)
+    display(w.button1)
 
+    ## Activate the 'Display image' button:
+    w.button1.on_click(viewer.on_display_img_button_clicked)
 
-    else:  # if the button has been clicked before
-
-        out0.layout = {'border': '1px solid black'}  # only make these widgets visible
-        ApertureRadius.layout = layout_visible  # (do not display them again, or you will get duplicates)
-        InnerAnnulus.layout = layout_visible
-        OuterAnnulus.layout = layout_visible
-        LowLim.layout = layout_visible
-        HiLim.layout = layout_visible
-        Cmap.layout = layout_visible
-        button2.layout = layout_visible  # show the 'Update values' button only after an image is shown
-        out.layout = {'border': '1px solid black'}
-
-        ## Activate the 'Update values' button only after an image is shown:
-        button2.on_click(on_update_values_button_clicked)
-
-    click_count = click_count + 1  # increase the no. of click counts
-
-    fig.canvas.mpl_connect('button_press_event', on_press)  # activate the canvas to the mouse-click fct.
-
-    fig.canvas.mpl_connect('close_event', on_close)  # activate the canvas to the closing fct.
-
-    # Save widget state:
-    display(
-        HTML('<script>Jupyter.menubar.actions._actions["widgets:save-with-widgets"].handler()</script>'))
+    plt.show()
 
+    return viewer
 
-## Activate the 'Display image' button:
-button1.on_click(on_display_img_button_clicked)
 
-plt.show()
+if __name__ == "__main__":
+    viewer = main()
@@ -0,0 +1,48 @@
+## Table of the Cepheid fits files and the dates (in 1994) on which they were taken:
+
+import os
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+## Directory holding the fits files:
+FITS_DIR = './fits_for_astropy/'
+
+## Year in which the images were taken:
+YEAR = 1994
+
+## Store all 72 Cepheid images in a table:
+
+# Save them as a 2D string:
+testdata = StringIO("""Apr 23,May 04,May 06,May 09,May 12,May 16,May 20,May 26,May 31,Jun 07,Jun 17,Jun 19
+Cepheid 4,c4apr23.fits,c4may04.fits,c4may06.fits,c4may09.fits,c4may12.fits,c4may16.fits,c4may20.fits,c4may26.fits,c4may31.fits,c4jun07.fits,c4jun17.fits,c4jun19.fits
+Cepheid 5,c5apr23.fits,c5may04.fits,c5may06.fits,c5may09.fits,c5may12.fits,c5may16.fits,c5may20.fits,c5may26.fits,c5may31.fits,c5jun07.fits,c5jun17.fits,c5jun19.fits
+Cepheid 10,c10apr23.fits,c10may04.fits,c10may06.fits,c10may09.fits,c10may12.fits,c10may16.fits,c10may20.fits,c10may26.fits,c10may31.fits,c10jun07.fits,c10jun17.fits,c10jun19.fits
+Cepheid 18,c18apr23.fits,c18may04.fits,c18may06.fits,c18may09.fits,c18may12.fits,c18may16.fits,c18may20.fits,c18may26.fits,c18may31.fits,c18jun07.fits,c18jun17.fits,c18jun19.fits
+Cepheid 32,c32apr23.fits,c32may04.fits,c32may06.fits,c32may09.fits,c32may12.fits,c32may16.fits,c32may20.fits,c32may26.fits,c32may31.fits,c32jun07.fits,c32jun17.fits,c32jun19.fits
+Cepheid 56,c56apr23.fits,c56may04.fits,c56may06.fits,c56may09.fits,c56may12.fits,c56may16.fits,c56may20.fits,c56may26.fits,c56may31.fits,c56jun07.fits,c56jun17.fits,c56jun19.fits
+""")
+
+# Convert the string to a table (rows = cepheids, columns = dates):
+df = pd.read_csv(testdata, sep=",")
+
+CEPHEIDS = list(df.index)
+DATES = list(df.columns)
+
+
+def fits_filename(cepheid, date, fits_dir=FITS_DIR):
+    """
+    Returns the path of the fits file for the given Cepheid and date.
+    """
+    return os.path.join(fits_dir, str(df.loc[cepheid, date]))
+
+
+def observation_days(dates=None):
+    """
+    Returns the times of the given dates (all the dates by default) in days since the first date of the table.
+    """
+    dates = DATES if dates is None else dates
+    days = pd.to_datetime([f"{date} {YEAR}" for date in dates], format='%b %d %Y')
+    first = pd.to_datetime(f"{DATES[0]} {YEAR}", format='%b %d %Y')
+    return np.asarray((days - first).days, dtype=float)
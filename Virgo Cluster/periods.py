@@ -0,0 +1,181 @@
+## Period search for the Cepheid light curves, using a vectorized Lomb-Scargle periodogram.
+##
+## Usage:
+##     python periods.py lightcurves.csv periods.csv [--min-period 2] [--max-period 100] [--bootstrap 200]
+##
+## lightcurves.csv is the light curve table written by batch.py (read as Parquet if its name ends in '.parquet').
+## The output has one row per star, with the best period, the height of its peak in the periodogram and the
+## bootstrap uncertainty on the period.
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from observations import DATES, observation_days
+
+
+def read_table(filename):
+    """
+    Reads a table written by batch.py, as Parquet or CSV depending on the extension of the file name.
+    """
+
+    if os.path.splitext(filename)[1] == '.parquet':
+        return pd.read_parquet(filename)
+    return pd.read_csv(filename)
+
+
+def frequency_grid(t, min_period, max_period, oversample=10):
+    """
+    Returns a grid of frequencies (in cycles per day) between 1 / max_period and 1 / min_period. The spacing is
+    1 / oversample of the width of a periodogram peak, which is about one over the time span of the data.
+    """
+    step = 1 / (oversample * (np.max(t) - np.min(t)))
+    return np.arange(1 / max_period, 1 / min_period + step, step)
+
+
+def lomb_scargle(t, y, frequencies, dy=None, weights=None, chunk_size=2048):
+    """
+    Computes the generalised Lomb-Scargle periodogram (a sinusoid plus a constant, fitted by weighted least
+    squares at every frequency) of many light curves sampled at the same times t. y is a (no. of stars,
+    no. of times) array, with NaN for missing points, and dy holds the errors on y. Extra weights per point (used
+    for the bootstrap) can be given in weights. All the sums over the data are matrix products of the weights
+    with the sines and cosines of the frequency grid, so thousands of stars are done at once. Returns a
+    (no. of stars, no. of frequencies) array of the power, between 0 and 1.
+    """
+
+    t = np.asarray(t, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    w = np.ones_like(y) if dy is None else 1 / np.atleast_2d(np.asarray(dy, dtype=float)) ** 2
+    if weights is not None:
+        w = w * weights
+
+    # Leave out the missing points and normalise the weights of each star to add up to one:
+    missing = np.isnan(y) | ~np.isfinite(w)
+    w = np.where(missing, 0, w)
+    y = np.where(missing, 0, y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = w / np.sum(w, axis=1, keepdims=True)
+
+    Y = np.sum(w * y, axis=1, keepdims=True)
+    YY = np.sum(w * y ** 2, axis=1, keepdims=True) - Y ** 2
+    wy = w * y
+
+    power = np.empty((len(y), len(frequencies)))
+    for start in range(0, len(frequencies), chunk_size):
+        phase = 2 * np.pi * np.outer(t, frequencies[start:start + chunk_size])  # (no. of times, no. of freqs)
+        cos, sin = np.cos(phase), np.sin(phase)
+
+        C = w @ cos
+        S = w @ sin
+        YC = wy @ cos - Y * C
+        YS = wy @ sin - Y * S
+        CC = w @ cos ** 2 - C * C
+        SS = w @ sin ** 2 - S * S
+        CS = w @ (cos * sin) - C * S
+        D = CC * SS - CS ** 2
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            power[:, start:start + chunk_size] = (SS * YC ** 2 + CC * YS ** 2 - 2 * CS * YC * YS) / (YY * D)
+
+    return power
+
+
+def best_periods(t, y, frequencies, dy=None, weights=None):
+    """
+    Returns the period of the highest peak of the periodogram of each light curve, and the height of the peak.
+    """
+
+    power = np.nan_to_num(lomb_scargle(t, y, frequencies, dy, weights), nan=-1)
+    peak = np.argmax(power, axis=1)
+    return 1 / frequencies[peak], power[np.arange(len(power)), peak]
+
+
+def bootstrap_chunk(task):
+    """
+    Finds the best periods of no_bootstrap resamplings of the light curves. Drawing the points with replacement
+    is the same as weighting each point by the number of times it was drawn, so the times stay the same and the
+    periodogram stays vectorized. Runs in a worker process. Returns a (no_bootstrap, no. of stars) array.
+    """
+
+    t, y, frequencies, dy, no_bootstrap, seed = task
+    rng = np.random.default_rng(seed)
+
+    # Column indices of the valid points of each star, in front of the missing ones:
+    valid = ~np.isnan(y)
+    no_points = valid.sum(axis=1, keepdims=True)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    drawn = np.arange(y.shape[1]) < no_points  # each star draws as many points as it has
+    rows = np.broadcast_to(np.arange(len(y))[:, None], y.shape)[drawn]
+
+    periods = np.empty((no_bootstrap, len(y)))
+    for i in range(no_bootstrap):
+        # Number of times each point is drawn, for every star:
+        picks = np.floor(rng.random(y.shape) * no_points).astype(int)
+        cols = np.take_along_axis(order, picks, axis=1)[drawn]
+        counts = np.zeros(y.shape)
+        np.add.at(counts, (rows, cols), 1)
+
+        periods[i] = best_periods(t, y, frequencies, dy, counts)[0]
+
+    return periods
+
+
+def period_uncertainties(t, y, frequencies, dy=None, no_bootstrap=200, workers=None, seed=None):
+    """
+    Estimates the uncertainty on the best period of each light curve as the standard deviation of the best
+    periods of no_bootstrap resampled light curves. The resamplings are shared out between a pool of processes,
+    each with its own random seed.
+    """
+
+    workers = workers or os.cpu_count()
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(no_bootstrap), workers)]
+    tasks = [(t, y, frequencies, dy, size, seed) for size, seed in zip(sizes, seeds) if size]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        periods = np.concatenate(list(executor.map(bootstrap_chunk, tasks)))
+
+    return np.std(periods, axis=0)
+
+
+def light_curve_matrix(table, value='signal', error='error'):
+    """
+    Turns a light curve table (as written by batch.py) into arrays with one row per star and one column per date.
+    Returns the (Cepheid, Star) of each row, the times of the dates in days, and the values and errors.
+    """
+
+    keys = ['Cepheid', 'Star'] if 'Star' in table.columns else ['Cepheid']
+    values = table.pivot_table(index=keys, columns='Date', values=value).reindex(columns=DATES)
+    errors = table.pivot_table(index=keys, columns='Date', values=error).reindex(columns=DATES)
+
+    return values.index, observation_days(), values.to_numpy(), errors.to_numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Period search for the Cepheid light curves.')
+    parser.add_argument('lightcurves', help='light curve table written by batch.py (.csv or .parquet)')
+    parser.add_argument('output', help='CSV file to write the periods to')
+    parser.add_argument('--min-period', type=float, default=2, help='shortest period to search (in days)')
+    parser.add_argument('--max-period', type=float, default=100, help='longest period to search (in days)')
+    parser.add_argument('--oversample', type=float, default=10, help='frequency grid points per peak width')
+    parser.add_argument('--bootstrap', type=int, default=200, help='number of bootstrap resamplings')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    stars, t, y, dy = light_curve_matrix(read_table(args.lightcurves))
+    frequencies = frequency_grid(t, args.min_period, args.max_period, args.oversample)
+
+    period, power = best_periods(t, y, frequencies, dy)
+    table = pd.DataFrame({'period': period, 'power': power}, index=stars)
+    if args.bootstrap:
+        table['period_error'] = period_uncertainties(t, y, frequencies, dy, args.bootstrap, args.workers)
+
+    table.reset_index().to_csv(args.output, index=False)
+    print(f"Found periods for {len(table)} stars.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+## Aperture photometry on a small cutout around the star.
+##
+## This module only depends on numpy and takes every parameter explicitly, so it can be imported quickly by the
+## batch tools and their worker processes. The notebook viewer in main.py is a thin layer on top of it.
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+## The centre of the aperture is rounded to 1/SUBPIXEL_STEPS of a pixel when looking up the weights below:
+SUBPIXEL_STEPS = 20
+
+Photometry = namedtuple('Photometry', ['signal', 'sky_bckg', 'no_pixels', 'no_sky_pixels', 'sky_sigma', 'error'])
+
+
+def quadrant_area(a, b, r):
+    """
+    Returns the area of the part of a circle of radius r centred on the origin which lies within the rectangle
+    0 < x < a, 0 < y < b (for a, b >= 0). Works on arrays.
+    """
+
+    a = np.minimum(a, r)
+    b = np.minimum(b, r)
+
+    # Where the corner (a, b) lies outside the circle, the top edge of the rectangle meets the circle at x = c,
+    # and the area is the rectangle up to c plus the area under the circle from c to a:
+    c = np.sqrt(np.maximum(r ** 2 - b ** 2, 0))
+    c = np.minimum(c, a)
+
+    def under_circle(t):  # area under the circle from 0 to t
+        return 0.5 * (t * np.sqrt(np.maximum(r ** 2 - t ** 2, 0)) + r ** 2 * np.arcsin(np.clip(t / r, -1, 1)))
+
+    return b * c + under_circle(a) - under_circle(c)
+
+
+def pixel_overlap(x0, x1, y0, y1, r):
+    """
+    Returns the exact area of overlap of the rectangle x0 < x < x1, y0 < y < y1 with a circle of radius r centred
+    on the origin. Works on arrays.
+    """
+
+    if r <= 0:
+        return np.zeros(np.broadcast(x0, y0).shape)
+
+    def corner(x, y):  # signed area of the circle between the origin and the corner (x, y)
+        return np.sign(x) * np.sign(y) * quadrant_area(np.abs(x), np.abs(y), r)
+
+    return corner(x1, y1) - corner(x0, y1) - corner(x1, y0) + corner(x0, y0)
+
+
+@lru_cache(maxsize=4096)
+def aperture_weights(R, inner_annulus, outer_annulus, dx=0, dy=0):
+    """
+    Works out the fraction of each pixel which lies within the aperture and within the background ring of a star
+    whose centre lies (dx, dy) / SUBPIXEL_STEPS pixels away from the centre of a pixel. Returns the half-size of
+    the box holding both, and the two arrays of weights over the box. The results are cached, so each combination
+    of radii and sub-pixel offset is only worked out once.
+    """
+
+    half_size = int(np.ceil(outer_annulus * R)) + 1
+    y, x = np.mgrid[-half_size:half_size + 1, -half_size:half_size + 1]
+
+    # Edges of each pixel in the box, relative to the star's centre:
+    x0 = x - dx / SUBPIXEL_STEPS - 0.5
+    y0 = y - dy / SUBPIXEL_STEPS - 0.5
+
+    aperture = pixel_overlap(x0, x0 + 1, y0, y0 + 1, R)
+    annulus = (pixel_overlap(x0, x0 + 1, y0, y0 + 1, outer_annulus * R)
+               - pixel_overlap(x0, x0 + 1, y0, y0 + 1, inner_annulus * R))
+
+    # The weights are shared by every caller through the cache, so make sure they cannot be changed:
+    aperture.flags.writeable = False
+    annulus.flags.writeable = False
+
+    return half_size, aperture, annulus
+
+
+def split_centre(x):
+    """
+    Splits a coordinate into the nearest pixel and the sub-pixel offset from it, in units of 1/SUBPIXEL_STEPS.
+    """
+    pixel = int(np.floor(x + 0.5))
+    offset = int(round((x - pixel) * SUBPIXEL_STEPS))
+    return pixel, offset
+
+
+def cutout(img, x_pixel, y_pixel, half_size):
+    """
+    Returns the box of half-size half_size around the pixel (x_pixel, y_pixel) as floats, and the slices of the box
+    which it covers (the box may stick out of the image).
+    """
+
+    # The stop is never before the start, so that a box entirely off the image gives empty slices of the box too:
+    row_start, col_start = max(y_pixel - half_size, 0), max(x_pixel - half_size, 0)
+    rows = slice(row_start, max(min(y_pixel + half_size + 1, img.shape[0]), row_start))
+    cols = slice(col_start, max(min(x_pixel + half_size + 1, img.shape[1]), col_start))
+    box_rows = slice(rows.start - (y_pixel - half_size), rows.stop - (y_pixel - half_size))
+    box_cols = slice(cols.start - (x_pixel - half_size), cols.stop - (x_pixel - half_size))
+
+    return np.asarray(img[rows, cols], dtype=float), (box_rows, box_cols)
+
+
+def check_parameters(R, inner_annulus, outer_annulus):
+    """
+    Verifies whether the aperture radius and annulus multipliers can be used for photometry. Returns a message
+    explaining the problem, or None if they are correct.
+    """
+
+    if R <= 0:  # aperture radius cannot be zero
+        return "Please select a value for the aperture radius."
+
+    elif inner_annulus <= 1:  # inner annulus radius must be larger than aperture radius
+        return "Please make sure that the inner annulus multiplier is larger than one."
+
+    elif outer_annulus <= 1:  # outer annulus radius must be larger than aperture radius
+        return "Please make sure that the outer annulus multiplier is larger than one."
+
+    elif inner_annulus >= outer_annulus:  # outer annulus must be larger than inner annulus
+        return "Please make sure that the outer annulus multiplier is bigger than the inner annulus multiplier."
+
+    return None
+
+
+def photometric_error(signal, no_pixels, no_sky_pixels, sky_sigma, gain=1.0):
+    """
+    Estimates the uncertainty on the background-subtracted signal from the photon noise of the star, the scatter
+    of the sky in the aperture and the uncertainty on the mean sky level (the CCD equation, with the gain in
+    electrons per count). Works on single values and on arrays.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sky_variance = no_pixels * sky_sigma ** 2 * (1 + np.divide(no_pixels, no_sky_pixels))
+    return np.sqrt(np.maximum(signal, 0) / gain + sky_variance)
+
+
+def aperture_photometry(img, x_center, y_center, R, inner_annulus, outer_annulus, gain=1.0):
+    """
+    Calculates the signal within an aperture of radius R centred on (x_center, y_center) and the mean sky
+    background per pixel in the ring between inner_annulus * R and outer_annulus * R, together with the scatter
+    of the sky and the error on the signal. Each pixel counts by the fraction of its area inside the aperture or
+    the ring, so the result changes smoothly as the centre moves. Only the pixels in a box of half-size
+    outer_annulus * R around the centre are read, so the cost does not depend on the size of the image.
+    """
+
+    x_pixel, dx = split_centre(x_center)
+    y_pixel, dy = split_centre(y_center)
+    half_size, aperture, annulus = aperture_weights(R, inner_annulus, outer_annulus, dx, dy)
+
+    box, inside = cutout(img, x_pixel, y_pixel, half_size)
+    aperture = aperture[inside].ravel()
+    annulus = annulus[inside].ravel()
+    box = box.ravel()
+
+    # Effective no. of pixels (the sum of the weights) within the aperture and the ring:
+    no_pixels = np.sum(aperture)
+    no_sky_pixels = np.sum(annulus)
+
+    # Divide by no. of pixels within ring to get the mean background per pixel:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sky_bckg = np.dot(annulus, box) / no_sky_pixels
+        sky_sigma = np.sqrt(np.dot(annulus, (box - sky_bckg) ** 2) / no_sky_pixels)
+
+    # Find the total signal from the star (after background subtraction from each pixel):
+    signal = np.dot(aperture, box) - no_pixels * sky_bckg
+
+    error = photometric_error(signal, no_pixels, no_sky_pixels, sky_sigma, gain)
+
+    return Photometry(signal, sky_bckg, no_pixels, no_sky_pixels, sky_sigma, error)
+
+
+def sigma_clip(values, clip_sigma=3.0, iterations=5):
+    """
+    Sorts each row of the array and replaces its outliers by NaN (NaNs are sorted to the end of the rows). A
+    value is an outlier if it lies more than clip_sigma standard deviations from the median of its row. Repeats
+    until nothing more is clipped, or for the given number of iterations. NaNs in the input are ignored.
+    """
+
+    values = np.sort(values, axis=1)
+    last = values.shape[1] - 1
+    for _ in range(iterations):
+        valid = ~np.isnan(values)
+        count = np.sum(valid, axis=1, keepdims=True)
+
+        # The rows are sorted, so the median is the middle of the valid values:
+        low = np.take_along_axis(values, np.clip((count - 1) // 2, 0, last), axis=1)
+        high = np.take_along_axis(values, np.clip(count // 2, 0, last), axis=1)
+        median = (low + high) / 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.sum(np.where(valid, values, 0), axis=1, keepdims=True) / count
+            std = np.sqrt(np.sum(np.where(valid, values - mean, 0) ** 2, axis=1, keepdims=True) / count)
+            outliers = np.abs(values - median) > clip_sigma * std
+
+        if not outliers.any():
+            break
+        values[outliers] = np.nan
+        values.sort(axis=1)
+
+    return values
+
+
+def multi_aperture_photometry(img, x_centers, y_centers, R, inner_annulus, outer_annulus, clip_sigma=3.0,
+                              iterations=5, gain=1.0, chunk_size=4096):
+    """
+    Does aperture photometry on many stars of the same image at once. The pixels around all the stars are
+    gathered from the image in one go, and the aperture and background ring of every star are found from the
+    positions of those pixels, so there is no Python loop over the stars. Each pixel counts by the fraction of its
+    area inside the aperture. The sky of each star is the mean of its background ring after sigma clipping.
+    Returns a Photometry tuple of arrays, one value per star. The stars are processed in chunks of chunk_size to
+    keep the memory use bounded.
+    """
+
+    x_centers = np.atleast_1d(np.asarray(x_centers, dtype=float))
+    y_centers = np.atleast_1d(np.asarray(y_centers, dtype=float))
+
+    # Offsets from the nearest pixel of the pixels that can fall within the aperture or the background ring,
+    # whatever the sub-pixel position of the star (the centre is at most 0.5 pixels away in x and y, and so is
+    # the edge of a pixel from its centre):
+    half_size = int(np.ceil(outer_annulus * R)) + 1
+    y, x = np.mgrid[-half_size:half_size + 1, -half_size:half_size + 1]
+    dist = np.sqrt(y ** 2 + x ** 2)
+    margin = np.sqrt(0.5)
+    near_aperture = dist < R + 2 * margin
+    near_annulus = (dist > inner_annulus * R - margin) & (dist < outer_annulus * R + margin)
+
+    def gather(rows, cols):
+        """
+        Returns the values of the pixels, with NaN for those outside the image.
+        """
+        inside = (rows >= 0) & (rows < img.shape[0]) & (cols >= 0) & (cols < img.shape[1])
+        values = img[np.clip(rows, 0, img.shape[0] - 1), np.clip(cols, 0, img.shape[1] - 1)].astype(float)
+        values[~inside] = np.nan
+        return values
+
+    results = []
+    for start in range(0, len(x_centers), chunk_size):
+        xc = x_centers[start:start + chunk_size, None]
+        yc = y_centers[start:start + chunk_size, None]
+        y_pixel = np.floor(yc + 0.5).astype(int)
+        x_pixel = np.floor(xc + 0.5).astype(int)
+
+        # Total signal within the aperture of each star:
+        rows, cols = y_pixel + y[near_aperture], x_pixel + x[near_aperture]
+        values = gather(rows, cols)
+        x0, y0 = cols - xc - 0.5, rows - yc - 0.5  # edges of the pixels relative to the star's centre
+        aperture = np.where(np.isnan(values), 0, pixel_overlap(x0, x0 + 1, y0, y0 + 1, R))
+        no_pixels = np.sum(aperture, axis=1)
+        total_signal = np.sum(aperture * np.nan_to_num(values), axis=1)
+
+        # Sigma-clipped sky background of each star:
+        rows, cols = y_pixel + y[near_annulus], x_pixel + x[near_annulus]
+        values = gather(rows, cols)
+        dist = np.sqrt((rows - yc) ** 2 + (cols - xc) ** 2)
+        annulus = (dist > inner_annulus * R) & (dist < outer_annulus * R)
+        ring = sigma_clip(np.where(annulus, values, np.nan), clip_sigma, iterations)
+        valid = ~np.isnan(ring)
+        no_sky_pixels = np.sum(valid, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):  # stars with no background pixels give NaN
+            sky_bckg = np.sum(np.where(valid, ring, 0), axis=1) / no_sky_pixels
+            sky_sigma = np.sqrt(np.sum(np.where(valid, ring - sky_bckg[:, None], 0) ** 2, axis=1) / no_sky_pixels)
+
+        # Total signal from each star (after background subtraction from each pixel):
+        signal = total_signal - no_pixels * sky_bckg
+
+        error = photometric_error(signal, no_pixels, no_sky_pixels, sky_sigma, gain)
+        results.append((signal, sky_bckg, no_pixels, no_sky_pixels, sky_sigma, error))
+
+    if not results:
+        return Photometry(*(np.empty(0) for _ in Photometry._fields))
+
+    return Photometry(*(np.concatenate(column) for column in zip(*results)))
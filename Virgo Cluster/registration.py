@@ -0,0 +1,204 @@
+## Alignment of the frames of a Cepheid field taken on different dates, by FFT cross-correlation:
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+from image_index import load_stats
+from observations import DATES, FITS_DIR, fits_filename
+
+## Name of the file, in the fits directory, which stores the shifts of the frames:
+SHIFT_CACHE = 'registration.json'
+
+
+def upsampled_dft(data, region_size, upsample, offsets):
+    """
+    Evaluates the inverse DFT of data on a grid upsample times finer than the pixels, but only over a
+    region_size x region_size patch starting at offsets (in upsampled pixels). This is done with two small matrix
+    products, which is much cheaper than zero-padding the whole array.
+    """
+
+    for n, offset in zip(data.shape[::-1], offsets[::-1]):
+        kernel = np.exp(2j * np.pi * (np.arange(region_size) - offset)[:, None] * np.fft.fftfreq(n, upsample))
+        data = np.tensordot(kernel, data, axes=(1, -1))
+    return data
+
+
+def bright_pixels(img, threshold=3.0, background=None):
+    """
+    Returns the image with the sky subtracted and everything less than threshold times the sky noise set to zero,
+    so that the noise of the sky does not add to the correlation. The (sky, noise) of the image can be given in
+    background, otherwise they are estimated from the image.
+    """
+
+    if background is None:
+        sky = np.median(img)
+        noise = 1.4826 * np.median(np.abs(img - sky))  # robust estimate of the standard deviation
+    else:
+        sky, noise = background
+    return np.where(img - sky > threshold * noise, img - sky, 0)
+
+
+def register(reference, img, upsample=20, reference_background=None, background=None):
+    """
+    Finds the shift (dx, dy) in pixels of the image with respect to the reference image, so that a star at
+    (x, y) in the reference frame lies at (x + dx, y + dy) in the image. The whole-pixel shift is the peak of the
+    cross-correlation of the bright pixels of the two images, computed with FFTs; it is then refined to
+    1/upsample of a pixel by evaluating the correlation on a fine grid around the peak. The (sky, noise) of
+    either image can be given if they are already known.
+    """
+
+    img_freq = np.fft.fft2(bright_pixels(img, background=background))
+    ref_freq = np.fft.fft2(bright_pixels(reference, background=reference_background))
+
+    cross_power = img_freq * ref_freq.conj()
+
+    # Whole-pixel shift (shifts of more than half the image wrap round to negative values):
+    correlation = np.abs(np.fft.ifft2(cross_power))
+    peak = np.array(np.unravel_index(np.argmax(correlation), correlation.shape), dtype=float)
+    shape = np.array(correlation.shape)
+    peak[peak > shape // 2] -= shape[peak > shape // 2]
+
+    # Refine the peak on a grid 1/upsample of a pixel across a region of 1.5 x 1.5 pixels:
+    if upsample > 1:
+        region_size = int(np.ceil(upsample * 1.5))
+        centre = region_size // 2
+        peak = np.round(peak * upsample) / upsample
+        fine = np.abs(upsampled_dft(cross_power, region_size, upsample, centre - peak * upsample))
+        fine_peak = np.array(np.unravel_index(np.argmax(fine), fine.shape), dtype=float)
+        peak = peak + (fine_peak - centre) / upsample
+
+    dy, dx = peak
+    return dx, dy
+
+
+class ShiftCache:
+    """
+    Stores the shift of every frame with respect to its reference frame in a JSON file, so that each frame is
+    only registered once. An entry is only used while the file sizes and modification times of both the frame
+    and the reference frame are unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _stamp(filename):
+        stat = os.stat(filename)
+        return [stat.st_size, stat.st_mtime]
+
+    def get(self, filename, reference):
+        """
+        Returns the cached (dx, dy) shift of the frame with respect to the reference frame, or None.
+        """
+
+        entry = self.entries.get(os.path.basename(filename))
+        if (entry is None or entry['reference'] != os.path.basename(reference)
+                or entry['stamp'] != self._stamp(filename) or entry['reference_stamp'] != self._stamp(reference)):
+            return None
+        return tuple(entry['shift'])
+
+    def set(self, filename, reference, shift):
+        self.entries[os.path.basename(filename)] = {
+            'reference': os.path.basename(reference),
+            'stamp': self._stamp(filename),
+            'reference_stamp': self._stamp(reference),
+            'shift': [float(shift[0]), float(shift[1])],
+        }
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+
+
+def read_frame(filename):
+    """
+    Reads the image stored in the fits file as an array of floats.
+    """
+    with fits.open(filename, memmap=True) as HDUlist:
+        return np.array(HDUlist[0].data, dtype=float)
+
+
+def register_field(task):
+    """
+    Registers the frames of the given dates of one Cepheid field against its reference date. Runs in a worker
+    process. Returns a list of (date, (dx, dy)).
+    """
+
+    cepheid, dates, fits_dir, reference_date = task
+
+    def background(filename):
+        stats = load_stats(filename)  # sky level and noise from the image index
+        return stats.sky, stats.noise
+
+    reference_filename = fits_filename(cepheid, reference_date, fits_dir)
+    reference = read_frame(reference_filename)
+    reference_background = background(reference_filename)
+
+    shifts = []
+    for date in dates:
+        filename = fits_filename(cepheid, date, fits_dir)
+        shifts.append((date, register(reference, read_frame(filename), reference_background=reference_background,
+                                      background=background(filename))))
+    return shifts
+
+
+def field_shifts(cepheids, fits_dir=FITS_DIR, reference_date=DATES[0], workers=None):
+    """
+    Returns a dictionary of the (dx, dy) shift of every frame of the given Cepheid fields with respect to the
+    frame of the reference date, keyed by (cepheid, date). Shifts are read from the cache in the fits directory
+    when possible; the other frames are registered (one field per worker process when several fields need it)
+    and added to the cache.
+    """
+
+    cache = ShiftCache(os.path.join(fits_dir, SHIFT_CACHE))
+
+    shifts = {}
+    tasks = []
+    for cepheid in cepheids:
+        reference = fits_filename(cepheid, reference_date, fits_dir)
+        missing = []
+        for date in DATES:
+            shift = cache.get(fits_filename(cepheid, date, fits_dir), reference)
+            if shift is None:
+                missing.append(date)
+            else:
+                shifts[cepheid, date] = shift
+        if missing:
+            tasks.append((cepheid, missing, fits_dir, reference_date))
+
+    if not tasks:
+        return shifts
+
+    if len(tasks) == 1:  # not worth starting worker processes for a single field
+        results = [register_field(tasks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(register_field, tasks))
+
+    for (cepheid, _, _, _), field in zip(tasks, results):
+        for date, shift in field:
+            shifts[cepheid, date] = shift
+            cache.set(fits_filename(cepheid, date, fits_dir), fits_filename(cepheid, reference_date, fits_dir),
+                      shift)
+    cache.save()
+
+    return shifts
+
+
+def carry_position(shifts, cepheid, x, y, from_date, to_date):
+    """
+    Moves a position measured on the frame of one date to the frame of another date of the same Cepheid field,
+    using the shifts returned by field_shifts().
+    """
+
+    from_dx, from_dy = shifts[cepheid, from_date]
+    to_dx, to_dy = shifts[cepheid, to_date]
+    return x + to_dx - from_dx, y + to_dy - from_dy
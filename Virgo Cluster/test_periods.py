@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from periods import best_periods, frequency_grid, lomb_scargle, read_table
+
+
+def test_lomb_scargle_recovers_known_periods():
+    rng = np.random.default_rng(0)
+    t = np.sort(rng.uniform(0, 60, 40))  # uneven sampling, as on the observation dates
+    true_periods = np.array([3.7, 11.2, 27.5])
+    y = 10 + np.sin(2 * np.pi * t / true_periods[:, None] + rng.uniform(0, 2 * np.pi, (3, 1)))
+    y += rng.normal(0, 0.05, y.shape)
+    y[1, 5] = np.nan  # a missing point
+
+    frequencies = frequency_grid(t, 2, 50)
+    period, power = best_periods(t, y, frequencies, dy=np.full(y.shape, 0.05))
+
+    assert np.allclose(period, true_periods, rtol=0.02)
+    assert np.all(power > 0.9) and np.all(power <= 1 + 1e-9)
+
+
+def test_lomb_scargle_of_pure_noise_is_low():
+    rng = np.random.default_rng(1)
+    t = np.sort(rng.uniform(0, 60, 40))
+    power = lomb_scargle(t, rng.normal(0, 1, (5, 40)), frequency_grid(t, 2, 50))
+    assert np.all(power >= -1e-9) and np.all(power.max(axis=1) < 0.6)
+
+
+def test_read_table_csv(tmp_path):
+    table = pd.DataFrame({'Cepheid': ['Cepheid 1'] * 2, 'Date': ['Apr 23', 'May 04'], 'signal': [1.5, 2.5]})
+    table.to_csv(tmp_path / 'lightcurves.csv', index=False)
+    pd.testing.assert_frame_equal(read_table(str(tmp_path / 'lightcurves.csv')), table)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from photometry import SUBPIXEL_STEPS, aperture_photometry, aperture_weights
+
+
+def test_cutout_matches_whole_image():
+    # The same star measured in a small image and embedded in a large one, whose other pixels differ
+    rng = np.random.default_rng(0)
+    small = rng.normal(100, 5, (40, 40))
+    small[18:23, 18:23] += 1000
+    large = rng.normal(500, 50, (2000, 2000))
+    large[1000:1040, 700:740] = small
+
+    for R, inner, outer in [(3, 2, 3), (4.5, 1.5, 2.5)]:
+        expected = aperture_photometry(small, 20.3, 19.6, R, inner, outer)
+        result = aperture_photometry(large, 720.3, 1019.6, R, inner, outer)
+        np.testing.assert_allclose(result, expected)
+
+
+def test_flat_image():
+    result = aperture_photometry(np.full((50, 50), 7.), 25.2, 24.9, 3, 2, 3)
+    assert np.isclose(result.sky_bckg, 7)
+    assert np.isclose(result.signal, 0, atol=1e-9)
+    assert result.sky_sigma < 1e-6
+
+
+def test_exact_overlap_weights():
+    # The weights are the exact areas of the pixels inside the circles, whatever the sub-pixel offset
+    for R, inner, outer in [(1, 2, 3), (3, 2, 3), (4.7, 1.5, 2.2)]:
+        for dx, dy in [(0, 0), (SUBPIXEL_STEPS // 3, -SUBPIXEL_STEPS // 2), (SUBPIXEL_STEPS // 2, 1)]:
+            _, aperture, annulus = aperture_weights(R, inner, outer, dx, dy)
+            assert np.isclose(aperture.sum(), np.pi * R ** 2)
+            assert np.isclose(annulus.sum(), np.pi * ((outer * R) ** 2 - (inner * R) ** 2))
+            assert aperture.min() > -1e-12 and aperture.max() < 1 + 1e-12
+
+
+def test_star_just_off_the_image():
+    # Boxes entirely off the image, but within 2 * half_size + 1 pixels of the edge
+    img = np.zeros((200, 200))
+    for x, y in [(215, 100), (100, 215), (215, 215), (-12, 100), (100, -12)]:
+        result = aperture_photometry(img, x, y, 3, 2, 3)
+        assert np.isnan(result.signal)
+        assert result.no_pixels == 0
+
+
+def test_star_on_the_edge():
+    img = np.ones((200, 200))
+    result = aperture_photometry(img, 199, 100, 3, 2, 3)
+    assert 0 < result.no_pixels < np.pi * 3 ** 2
+    assert np.isclose(result.sky_bckg, 1)
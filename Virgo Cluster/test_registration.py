@@ -0,0 +1,31 @@
+import numpy as np
+
+from registration import carry_position, register
+
+
+def star_field(positions, shape=(128, 128), width=1.5, sky=100.0, seed=0):
+    # Gaussian stars at the given (x, y) positions, on a noisy sky
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    img = rng.normal(sky, 2.0, shape)
+    for (x0, y0), flux in zip(positions, np.linspace(500, 2000, len(positions))):
+        img += flux * np.exp(-((x - x0) ** 2 + (y - y0) ** 2) / (2 * width ** 2))
+    return img
+
+
+def test_register_recovers_subpixel_shifts():
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(20, 108, (25, 2))
+    reference = star_field(positions, seed=2)
+
+    for shift in [(3.35, -2.6), (-7.8, 5.15), (0.45, 0.0)]:
+        img = star_field(positions + shift, seed=3)
+        dx, dy = register(reference, img)
+        assert abs(dx - shift[0]) < 0.1 and abs(dy - shift[1]) < 0.1
+
+
+def test_carry_position():
+    shifts = {('Cepheid 4', 'Apr 23'): (0.0, 0.0), ('Cepheid 4', 'May 04'): (2.5, -1.0),
+              ('Cepheid 4', 'May 06'): (-1.0, 4.0)}
+    x, y = carry_position(shifts, 'Cepheid 4', 50.0, 60.0, 'May 04', 'May 06')
+    assert np.isclose(x, 46.5) and np.isclose(y, 65.0)
@@ -1,66 +1,159 @@
+import warnings
+from functools import lru_cache
+
+import numpy as np
 import pygame
 
 COLOUR_INACTIVE = pygame.Color('lightskyblue3')
 COLOUR_ACTIVE = pygame.Color('dodgerblue2')
+COLOUR_TEXT = pygame.Color('black')
+
+MIN_WIDTH = 200
+
+
+@lru_cache(maxsize=None)
+def get_font(size):
+    return pygame.font.Font(None, size)
+
+
+class GlyphCache:
+    """
+    Surfaces of single characters, rendered once per colour, so text which changes one character at a time (as
+    it is typed) never has to be rendered again.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+
+    def get(self, char, colour):
+        key = (char, tuple(pygame.Color(colour)))
+        glyph = self.glyphs.get(key)
+        if glyph is None:
+            glyph = self.glyphs[key] = self.font.render(char, True, colour)
+        return glyph
+
+
+@lru_cache(maxsize=None)
+def get_glyph_cache(size):
+    return GlyphCache(get_font(size))
 
 
 class InputTextBox:
-    def __init__(self, x, y, w, h, title, text=''):
+    def __init__(self, x, y, w, h, title, text='', background='black', clear_on_submit=True):
         self.rect = pygame.Rect(x, y, w, h)
         self.border_color = COLOUR_INACTIVE
         self.border_width = 2
-        self._font_title = pygame.font.Font(None, int(h*1.2))
-        self._font_text = pygame.font.Font(None, h)
-        self.title = self._font_title.render(title, True, "white")
-        self.text = text
-        self.txt_surface = self._font_text.render(text, True, self.border_color)
+        self.background = background
+        self.clear_on_submit = clear_on_submit
+        self._glyph_cache = get_glyph_cache(h)
+        self.title = get_font(int(h*1.2)).render(title, True, "white")
+
+        # Glyphs of the text and where each one starts:
+        self._glyphs = []
+        self._glyph_x = []
+        self._text_width = 0
+        self.text = ''
+        self.set_text(text)
 
         self.border_rect = pygame.Rect(x, y, w, h)
         self.active = False
 
+        # Only redrawn when something has changed; _drawn_rect is the area covered by the last draw:
+        self.dirty = True
+        self._drawn_rect = None
+
+    def set_text(self, text):
+        self.text = ''
+        self._glyphs.clear()
+        self._glyph_x.clear()
+        self._text_width = 0
+        for char in text:
+            self._append(char)
+        self.dirty = True
+
+    def _append(self, char):
+        glyph = self._glyph_cache.get(char, COLOUR_TEXT)
+        self._glyphs.append(glyph)
+        self._glyph_x.append(self._text_width)
+        self._text_width += glyph.get_width()
+        self.text += char
+
+    def _pop(self):
+        if self.text:
+            self._glyphs.pop()
+            self._text_width = self._glyph_x.pop()
+            self.text = self.text[:-1]
+
     def handle_event(self, event):
+        """
+        Returns the text when it is submitted with return, and None otherwise.
+        """
+
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if self.rect.collidepoint(event.pos):
-                self.active = True
+            active = self.rect.collidepoint(event.pos)
+            if active != self.active:
+                self.active = active
+                self.dirty = True
 
-            else:
-                self.active = False
+        if event.type == pygame.KEYDOWN and self.active:
+            if event.key == pygame.K_RETURN:
+                submitted = self.text
+                if self.clear_on_submit:
+                    self.set_text('')
+                return submitted
 
-        if event.type == pygame.KEYDOWN:
-            if self.active:
-                if event.key == pygame.K_RETURN:
-                    print(self.text)
-                    self.text = ''
+            elif event.key == pygame.K_BACKSPACE:
+                self._pop()
 
-                elif event.key == pygame.K_BACKSPACE:
-                    self.text = self.text[:-1]
+            elif event.unicode:
+                self._append(event.unicode)
 
-                else:
-                    self.text += event.unicode
+            self.dirty = True
 
-                self.txt_surface = self._font_text.render(self.text, True, "black")
+        return None
 
     def update(self):
-        width = max(200, self.txt_surface.get_width()+10)
-        self.rect.w = width
+        # Resize the box and its border in place, and only when needed:
+        width = max(MIN_WIDTH, self._text_width + 10)
+        if width != self.rect.w:
+            self.rect.w = width
+            self.dirty = True
+
         if self.active:
             self.border_color = COLOUR_ACTIVE
-            self.border_rect = pygame.Rect(
-                self.rect.x - 1,
-                self.rect.y - 1,
-                self.rect.w + 2,
-                self.rect.h + 2
-            )
+            self.border_rect.update(self.rect.x - 1, self.rect.y - 1, self.rect.w + 2, self.rect.h + 2)
         else:
             self.border_color = COLOUR_INACTIVE
-            self.border_rect = self.rect
+            self.border_rect.update(self.rect)
 
     def draw(self, screen):
+        """
+        Draws the box if it has changed since it was last drawn. Returns the list of rectangles of the screen which
+        have changed, to pass to pygame.display.update().
+        """
+
+        if not self.dirty:
+            return []
+
+        title_pos = (self.rect.x-self.title.get_width()-10, self.rect.y+5)
+        area = self.border_rect.union(self.title.get_rect(topleft=title_pos))
+
+        # Clear what was drawn before, in case the box has shrunk:
+        if self._drawn_rect is not None:
+            screen.fill(self.background, self._drawn_rect)
+            area.union_ip(self._drawn_rect)
+
         screen.fill("white", self.rect)
-        screen.blit(self.txt_surface, (self.rect.x+3, self.rect.y+4))
-        screen.blit(self.title, (self.rect.x-self.title.get_width()-10, self.rect.y+5))
+        x, y = self.rect.x+3, self.rect.y+4
+        screen.blits([(glyph, (x + glyph_x, y)) for glyph, glyph_x in zip(self._glyphs, self._glyph_x)], False)
+        screen.blit(self.title, title_pos)
         pygame.draw.rect(screen, self.border_color, self.border_rect, self.border_width)
 
+        self._drawn_rect = self.border_rect.union(self.title.get_rect(topleft=title_pos))
+        self.dirty = False
+        return [area]
+
 
 class TextBox:
     def __init__(self, x, y, w, h, text=''):
@@ -73,20 +166,182 @@ class TextBox:
         pass
 
     def draw(self, screen):
-        pass
+        return []
+
+
+def draw_widgets(screen, widgets):
+    """
+    Draws the widgets which have changed. Returns the list of rectangles of the screen which have changed, so that
+    only they are updated with pygame.display.update(rects) instead of the whole screen.
+    """
+
+    rects = []
+    for widget in widgets:
+        rects.extend(widget.draw(screen))
+    return rects
 
 
 class Graph:
-    def __init__(self):
-        pass
+    """
+    Live plot of one or more time series, such as the energy or radius of an orbit, scrolling from right to left.
+    Every sample is kept in a fixed-size ring buffer, and each column of pixels shows the minimum and maximum of
+    samples_per_column samples, so memory stays bounded whatever the append rate. When new columns are complete,
+    the plot is scrolled and only the new columns are drawn.
+    """
+
+    def __init__(self, x, y, w, h, no_series=1, samples_per_column=100, capacity=10**6, y_range=None,
+                 colours=("white", "orange", "dodgerblue2", "green"), background="black"):
+        self.rect = pygame.Rect(x, y, w, h)
+        self.surface = pygame.Surface((w, h))
+        self.surface.fill(background)
+        self.no_series = no_series
+        self.samples_per_column = samples_per_column
+        self.colours = [pygame.Color(colour) for colour in colours[:no_series]]
+        self.background = background
+
+        # Ring buffer of the samples:
+        self.samples = np.full((capacity, no_series), np.nan)
+        self.no_samples = 0
+
+        # Ring buffer of the minimum and maximum of each column, and the samples of the incomplete column:
+        self.column_min = np.full((w, no_series), np.nan)
+        self.column_max = np.full((w, no_series), np.nan)
+        self.no_columns = 0
+        self._pending = np.empty((0, no_series))
+
+        # The y range is fitted to the data (and only ever grows) unless it is given:
+        self.y_range = y_range
+        self._autoscale = y_range is None
+
+        self._drawn_columns = 0
+        self._redraw = True
+        self._axes_drawn = False
+
+    def append(self, values):
+        """
+        Appends samples: an array of shape (no. of samples,) for a single series, or (no. of samples, no_series).
+        """
+
+        values = np.asarray(values, dtype=float).reshape(-1, self.no_series)
+        capacity = len(self.samples)
+
+        index = (self.no_samples + np.arange(max(len(values) - capacity, 0), len(values))) % capacity
+        self.samples[index] = values[-capacity:]
+        self.no_samples += len(values)
+
+        # Complete columns of pixels:
+        pending = np.concatenate([self._pending, values])
+        no_columns = len(pending) // self.samples_per_column
+        self._pending = pending[no_columns * self.samples_per_column:]
+        if not no_columns:
+            return
+
+        columns = pending[:no_columns * self.samples_per_column].reshape(no_columns, self.samples_per_column, -1)
+        columns = columns[-self.rect.w:]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # columns of NaN
+            column_min, column_max = np.nanmin(columns, axis=1), np.nanmax(columns, axis=1)
+
+        index = (self.no_columns + no_columns - len(columns) + np.arange(len(columns))) % self.rect.w
+        self.column_min[index] = column_min
+        self.column_max[index] = column_max
+        self.no_columns += no_columns
+
+        if self._autoscale and np.isfinite(column_min).any():
+            low, high = np.nanmin(column_min), np.nanmax(column_max)
+            if self.y_range is None or low < self.y_range[0] or high > self.y_range[1]:
+                if self.y_range is not None:
+                    low, high = min(low, self.y_range[0]), max(high, self.y_range[1])
+                margin = 0.1 * (high - low) or 1.0
+                self.y_range = (low - margin, high + margin)
+                self._redraw = True
+
+    def data(self):
+        """
+        Returns the samples still in the ring buffer, oldest first.
+        """
+
+        capacity = len(self.samples)
+        if self.no_samples <= capacity:
+            return self.samples[:self.no_samples].copy()
+        start = self.no_samples % capacity
+        return np.concatenate([self.samples[start:], self.samples[:start]])
 
-def draw_arrow(screen, points, double_ended=False, color="white"):
-    pygame.draw.lines(screen, color, True, points=points)
+    def _draw_columns(self, first, stop):
+        # Draws columns first to stop - 1 (counted from the first column ever), the newest at the right edge:
+        if first >= stop or self.y_range is None:
+            return
 
+        w, h = self.rect.w, self.rect.h
+        low, high = self.y_range
+        index = np.arange(first, stop) % w
+        x = w - self.no_columns + np.arange(first, stop)
+        top = np.round((high - self.column_max[index]) / (high - low) * (h - 1))
+        bottom = np.round((high - self.column_min[index]) / (high - low) * (h - 1))
 
-    pygame.draw.line(screen, color, points[1], (points[1], 880))
-    pygame.draw.line(screen, color, points[1], (1490, 860))
+        for series, colour in enumerate(self.colours):
+            for i in np.flatnonzero(np.isfinite(top[:, series])):
+                pygame.draw.line(self.surface, colour, (x[i], top[i, series]), (x[i], bottom[i, series]))
 
+    def draw_axes(self, screen, color="white"):
+        """
+        Draws the axes along the left and bottom edges of the graph. Returns the rectangle drawn over.
+        """
+
+        origin = (self.rect.left - 2, self.rect.bottom + 1)
+        rect = draw_arrow(screen, [origin, (self.rect.right + 10, origin[1])], color=color)
+        rect.union_ip(draw_arrow(screen, [origin, (origin[0], self.rect.top - 10)], color=color))
+        return rect
+
+    def draw(self, screen):
+        """
+        Draws the columns completed since the last draw, scrolling the older ones to the left. Returns the list of
+        rectangles of the screen which have changed.
+        """
+
+        rects = []
+        if not self._axes_drawn:
+            rects.append(self.draw_axes(screen))
+            self._axes_drawn = True
+
+        no_new = self.no_columns - self._drawn_columns
+        if not no_new and not self._redraw:
+            return rects
+
+        w = self.rect.w
+        if self._redraw or no_new >= w:
+            self.surface.fill(self.background)
+            self._draw_columns(max(self.no_columns - w, 0), self.no_columns)
+            self._redraw = False
+        else:
+            self.surface.scroll(-no_new, 0)
+            self.surface.fill(self.background, (w - no_new, 0, no_new, self.rect.h))
+            self._draw_columns(self.no_columns - no_new, self.no_columns)
+
+        self._drawn_columns = self.no_columns
+        screen.blit(self.surface, self.rect)
+        rects.append(self.rect.copy())
+        return rects
+
+
+def draw_arrow(screen, points, double_ended=False, color="white", head_size=10, width=1):
+    """
+    Draws a line through the points, with an arrow head at the last point (and at the first point too if
+    double_ended). Returns the rectangle drawn over.
+    """
+
+    rect = pygame.draw.lines(screen, color, False, points, width)
+
+    heads = [(points[-2], points[-1])]
     if double_ended:
-        pygame.draw.line(screen, color, points[0], (1490, 880))
-        pygame.draw.line(screen, color, points[0], (1490, 860))
\ No newline at end of file
+        heads.append((points[1], points[0]))
+
+    for tail, tip in heads:
+        direction = pygame.Vector2(tip) - pygame.Vector2(tail)
+        if not direction.length():
+            continue
+        direction.scale_to_length(head_size)
+        for angle in (150, -150):
+            rect.union_ip(pygame.draw.line(screen, color, tip, pygame.Vector2(tip) + direction.rotate(angle), width))
+
+    return rect
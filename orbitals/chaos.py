@@ -0,0 +1,231 @@
+"""
+Chaos indicators of orbits about a star: the maximum Lyapunov exponent and MEGNO (the Mean Exponential Growth
+factor of Nearby Orbits), for whole ensembles of initial conditions in one vectorized run.
+
+A tangent vector (a small displacement of every position and velocity) is moved on alongside each run with the
+variational equations of the semi-implicit Euler step of nbody.step(). Its length grows about linearly for a
+regular orbit and exponentially for a chaotic one:
+  - the maximum Lyapunov exponent is the mean rate of growth of log(length), which tends to 0 for regular orbits
+  - MEGNO tends to 2 for quasi-periodic orbits, 0 for stable periodic ones, and grows as (Lyapunov exponent) t / 2
+    for chaotic ones, so it separates them after far fewer orbits
+The tangent vectors are renormalised to unit length every few steps, so that they never overflow.
+
+Stability map of a massless body near a planet, run from the top directory of the repository:
+    python -m orbitals.chaos --radii 5 15 100 --velocities 0.8 1.2 100 --plot map.png
+"""
+
+import argparse
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from orbitals.nbody import G, circular_velocity, energy
+
+
+def tangent_accelerations(pos, dpos, m_star, m=None, softening=0.):
+    """
+    Returns the gravitational acceleration of each body, and its change for a small displacement of the positions
+    (the Jacobian of the accelerations times the displacement), computed together to share the distances. The
+    forces between bodies are done for all pairs at once, so this is meant for small systems, batched over many
+    runs with leading dimensions.
+    Input:
+      - pos:       (..., N, 3) array of positions
+      - dpos:      (..., N, 3) array of displacements of the positions
+      - m_star:    mass of star
+      - m:         (..., N) array of masses, or None for test bodies which do not attract each other
+      - softening: softening length added to the distance between bodies
+    Output: (acc, dacc), two (..., N, 3) arrays
+    """
+    # Star fixed at the origin: a = -G M r / |r|^3, da = -G M (dr / |r|^3 - 3 r (r . dr) / |r|^5)
+    # (einsum is much faster than np.sum for the short coordinate axis)
+    inv_r2 = 1 / np.einsum('...k,...k->...', pos, pos)[..., None]
+    inv_r3 = inv_r2 * np.sqrt(inv_r2)
+    radial = np.einsum('...k,...k->...', pos, dpos)[..., None] * inv_r2
+    acc = -G * m_star * pos * inv_r3
+    dacc = -G * m_star * inv_r3 * (dpos - 3 * radial * pos)
+
+    if m is not None:
+        # Separations d_ij = pos_j - pos_i, (..., N, N, 3)
+        d = pos[..., None, :, :] - pos[..., :, None, :]
+        dd = dpos[..., None, :, :] - dpos[..., :, None, :]
+        r2 = np.einsum('...k,...k->...', d, d) + softening ** 2
+
+        # A body exerts no force on itself
+        with np.errstate(divide='ignore'):
+            inv_r2 = np.where(r2 > 0, 1 / r2, 0.)
+        w = G * m[..., None, :] * inv_r2 * np.sqrt(inv_r2)
+        radial = np.einsum('...k,...k->...', d, dd) * inv_r2
+
+        acc = acc + np.einsum('...ij,...ijk->...ik', w, d)
+        dacc = dacc + np.einsum('...ij,...ijk->...ik', w, dd) - 3 * np.einsum('...ij,...ijk->...ik', w * radial, d)
+
+    return acc, dacc
+
+
+def variational_step(pos, vel, dpos, dvel, m_star, dt, m=None, softening=0.):
+    """
+    Moves the bodies on by one time step of the semi-implicit Euler method of nbody.step(), and the tangent vector
+    (dpos, dvel) on by the same step linearised about the orbit, so that it follows the separation from an orbit
+    which started infinitesimally close.
+    Input:
+      - pos, vel:   (..., N, 3) arrays of positions and velocities at start of time step
+      - dpos, dvel: (..., N, 3) arrays of the tangent vector at start of time step
+      - m_star:     mass of star
+      - dt:         time step
+      - m:          (..., N) array of masses, or None for test bodies
+      - softening:  softening length added to the distance between bodies
+    Output: (pos_new, vel_new, dpos_new, dvel_new)
+    """
+    acc, dacc = tangent_accelerations(pos, dpos, m_star, m, softening)
+    vel_new = vel + acc * dt
+    dvel_new = dvel + dacc * dt
+    return pos + vel_new * dt, vel_new, dpos + dvel_new * dt, dvel_new
+
+
+def chaos_indicators(pos, vel, m_star, dt, no_steps, m=None, softening=0., renormalise_every=10, seed=None):
+    """
+    Integrates every run together with a tangent vector, and returns the maximum Lyapunov exponent and MEGNO of
+    each. Runs which escape or collide with the star come out as NaN or inf rather than stopping the others.
+    Input:
+      - pos:               (..., N, 3) array of initial positions
+      - vel:               (..., N, 3) array of initial velocities
+      - m_star:            mass of star
+      - dt:                time step
+      - no_steps:          number of time steps
+      - m:                 (..., N) array of masses, or None for test bodies
+      - softening:         softening length added to the distance between bodies
+      - renormalise_every: number of steps between renormalisations of the tangent vectors
+      - seed:              seed of the random initial tangent vectors
+    Output: (lyapunov, megno), two (...) arrays
+    """
+    rng = np.random.default_rng(seed)
+    pos, vel = np.array(pos, dtype=float), np.array(vel, dtype=float)
+    shape = np.broadcast_shapes(pos.shape, vel.shape)
+    pos, vel = np.broadcast_to(pos, shape).copy(), np.broadcast_to(vel, shape).copy()
+
+    # Random unit tangent vector of each run
+    dpos, dvel = rng.standard_normal(shape), rng.standard_normal(shape)
+    norm = np.sqrt(np.sum(dpos ** 2 + dvel ** 2, axis=(-2, -1), keepdims=True))
+    dpos /= norm
+    dvel /= norm
+
+    # log_growth: log of the length of the tangent vector, summed over renormalisations
+    # weighted: sum of t d(log length) (the integral in MEGNO's Y), mean_y: sum of Y dt
+    log_growth = np.zeros(shape[:-2])
+    log_norm = np.zeros(shape[:-2])
+    weighted = np.zeros(shape[:-2])
+    mean_y = np.zeros(shape[:-2])
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for k in range(1, no_steps + 1):
+            pos, vel, dpos, dvel = variational_step(pos, vel, dpos, dvel, m_star, dt, m, softening)
+            t = k * dt
+
+            new_log_norm = 0.5 * np.log(np.einsum('...ik,...ik->...', dpos, dpos) +
+                                        np.einsum('...ik,...ik->...', dvel, dvel))
+            weighted += t * (new_log_norm - log_norm)
+            log_norm = new_log_norm
+            mean_y += 2 * weighted / t * dt
+
+            if k % renormalise_every == 0 or k == no_steps:
+                log_growth += log_norm
+                norm = np.exp(log_norm)[..., None, None]
+                dpos /= norm
+                dvel /= norm
+                log_norm = np.zeros_like(log_norm)
+
+        t = no_steps * dt
+        return log_growth / t, mean_y / t
+
+
+def stability_map(radii, velocity_factors, m_star, m_planet, r_planet, dt, no_steps, phase=np.pi,
+                  renormalise_every=10, seed=None):
+    """
+    Chaos indicators of a massless body started on the x-y plane at each radius, with each multiple of the
+    circular velocity, while a planet orbits the star on a circular orbit. Every initial condition is integrated
+    in one vectorized run.
+    Input:
+      - radii:             (nx,) array of initial distances of the body from the star
+      - velocity_factors:  (ny,) array of initial speeds of the body, relative to a circular orbit
+      - m_star:            mass of star
+      - m_planet:          mass of planet
+      - r_planet:          radius of the orbit of the planet
+      - dt:                time step
+      - no_steps:          number of time steps
+      - phase:             angle between the planet and the body at the start
+      - renormalise_every: number of steps between renormalisations of the tangent vectors
+      - seed:              seed of the random initial tangent vectors
+    Output: (lyapunov, megno, bound), three (ny, nx) arrays, where bound is False for bodies which escaped
+    """
+    radii, velocity_factors = np.asarray(radii, dtype=float), np.asarray(velocity_factors, dtype=float)
+    r, factor = np.meshgrid(radii, velocity_factors)
+
+    pos = np.zeros(r.shape + (2, 3))
+    pos[..., 0, 0] = r_planet
+    pos[..., 1, 0] = r * np.cos(phase)
+    pos[..., 1, 1] = r * np.sin(phase)
+    vel = circular_velocity(pos, m_star)
+    vel[..., 1, :] *= factor[..., None]
+    m = np.broadcast_to([m_planet, 0.], r.shape + (2,))
+
+    lyapunov, megno = chaos_indicators(pos, vel, m_star, dt, no_steps, m, renormalise_every=renormalise_every,
+                                       seed=seed)
+
+    # Energy of the body per unit mass at the start, from the star alone: bodies not bound to the star escape
+    bound = energy(pos[..., 1:, :], vel[..., 1:, :], m_star) < 0
+    return lyapunov, megno, bound
+
+
+def plot_map(radii, velocity_factors, lyapunov, megno, bound, filename=None):
+    """
+    Plots MEGNO and the maximum Lyapunov exponent over a stability map, with the unbound initial conditions
+    masked out. Saves the figure if a filename is given, and shows it otherwise.
+    """
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5), sharey=True)
+    extent = [radii[0], radii[-1], velocity_factors[0], velocity_factors[-1]]
+    panels = [(megno, 'MEGNO', dict(vmin=0, vmax=8)), (lyapunov, 'maximum Lyapunov exponent', {})]
+
+    for ax, (values, title, limits) in zip(axes, panels):
+        image = ax.imshow(np.where(bound, values, np.nan), origin='lower', aspect='auto', extent=extent,
+                          cmap='viridis', **limits)
+        fig.colorbar(image, ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel('initial radius')
+    axes[0].set_ylabel('initial speed / circular speed')
+
+    if filename:
+        fig.savefig(filename, dpi=150, bbox_inches='tight')
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stability map of a massless body orbiting a star with a planet.')
+    parser.add_argument('--radii', type=float, nargs=3, default=[5., 15., 50], metavar=('MIN', 'MAX', 'NUM'),
+                        help='initial radii of the body')
+    parser.add_argument('--velocities', type=float, nargs=3, default=[0.8, 1.2, 50], metavar=('MIN', 'MAX', 'NUM'),
+                        help='initial speeds of the body, relative to a circular orbit')
+    parser.add_argument('--m-star', type=float, default=900., help='mass of star (units where G=1)')
+    parser.add_argument('--m-planet', type=float, default=9., help='mass of planet')
+    parser.add_argument('--r-planet', type=float, default=10., help='radius of the orbit of the planet')
+    parser.add_argument('--dt', type=float, default=2e-3, help='time step')
+    parser.add_argument('--steps', type=int, default=20000, help='number of time steps')
+    parser.add_argument('--output', default=None, help='.npz file to save the map to')
+    parser.add_argument('--plot', default=None, help='image file to save the plot to, instead of showing it')
+    args = parser.parse_args()
+
+    radii = np.linspace(args.radii[0], args.radii[1], int(args.radii[2]))
+    velocity_factors = np.linspace(args.velocities[0], args.velocities[1], int(args.velocities[2]))
+    lyapunov, megno, bound = stability_map(radii, velocity_factors, args.m_star, args.m_planet, args.r_planet,
+                                           args.dt, args.steps, seed=0)
+
+    chaotic = bound & ~(megno < 4)
+    print(f"{megno.size} initial conditions, {np.sum(~bound)} unbound, {np.sum(chaotic)} chaotic (MEGNO > 4)")
+    if args.output:
+        np.savez(args.output, radii=radii, velocity_factors=velocity_factors, lyapunov=lyapunov, megno=megno,
+                 bound=bound)
+    plot_map(radii, velocity_factors, lyapunov, megno, bound, args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import numpy as np
+
+G = 1.
+
+
+def block_accelerations(pos, m, start, stop, softening=0.):
+    """
+    Returns the gravitational acceleration of bodies start to stop - 1 due to all the bodies.
+    Input:
+      - pos:       (..., N, 3) array of positions
+      - m:         (..., N) array of masses
+      - start:     first body of the block
+      - stop:      body after the last one of the block
+      - softening: softening length added to the distance between bodies
+    Output:
+      - (..., stop - start, 3) array of accelerations
+    """
+    block = pos[..., start:stop, :]
+
+    # Squared distances from each body of the block to every body, (..., block, N), one coordinate at a time
+    r2 = softening ** 2
+    for k in range(3):
+        r2 = r2 + (pos[..., None, :, k] - block[..., :, None, k]) ** 2
+
+    # A body exerts no force on itself
+    with np.errstate(divide='ignore'):
+        inv_r3 = np.where(r2 > 0, 1 / (r2 * np.sqrt(r2)), 0.)
+
+    # sum over j of w_ij (pos_j - pos_i) = w @ pos - (sum over j of w_ij) pos_i, as a matrix product
+    w = m[..., None, :] * inv_r3
+    return G * (w @ pos - np.sum(w, axis=-1, keepdims=True) * block)
+
+
+def accelerations(pos, m_star, m=None, softening=0., block_size=256):
+    """
+    Returns the gravitational acceleration of each body due to a star fixed at the origin, and to every other body
+    if their masses are given. The bodies are done in blocks of block_size, so the memory used grows as N rather
+    than N^2. Every array may have leading dimensions, to evolve many systems at once.
+    Input:
+      - pos:        (..., N, 3) array of positions
+      - m_star:     mass of star
+      - m:          (..., N) array of masses of the bodies, or None for test bodies which do not attract each other
+      - softening:  softening length added to the distance between bodies
+      - block_size: number of bodies done at once
+    Output:
+      - (..., N, 3) array of accelerations
+    """
+    acc = -G * m_star * pos / np.sum(pos ** 2, axis=-1, keepdims=True) ** 1.5
+
+    if m is not None:
+        n = pos.shape[-2]
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            acc[..., start:stop, :] += block_accelerations(pos, m, start, stop, softening)
+
+    return acc
+
+
+def step(pos, vel, m_star, dt, m=None, softening=0., acceleration=accelerations):
+    """
+    Moves the bodies on by one time step, using the semi-implicit (symplectic) Euler method: the velocity is
+    updated first, and the position is updated with the new velocity. This costs the same as Euler's method used
+    in orbits.py, but the energy of an orbit does not drift away.
+    Input:
+      - pos:          (..., N, 3) array of positions at start of time step
+      - vel:          (..., N, 3) array of velocities at start of time step
+      - m_star:       mass of star
+      - dt:           time step
+      - m:            (..., N) array of masses, or None for test bodies
+      - softening:    softening length added to the distance between bodies
+      - acceleration: function computing the accelerations (accelerations() by default)
+    Output: (pos_new, vel_new)
+    """
+    vel_new = vel + acceleration(pos, m_star, m, softening) * dt
+    pos_new = pos + vel_new * dt
+    return pos_new, vel_new
+
+
+def energy(pos, vel, m_star, m=None, softening=0.):
+    """
+    Returns the total energy of the bodies, or the sum of their energies per unit mass for test bodies.
+    Input:
+      - pos:       (..., N, 3) array of positions
+      - vel:       (..., N, 3) array of velocities
+      - m_star:    mass of star
+      - m:         (..., N) array of masses, or None for test bodies
+      - softening: softening length added to the distance between bodies
+    Output:
+      - (...) array of energies
+    """
+    specific = 0.5 * np.sum(vel ** 2, axis=-1) - G * m_star / np.linalg.norm(pos, axis=-1)
+    if m is None:
+        return np.sum(specific, axis=-1)
+
+    d = pos[..., None, :, :] - pos[..., :, None, :]
+    r = np.sqrt(np.sum(d ** 2, axis=-1) + softening ** 2)
+    with np.errstate(divide='ignore'):
+        pair = np.where(r > 0, m[..., None, :] * m[..., :, None] / r, 0.)
+    return np.sum(m * specific, axis=-1) - 0.5 * G * np.sum(pair, axis=(-2, -1))
+
+
+def circular_velocity(pos, m_star):
+    """
+    Returns the velocity needed for a circular orbit about the star at each position, at right angles to the
+    position vector within the x-y plane (anticlockwise seen from +z).
+    Input:
+      - pos:    (..., 3) array of positions
+      - m_star: mass of star
+    Output:
+      - (..., 3) array of velocities
+    """
+    r = np.linalg.norm(pos, axis=-1, keepdims=True)
+    direction = np.cross([0., 0., 1.], pos)
+    direction /= np.linalg.norm(direction, axis=-1, keepdims=True)
+    return np.sqrt(G * m_star / r) * direction
+
+
+def disc(n, r_min, r_max, m_star, thickness=0.01, seed=None):
+    """
+    Returns the positions and velocities of n bodies on circular orbits, spread evenly over a thin disc about the
+    star between radius r_min and r_max.
+    Input:
+      - n:         number of bodies
+      - r_min:     inner radius of disc
+      - r_max:     outer radius of disc
+      - m_star:    mass of star
+      - thickness: standard deviation of the z coordinate, relative to the radius
+      - seed:      seed of the random numbers
+    Output: (pos, vel)
+    """
+    rng = np.random.default_rng(seed)
+    r = np.sqrt(rng.uniform(r_min ** 2, r_max ** 2, n))  # uniform over the area of the disc
+    angle = rng.uniform(0, 2 * np.pi, n)
+
+    pos = np.stack([r * np.cos(angle), r * np.sin(angle), thickness * r * rng.standard_normal(n)], axis=-1)
+    return pos, circular_velocity(pos, m_star)
@@ -0,0 +1,223 @@
+"""
+Direct-sum gravity for one large simulation, shared out between worker processes.
+
+The positions, velocities, masses and accelerations live in shared memory, so the workers read and write them
+without copying. Each worker owns a block of rows (bodies): it computes their accelerations from all the bodies and
+moves them on. The positions are double-buffered (read from one copy, written to the other), so the only
+synchronisation is one barrier at the end of each step.
+
+Scaling benchmark, run from the top directory of the repository:
+    python -m orbitals.parallel --sizes 1000 10000 100000 --workers 1 2 4 8
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from orbitals.nbody import G, block_accelerations
+
+# Largest number of pair separations (rows x bodies) a worker holds in memory at once
+MAX_PAIRS = 2 ** 20
+
+# Commands sent to the workers
+RUN, FORCES, STOP = 0, 1, 2
+
+
+class SharedArrays:
+    """
+    NumPy arrays in one block of shared memory, which other processes attach to by name.
+    """
+
+    def __init__(self, shapes, name=None):
+        self.shapes = shapes
+        sizes = [8 * int(np.prod(shape)) for shape in shapes.values()]
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=max(sum(sizes), 8))
+
+        self.arrays = {}
+        offset = 0
+        for (key, shape), size in zip(shapes.items(), sizes):
+            self.arrays[key] = np.ndarray(shape, dtype=np.float64, buffer=self.memory.buf, offset=offset)
+            offset += size
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self, unlink=False):
+        self.arrays.clear()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def worker(name, shapes, start, stop, barrier, step_barrier):
+    """
+    Loop of a worker process, which owns bodies start to stop - 1. It waits at the barrier for a command, carries
+    it out, and waits at the barrier again to report that it is done.
+    """
+    shared = SharedArrays(shapes, name)
+    pos, vel, acc, m, control = (shared[key] for key in ('pos', 'vel', 'acc', 'm', 'control'))
+    n = pos.shape[1]
+    block_size = max(1, MAX_PAIRS // n)
+
+    def forces(read):
+        p = pos[read]
+        acc[start:stop] = -G * control[3] * p[start:stop] / np.sum(p[start:stop] ** 2, axis=-1, keepdims=True) ** 1.5
+        if control[5]:  # bodies attract each other
+            for i in range(start, stop, block_size):
+                j = min(i + block_size, stop)
+                acc[i:j] += block_accelerations(p, m, i, j, control[4])
+
+    while True:
+        barrier.wait()
+        command, no_steps, dt, read = int(control[0]), int(control[1]), control[2], int(control[6])
+        if command == STOP:
+            break
+
+        if command == FORCES:
+            forces(read)
+        else:
+            for k in range(no_steps):
+                forces(read)
+                vel[start:stop] += acc[start:stop] * dt
+                pos[1 - read, start:stop] = pos[read, start:stop] + vel[start:stop] * dt
+                read = 1 - read
+                step_barrier.wait()  # every body has moved before any worker reads the new positions
+
+        barrier.wait()
+
+    del pos, vel, acc, m, control
+    shared.close()
+
+
+class ParallelSystem:
+    """
+    Bodies orbiting a star fixed at the origin, moved on with the semi-implicit Euler method of nbody.step(), with
+    the force computation split into row blocks across a persistent pool of worker processes.
+    Input:
+      - pos:       (N, 3) array of initial positions
+      - vel:       (N, 3) array of initial velocities
+      - m_star:    mass of star
+      - m:         (N,) array of masses, or None for test bodies which do not attract each other
+      - workers:   number of worker processes (the number of cores by default)
+      - softening: softening length added to the distance between bodies
+    """
+
+    def __init__(self, pos, vel, m_star, m=None, workers=None, softening=0.):
+        n = len(pos)
+        self.workers = min(workers or os.cpu_count(), n)
+
+        shapes = {'pos': (2, n, 3), 'vel': (n, 3), 'acc': (n, 3), 'm': (n,), 'control': (7,)}
+        self.shared = SharedArrays(shapes)
+        self.shared['pos'][0] = pos
+        self.shared['vel'][:] = vel
+        self.shared['acc'][:] = 0.
+        self.shared['m'][:] = 0. if m is None else m
+
+        # control: command, number of steps, dt, m_star, softening, mutual forces, which position buffer is current
+        self.control = self.shared['control']
+        self.control[:] = [RUN, 0, 0., m_star, softening, m is not None, 0]
+
+        self.barrier = mp.Barrier(self.workers + 1)
+        step_barrier = mp.Barrier(self.workers)
+        bounds = np.linspace(0, n, self.workers + 1).astype(int)
+        self.processes = [mp.Process(target=worker, args=(self.shared.memory.name, shapes, start, stop,
+                                                          self.barrier, step_barrier), daemon=True)
+                          for start, stop in zip(bounds[:-1], bounds[1:])]
+        for process in self.processes:
+            process.start()
+
+    def _command(self, command, no_steps=0, dt=0.):
+        self.control[0:3] = [command, no_steps, dt]
+        self.barrier.wait()  # start
+        if command != STOP:
+            self.barrier.wait()  # done
+
+    def step(self, dt, no_steps=1):
+        """
+        Moves the bodies on by no_steps time steps of dt.
+        """
+        self._command(RUN, no_steps, dt)
+        self.control[6] = (int(self.control[6]) + no_steps) % 2
+
+    def accelerations(self):
+        """
+        Returns the accelerations of the bodies at their current positions.
+        """
+        self._command(FORCES)
+        return self.shared['acc'].copy()
+
+    @property
+    def pos(self):
+        return self.shared['pos'][int(self.control[6])].copy()
+
+    @property
+    def vel(self):
+        return self.shared['vel'].copy()
+
+    def close(self):
+        if self.processes:
+            self._command(STOP)
+            for process in self.processes:
+                process.join()
+            self.processes = []
+            self.control = None
+            self.shared.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(sizes, workers, no_steps=1, seed=0):
+    """
+    Times a step of the direct sum for each number of bodies and number of workers.
+    Input:
+      - sizes:    numbers of bodies
+      - workers:  numbers of worker processes
+      - no_steps: steps timed (after one step to warm up)
+      - seed:     seed of the initial conditions
+    Output:
+      - list of (no. of bodies, no. of workers, seconds per step)
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in sizes:
+        pos = rng.uniform(-10, 10, (n, 3))
+        vel = np.zeros((n, 3))
+        m = np.full(n, 1e-3)
+        for no_workers in workers:
+            with ParallelSystem(pos, vel, 900., m, no_workers) as system:
+                system.step(1e-4)
+                start = time.perf_counter()
+                system.step(1e-4, no_steps)
+                results.append((n, no_workers, (time.perf_counter() - start) / no_steps))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the parallel direct-sum gravity.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='numbers of bodies')
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help='numbers of worker processes')
+    parser.add_argument('--steps', type=int, default=1, help='number of steps timed')
+    args = parser.parse_args()
+
+    workers = args.workers or sorted({2 ** i for i in range(int(np.log2(os.cpu_count())) + 1)} | {os.cpu_count()})
+
+    # The speedup is against one worker, which is always timed (first) even when it is not asked for
+    results = benchmark(args.sizes, [1] + sorted(set(workers) - {1}), args.steps)
+    single = {n: seconds for n, no_workers, seconds in results if no_workers == 1}
+
+    print(f"{'bodies':>8} {'workers':>8} {'s/step':>10} {'speedup':>8}")
+    for n, no_workers, seconds in results:
+        if no_workers in workers:
+            print(f"{n:>8} {no_workers:>8} {seconds:>10.4f} {single[n] / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
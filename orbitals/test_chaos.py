@@ -0,0 +1,18 @@
+import numpy as np
+
+from orbitals.chaos import chaos_indicators
+
+
+def test_megno_of_kepler_orbits_tends_to_2():
+    # Test bodies on a circular and two eccentric orbits about a star, with a period of 1 at radius 1
+    m_star = 4 * np.pi ** 2
+    pos = np.zeros((3, 1, 3))
+    pos[:, 0, 0] = 1
+    vel = np.zeros_like(pos)
+    vel[:, 0, 1] = np.sqrt(m_star) * np.array([1., 1.15, 0.9])
+
+    # about 100 orbits
+    lyapunov, megno = chaos_indicators(pos, vel, m_star, 2e-3, 50000, seed=0)
+
+    assert np.all(np.abs(megno - 2) < 0.1)
+    assert np.all((lyapunov >= 0) & (lyapunov < 0.1))
@@ -0,0 +1,263 @@
+"""
+Native pygame viewer for orbits about a star, as a lighter alternative to the vpython animations of orbits.py.
+
+Run from the top directory of the repository:
+    python -m orbitals.viewer [--bodies 2000] [--m-star 900] [--dt 1e-3]
+
+The bodies are drawn straight into the pixels of the screen from the position arrays (projected onto the x-y
+plane), so thousands of bodies and their trails cost a few array operations per frame. The boxes on the left set
+the parameters (press return to apply them, which restarts the simulation).
+
+Mouse: drag to pan, wheel to zoom. Keys: space to pause, r to restart, c to recentre.
+"""
+
+import argparse
+
+import numpy as np
+import pygame
+
+from helpers import InputTextBox, Graph, draw_widgets
+from orbitals.nbody import disc, energy, step
+
+SCREEN_SIZE = (1400, 850)
+PANEL_WIDTH = 400
+FPS = 60
+
+# Trail positions are kept for at most TRAIL_LENGTH frames, and MAX_TRAIL_POINTS points over all the bodies
+TRAIL_LENGTH = 200
+MAX_TRAIL_POINTS = 300000
+
+# Largest number of bodies and of time steps per frame which can be set
+MAX_BODIES = 100000
+MAX_STEPS = 1000
+
+# Energy is only tracked while it is cheap to compute (the energy between bodies costs N^2)
+MAX_BODIES_ENERGY = 500
+
+BACKGROUND = pygame.Color("black")
+STAR_COLOUR = pygame.Color("yellow")
+BODY_COLOUR = pygame.Color("green")
+TRAIL_COLOUR = pygame.Color(0, 90, 40)
+
+# Parameters set with the text boxes: (name, title, type)
+CONTROLS = [
+    ('m_star', 'm_star', float),
+    ('dt', 'dt', float),
+    ('steps', 'steps/frame', int),
+    ('bodies', 'bodies', int),
+    ('r_min', 'r min', float),
+    ('r_max', 'r max', float),
+    ('m_body', 'body mass', float),
+    ('mutual', 'mutual (0/1)', int),
+    ('seed', 'seed', int),
+]
+
+
+def valid(parameters):
+    """
+    Returns whether the simulation can be started from the parameters.
+    """
+    p = parameters
+    finite = all(np.isfinite(p[name]) for name, _, kind in CONTROLS if kind is float)
+    return (finite and p['m_star'] > 0 and p['dt'] > 0 and 1 <= p['steps'] <= MAX_STEPS
+            and 1 <= p['bodies'] <= MAX_BODIES and 0 < p['r_min'] < p['r_max'] and p['seed'] >= 0)
+
+
+class Viewer:
+    def __init__(self, parameters):
+        self.screen = pygame.display.set_mode(SCREEN_SIZE)
+        pygame.display.set_caption("Orbits")
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 24)
+
+        self.parameters = dict(parameters)
+        self.sim_rect = pygame.Rect(PANEL_WIDTH, 0, SCREEN_SIZE[0] - PANEL_WIDTH, SCREEN_SIZE[1])
+        self.sim_surface = pygame.Surface(self.sim_rect.size)
+
+        self.boxes = {}
+        for i, (name, title, _) in enumerate(CONTROLS):
+            self.boxes[name] = InputTextBox(180, 30 + 50 * i, 200, 32, title, str(parameters[name]),
+                                            clear_on_submit=False)
+        self.graph = Graph(40, 540, PANEL_WIDTH - 70, 160, samples_per_column=1)
+        self.info_rect = pygame.Rect(20, 740, PANEL_WIDTH - 40, 90)
+
+        self.paused = False
+        self.dragging = False
+        self.reset()
+
+    def reset(self):
+        """
+        Starts the simulation again from the current parameters.
+        """
+        p = self.parameters
+        self.pos, self.vel = disc(p['bodies'], p['r_min'], p['r_max'], p['m_star'], seed=p['seed'])
+        self.m = np.full(p['bodies'], p['m_body']) if p['mutual'] else None
+        self.time = 0.
+
+        self.track_energy = self.m is None or p['bodies'] <= MAX_BODIES_ENERGY
+        self.energy0 = energy(self.pos, self.vel, p['m_star'], self.m) if self.track_energy else None
+        self.graph = Graph(*self.graph.rect, samples_per_column=1)
+
+        # Capped ring buffer of the x-y positions of the last frames
+        self.trail_length = max(1, min(TRAIL_LENGTH, MAX_TRAIL_POINTS // max(p['bodies'], 1)))
+        self.trail = np.full((self.trail_length, p['bodies'], 2), np.nan)
+        self.no_frames = 0
+
+        self.recentre()
+        self.screen.fill(BACKGROUND)
+        for box in self.boxes.values():
+            box.dirty = True
+        pygame.display.flip()
+
+    def recentre(self):
+        self.centre = np.zeros(2)
+        self.zoom = 0.45 * min(self.sim_rect.size) / max(self.parameters['r_max'], 1e-9)
+
+    def apply(self, name, text):
+        """
+        Sets a parameter from the text of its box, and restarts the simulation. Text which is not a valid value
+        puts the box back to the current value.
+        """
+        kind = dict((name, kind) for name, _, kind in CONTROLS)[name]
+        try:
+            value = kind(float(text)) if kind is int else kind(text)
+        except (ValueError, OverflowError):  # OverflowError: int(float('inf'))
+            value = None
+
+        parameters = dict(self.parameters, **{name: value})
+        if value is None or not valid(parameters):
+            self.boxes[name].set_text(str(self.parameters[name]))
+            return
+
+        self.parameters = parameters
+        if name not in ('dt', 'steps'):
+            self.reset()
+
+    def to_screen(self, xy):
+        """
+        Projects (..., 2) world x-y coordinates to pixel coordinates of the simulation surface.
+        """
+        w, h = self.sim_rect.size
+        x = w / 2 + (xy[..., 0] - self.centre[0]) * self.zoom
+        y = h / 2 - (xy[..., 1] - self.centre[1]) * self.zoom
+        return x, y
+
+    def handle_event(self, event):
+        for name, box in self.boxes.items():
+            submitted = box.handle_event(event)
+            if submitted is not None:
+                self.apply(name, submitted)
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.sim_rect.collidepoint(event.pos):
+            self.dragging = True
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.dragging = False
+        elif event.type == pygame.MOUSEMOTION and self.dragging:
+            self.centre -= np.array([event.rel[0], -event.rel[1]]) / self.zoom
+        elif event.type == pygame.MOUSEWHEEL and self.sim_rect.collidepoint(pygame.mouse.get_pos()):
+            # Zoom about the point under the mouse
+            mx, my = pygame.mouse.get_pos()
+            w, h = self.sim_rect.size
+            offset = np.array([mx - self.sim_rect.x - w / 2, -(my - h / 2)])
+            factor = 1.2 ** event.y
+            self.centre += offset / self.zoom * (1 - 1 / factor)
+            self.zoom *= factor
+        elif event.type == pygame.KEYDOWN and not any(box.active for box in self.boxes.values()):
+            if event.key == pygame.K_SPACE:
+                self.paused = not self.paused
+            elif event.key == pygame.K_r:
+                self.reset()
+            elif event.key == pygame.K_c:
+                self.recentre()
+
+    def advance(self):
+        p = self.parameters
+        for _ in range(p['steps']):
+            self.pos, self.vel = step(self.pos, self.vel, p['m_star'], p['dt'], self.m)
+        self.time += p['steps'] * p['dt']
+
+        self.trail[self.no_frames % self.trail_length] = self.pos[:, :2]
+        self.no_frames += 1
+
+        if self.track_energy:
+            e = energy(self.pos, self.vel, p['m_star'], self.m)
+            self.graph.append((e - self.energy0) / abs(self.energy0))
+
+    def plot(self, xy, colour, size=1):
+        """
+        Sets the pixels of the simulation surface at the given (..., 2) world coordinates, in one array operation.
+        """
+        x, y = self.to_screen(xy.reshape(-1, 2))
+        w, h = self.sim_rect.size
+        inside = (x >= 0) & (x < w - size + 1) & (y >= 0) & (y < h - size + 1)
+        x, y = x[inside].astype(int), y[inside].astype(int)
+
+        pixels = pygame.surfarray.pixels2d(self.sim_surface)
+        value = self.sim_surface.map_rgb(colour)
+        for dx in range(size):
+            for dy in range(size):
+                pixels[x + dx, y + dy] = value
+        del pixels  # unlocks the surface
+
+    def draw(self):
+        self.sim_surface.fill(BACKGROUND)
+        self.plot(self.trail, TRAIL_COLOUR)
+        self.plot(self.pos[:, :2], BODY_COLOUR, size=2)
+        pygame.draw.circle(self.sim_surface, STAR_COLOUR, [int(c) for c in self.to_screen(np.zeros(2))], 5)
+        self.screen.blit(self.sim_surface, self.sim_rect)
+        rects = [self.sim_rect]
+
+        for box in self.boxes.values():
+            box.update()
+        rects += draw_widgets(self.screen, list(self.boxes.values()) + [self.graph])
+
+        # Frame rate and time, redrawn a few times a second
+        if self.no_frames % 15 == 0:
+            self.screen.fill(BACKGROUND, self.info_rect)
+            lines = [f"{self.clock.get_fps():.0f} fps, {len(self.pos)} bodies", f"t = {self.time:.3f}"]
+            if self.track_energy:
+                lines.append("relative energy error (plot above)")
+            for i, line in enumerate(lines):
+                self.screen.blit(self.font.render(line, True, "white"), (self.info_rect.x, self.info_rect.y + 25 * i))
+            rects.append(self.info_rect)
+
+        pygame.display.update(rects)
+
+    def run(self):
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                else:
+                    self.handle_event(event)
+
+            if not self.paused:
+                self.advance()
+            self.draw()
+            self.clock.tick(FPS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pygame viewer of orbits about a star.')
+    parser.add_argument('--m-star', type=float, default=900., help='mass of star (units where G=1)')
+    parser.add_argument('--dt', type=float, default=1e-3, help='time step')
+    parser.add_argument('--steps', type=int, default=10, help='time steps per frame')
+    parser.add_argument('--bodies', type=int, default=2000, help='number of bodies')
+    parser.add_argument('--r-min', type=float, default=2., help='inner radius of the disc of bodies')
+    parser.add_argument('--r-max', type=float, default=8., help='outer radius of the disc of bodies')
+    parser.add_argument('--m-body', type=float, default=1e-3, help='mass of each body')
+    parser.add_argument('--mutual', type=int, default=0, help='1 to include the forces between bodies')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the initial conditions')
+    args = parser.parse_args()
+    if not valid(vars(args)):
+        parser.error(f'm-star and dt must be positive and finite, steps 1 to {MAX_STEPS}, bodies 1 to {MAX_BODIES}, '
+                     'seed at least 0, and 0 < r-min < r-max')
+
+    pygame.init()
+    Viewer(vars(args)).run()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
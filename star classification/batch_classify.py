@@ -0,0 +1,190 @@
+# Imports
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from features import spectrum_features
+from spectra import read_spectra
+from spectrum_store import SpectrumStore
+
+# ----------------------------------
+
+# Columns of the classification table
+RESULT_COLUMNS = ['filename', 'status', 'classification', 'no_samples', 'error']
+
+# Number of files read by a worker process per task
+FILES_PER_TASK = 64
+
+# Number of spectra classified per call to predict
+BATCH_SIZE = 4096
+
+# ----------------------------------
+
+
+def predict_spectra(classifier, spectra):
+    """
+    Classifies many spectra with a single call to predict, on their feature vectors
+    :param classifier: trained classifier object
+    :param spectra: list of (wavelength, reflectance, error) arrays
+    :return: array of classifications, one per spectrum (None for spectra with no samples on the wavelength grid)
+    """
+
+    features = spectrum_features(spectra)
+    usable = np.isfinite(features).all(axis=1)
+
+    classifications = np.full(len(spectra), None, dtype=object)
+    if usable.any():
+        with np.errstate(divide='ignore'):  # classes declared for incremental training may have a prior of zero
+            classifications[usable] = classifier.predict(features[usable])
+
+    return classifications
+
+
+class ResultWriter:
+    """
+    Appends batches of results to a CSV file, or to a Parquet file if its name ends in '.parquet', so that the
+    results of the files classified so far are saved even if the run is interrupted
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.parquet = os.path.splitext(filename)[1] == '.parquet'
+        self.writer = None
+        if not self.parquet:
+            pd.DataFrame(columns=RESULT_COLUMNS).to_csv(filename, index=False)
+
+    def write(self, rows):
+        table = pd.DataFrame(rows, columns=RESULT_COLUMNS).astype({'no_samples': 'int64'})
+
+        if not self.parquet:
+            table.to_csv(self.filename, mode='a', header=False, index=False)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        batch = pa.Table.from_pandas(table, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.filename, batch.schema)
+        self.writer.write_table(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def classify_batch(classifier, spectra, writer):
+    """
+    Classifies a batch of spectra and writes one row per file to the results
+    :param classifier: trained classifier object
+    :param spectra: list of (filename, (wavelength, reflectance, error) arrays or None, error message or None)
+    :param writer: ResultWriter
+    :return: number of files classified
+    """
+
+    rows = [(filename, 'error', None, 0, error) for filename, spectrum, error in spectra if error is not None]
+    valid = [(filename, spectrum) for filename, spectrum, error in spectra if error is None]
+
+    classifications = predict_spectra(classifier, [spectrum for _, spectrum in valid])
+    for (filename, spectrum), classification in zip(valid, classifications):
+        if classification is None:
+            rows.append((filename, 'empty', None, len(spectrum[0]), 'no samples on the wavelength grid'))
+        else:
+            rows.append((filename, 'ok', classification, len(spectrum[0]), None))
+
+    writer.write(rows)
+
+    return sum(classification is not None for classification in classifications)
+
+
+def classify_directory(data_dir, classifier, output, workers=None, files_per_task=FILES_PER_TASK,
+                       batch_size=BATCH_SIZE):
+    """
+    Classifies every file in a directory. The files are read by a pool of processes, with at most two tasks per
+    worker in flight so memory stays bounded however many files there are, and the spectra are classified in
+    batches as they arrive
+    :param data_dir: directory holding the spectra
+    :param classifier: trained classifier object
+    :param output: file location of the results (.csv or .parquet)
+    :param workers: number of worker processes
+    :param files_per_task: number of files read by a worker process per task
+    :param batch_size: number of spectra classified per call to predict
+    :return: number of files, and number of files classified
+    """
+
+    filenames = (entry.path for entry in os.scandir(data_dir) if entry.is_file())
+    tasks = iter(lambda: [filename for _, filename in zip(range(files_per_task), filenames)], [])
+
+    workers = workers or os.cpu_count()
+    writer = ResultWriter(output)
+    no_files = no_classified = 0
+    batch = []
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            for task in tasks:
+                in_flight.add(executor.submit(read_spectra, task))
+                if len(in_flight) < 2 * workers:
+                    continue
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch.extend(future.result())
+
+                if len(batch) >= batch_size:
+                    no_files += len(batch)
+                    no_classified += classify_batch(classifier, batch, writer)
+                    batch = []
+
+            for future in in_flight:
+                batch.extend(future.result())
+
+        if batch:
+            no_files += len(batch)
+            no_classified += classify_batch(classifier, batch, writer)
+    finally:
+        writer.close()
+
+    return no_files, no_classified
+
+
+def classify_store(path, classifier, output, batch_size=BATCH_SIZE):
+    """
+    Classifies every spectrum in a spectrum store, reading the spectra straight from the memory mapped store
+    :param path: location of the store
+    :param classifier: trained classifier object
+    :param output: file location of the results (.csv or .parquet)
+    :param batch_size: number of spectra classified per call to predict
+    :return: number of files, and number of files classified
+    """
+
+    store = SpectrumStore(path)
+    writer = ResultWriter(output)
+    no_classified = 0
+
+    try:
+        writer.write([(filename, 'error', None, 0, error) for filename, error in store.errors.items()])
+
+        for start in range(0, len(store), batch_size):
+            stop = min(start + batch_size, len(store))
+            features = store.features(start, stop)
+            no_samples = np.diff(store.offsets[start:stop + 1])
+
+            usable = np.isfinite(features).all(axis=1)
+            classifications = np.full(stop - start, None, dtype=object)
+            if usable.any():
+                with np.errstate(divide='ignore'):  # see predict_spectra
+                    classifications[usable] = classifier.predict(features[usable])
+
+            writer.write([(store.names[start + i], 'ok', classification, no_samples[i], None)
+                          if classification is not None else
+                          (store.names[start + i], 'empty', None, no_samples[i], 'no samples on the wavelength grid')
+                          for i, classification in enumerate(classifications)])
+            no_classified += int(usable.sum())
+    finally:
+        writer.close()
+
+    return len(store) + len(store.errors), no_classified
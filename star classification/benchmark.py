@@ -0,0 +1,199 @@
+# Imports
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.model_selection import RepeatedStratifiedKFold
+from sklearn.naive_bayes import GaussianNB
+
+from incremental import training_batches
+from marginal_nb import MarginalGaussianNB
+from templates import TemplateIndex
+
+# ----------------------------------
+
+# Classifiers compared: name -> (class, parameters)
+CONFIGURATIONS = {
+    'GaussianNB': (GaussianNB, {}),
+    'GaussianNB (var_smoothing=1e-3)': (GaussianNB, {'var_smoothing': 1e-3}),
+    'MarginalGaussianNB': (MarginalGaussianNB, {}),
+    'TemplateIndex': (TemplateIndex, {}),
+}
+
+# Confidence level of the intervals
+CONFIDENCE = 0.95
+
+# Training data of the worker processes, set once per process
+_x, _y = None, None
+
+# ----------------------------------
+
+
+def _set_data(x, y):
+    global _x, _y
+    _x, _y = x, y
+
+
+def run_fold(task):
+    """
+    Trains and tests one configuration on one fold. Runs in a worker process. The fit and predict are timed on
+    their own, then run again under tracemalloc to measure the peak memory, since tracing slows them down
+    :param task: (configuration name, train indices, test indices)
+    :return: dictionary of the fold's predictions, timings and peak memory
+    """
+
+    name, train, test = task
+    model_class, parameters = CONFIGURATIONS[name]
+
+    classifier = model_class(**parameters)
+    start = time.perf_counter()
+    classifier.fit(_x[train], _y[train])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prediction = classifier.predict(_x[test])
+    predict_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    model_class(**parameters).fit(_x[train], _y[train]).predict(_x[test])
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'name': name, 'test': test, 'prediction': prediction, 'fit_time': fit_time,
+            'predict_time': predict_time, 'peak_memory': peak_memory}
+
+
+def interval(values, confidence=CONFIDENCE):
+    """
+    Mean of the values and its confidence interval (Student's t). The folds of cross-validation share training
+    data, so the interval is somewhat too narrow
+    :param values: list of values, one per fold
+    :param confidence: confidence level
+    :return: dictionary of the mean, standard deviation and interval
+    """
+
+    values = np.asarray(values, dtype=float)
+    mean = float(np.mean(values))
+    std = float(np.std(values, ddof=1)) if len(values) > 1 else 0.0
+    half_width = stats.t.ppf((1 + confidence) / 2, len(values) - 1) * std / np.sqrt(len(values)) if std else 0.0
+
+    return {'mean': mean, 'std': std, 'low': mean - half_width, 'high': mean + half_width}
+
+
+def summarise(folds, y, classes):
+    """
+    Summarises the folds of one configuration
+    :param folds: list of the results of run_fold
+    :param y: classifications of all the objects
+    :param classes: list of classes
+    :return: dictionary of the quality and speed of the configuration
+    """
+
+    reports = [classification_report(y[fold['test']], fold['prediction'], labels=classes, output_dict=True,
+                                     zero_division=0) for fold in folds]
+
+    # per-class and average scores, with their intervals over the folds
+    report = {}
+    for key, scores in reports[0].items():
+        if isinstance(scores, dict):
+            report[key] = {metric: interval([r[key][metric] for r in reports]) for metric in scores
+                           if metric != 'support'}
+            report[key]['support'] = int(np.mean([r[key]['support'] for r in reports]))
+
+    y_true = np.concatenate([y[fold['test']] for fold in folds])
+    y_pred = np.concatenate([fold['prediction'] for fold in folds])
+    no_predicted = sum(len(fold['test']) for fold in folds)
+    predict_time = sum(fold['predict_time'] for fold in folds)
+
+    return {
+        'accuracy': interval([accuracy_score(y[fold['test']], fold['prediction']) for fold in folds]),
+        'confusion_matrix': confusion_matrix(y_true, y_pred, labels=classes).tolist(),
+        'classification_report': report,
+        'fit_time': interval([fold['fit_time'] for fold in folds]),
+        'predict_throughput': no_predicted / predict_time if predict_time else None,    # spectra per second
+        'peak_memory': int(max(fold['peak_memory'] for fold in folds)),    # bytes
+    }
+
+
+def cross_validation_splits(y, folds=5, repeats=3, seed=0):
+    """
+    Splits the objects into folds for repeated stratified k-fold cross-validation, so every fold has about the
+    same share of each class
+    :param y: classifications of all the objects
+    :param folds: number of folds
+    :param repeats: number of times the cross-validation is repeated with different folds
+    :param seed: seed of the folds
+    :return: list of (train indices, test indices), folds * repeats of them
+    """
+
+    splitter = RepeatedStratifiedKFold(n_splits=folds, n_repeats=repeats, random_state=seed)
+    return list(splitter.split(np.zeros((len(y), 1)), y))
+
+
+def benchmark(filename='training_data.csv', configurations=tuple(CONFIGURATIONS), folds=5, repeats=3, workers=None,
+              seed=0):
+    """
+    Compares classifiers by repeated stratified k-fold cross-validation on the training data, running the folds
+    in parallel
+    :param filename: file location of training data, or of a spectrum store
+    :param configurations: names of the configurations to compare
+    :param folds: number of folds
+    :param repeats: number of times the cross-validation is repeated with different folds
+    :param workers: number of worker processes
+    :param seed: seed of the folds
+    :return: dictionary of results
+    """
+
+    batches = list(training_batches(filename, chunksize=None))
+    x = np.concatenate([x for x, _ in batches])
+    y = np.concatenate([y for _, y in batches]).astype(str)
+    usable = np.isfinite(x).all(axis=1)
+    x, y = x[usable], y[usable]
+    classes = np.unique(y)
+
+    splits = cross_validation_splits(y, folds, repeats, seed)
+    tasks = [(name, train, test) for name in configurations for train, test in splits]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_data, initargs=(x, y)) as executor:
+        results = list(executor.map(run_fold, tasks))
+
+    return {
+        'data': filename,
+        'no_objects': int(len(y)),
+        'classes': classes.tolist(),
+        'folds': folds,
+        'repeats': repeats,
+        'workers': workers or os.cpu_count(),
+        'configurations': {name: summarise([fold for fold in results if fold['name'] == name], y, classes)
+                           for name in configurations},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validation and speed benchmark of the classifiers.')
+    parser.add_argument('training', nargs='?', default='training_data.csv',
+                        help='training data (CSV file or spectrum store)')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--folds', type=int, default=5, help='number of folds')
+    parser.add_argument('--repeats', type=int, default=3, help='number of repeats of the cross-validation')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    results = benchmark(args.training, folds=args.folds, repeats=args.repeats, workers=args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    for name, result in results['configurations'].items():
+        accuracy = result['accuracy']
+        print(f"{name}: accuracy {accuracy['mean']:.3f} ({accuracy['low']:.3f} - {accuracy['high']:.3f}), "
+              f"{result['predict_throughput']:.0f} spectra/s, peak memory {result['peak_memory'] / 2 ** 20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Imports
+import numpy as np
+
+# ----------------------------------
+
+# Common wavelength grid (nm) which every spectrum is resampled onto
+WAVELENGTH_GRID = np.arange(400, 741, 10, dtype=float)
+
+# Spectra are normalised to unit reflectance at this wavelength (nm)
+NORMALISATION_WAVELENGTH = 550
+
+# ----------------------------------
+
+
+def object_offsets(wavelength, labels=None):
+    """
+    Finds where each object starts in rows of spectra written one after the other: a new object starts wherever
+    the wavelength goes back down, or the label changes
+    :param wavelength: array of wavelengths (nm)
+    :param labels: array of labels, or None
+    :return: offsets array, object i being rows offsets[i] to offsets[i + 1]
+    """
+
+    wavelength = np.asarray(wavelength)
+    starts = np.diff(wavelength) < 0
+    if labels is not None:
+        labels = np.asarray(labels)
+        starts |= labels[1:] != labels[:-1]
+
+    return np.concatenate([[0], np.flatnonzero(starts) + 1, [len(wavelength)]]).astype(np.int64)
+
+
+def fill_gaps(values, grid=WAVELENGTH_GRID):
+    """
+    Fills the NaN values of each row by linear interpolation between its nearest valid values, and by the nearest
+    valid value beyond the ends. Rows with no valid values stay NaN
+    :param values: 2-D array, one row per spectrum
+    :param grid: wavelength grid of the columns
+    :return: filled array
+    """
+
+    no_objects, no_points = values.shape
+    valid = ~np.isnan(values)
+    columns = np.broadcast_to(np.arange(no_points), values.shape)
+
+    # index of the previous and the next valid value of every point
+    previous = np.maximum.accumulate(np.where(valid, columns, -1), axis=1)
+    following = np.minimum.accumulate(np.where(valid, columns, no_points)[:, ::-1], axis=1)[:, ::-1]
+    previous = np.where(previous < 0, following, previous)
+    following = np.where(following >= no_points, previous, following)
+    previous = np.clip(previous, 0, no_points - 1)
+    following = np.clip(following, 0, no_points - 1)
+
+    x0, x1 = grid[previous], grid[following]
+    y0 = np.take_along_axis(values, previous, axis=1)
+    y1 = np.take_along_axis(values, following, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(x1 > x0, (grid - x0) / (x1 - x0), 0)
+
+    return np.where(valid, values, y0 + t * (y1 - y0))
+
+
+def resample_spectra(wavelength, reflectance, error, offsets, grid=WAVELENGTH_GRID):
+    """
+    Resamples many spectra onto a common wavelength grid. The spectra are given as flat arrays, object i being
+    rows offsets[i] to offsets[i + 1]. Each grid point is the mean of the samples within half a grid step of it,
+    weighted by 1 / error^2; grid points with no samples are interpolated, and each spectrum is normalised to
+    unit reflectance at NORMALISATION_WAVELENGTH
+    :param wavelength: flat array of wavelengths (nm)
+    :param reflectance: flat array of reflectances
+    :param error: flat array of errors on the reflectance
+    :param offsets: offsets array of the objects
+    :param grid: common wavelength grid (nm), evenly spaced
+    :return: contiguous (no. of objects, no. of grid points) array, with rows of NaN for objects with no samples
+             or with no positive reflectance at NORMALISATION_WAVELENGTH
+    """
+
+    # only the rows covered by the offsets are used
+    offsets = np.asarray(offsets, dtype=np.int64)
+    start, stop = offsets[0], offsets[-1]
+    wavelength = np.asarray(wavelength[start:stop], dtype=float)
+    reflectance = np.asarray(reflectance[start:stop], dtype=float)
+    error = np.asarray(error[start:stop], dtype=float)
+    offsets = offsets - start
+    no_objects, no_points = len(offsets) - 1, len(grid)
+
+    # weights, using the typical error for samples with a missing or invalid error
+    good_error = np.isfinite(error) & (error > 0)
+    typical_error = np.median(error[good_error]) if good_error.any() else 1.0
+    weight = 1 / np.where(good_error, error, typical_error) ** 2
+
+    # grid point of every sample, leaving out samples off the grid
+    step = grid[1] - grid[0]
+    point = np.rint((wavelength - grid[0]) / step)
+    used = (point >= 0) & (point < no_points) & np.isfinite(reflectance)
+    obj = np.repeat(np.arange(no_objects), np.diff(offsets))
+    index = (obj * no_points + point)[used].astype(np.int64)
+
+    # error weighted mean of the samples of each grid point of each object
+    size = no_objects * no_points
+    total = np.bincount(index, weights=(weight * reflectance)[used], minlength=size)
+    total_weight = np.bincount(index, weights=weight[used], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = (total / total_weight).reshape(no_objects, no_points)
+
+    values = fill_gaps(values, grid)
+
+    # normalise each spectrum, leaving out (as rows of NaN) spectra with no positive reflectance to normalise by
+    norm = values[:, [np.argmin(np.abs(grid - NORMALISATION_WAVELENGTH))]]
+    norm = np.where(norm > 0, norm, np.nan)
+    with np.errstate(invalid='ignore'):
+        values = values / norm
+
+    return np.ascontiguousarray(values)
+
+
+def pack_spectra(spectra):
+    """
+    Packs a list of spectra into flat arrays
+    :param spectra: list of (wavelength, reflectance, error) arrays
+    :return: flat wavelength, reflectance and error arrays, and the offsets array of the objects
+    """
+
+    offsets = np.concatenate([[0], np.cumsum([len(wavelength) for wavelength, _, _ in spectra])]).astype(np.int64)
+    if not spectra:
+        return np.empty(0), np.empty(0), np.empty(0), offsets
+
+    wavelength, reflectance, error = (np.concatenate(column) for column in zip(*spectra))
+    return wavelength, reflectance, error, offsets
+
+
+def spectrum_features(spectra, grid=WAVELENGTH_GRID):
+    """
+    Feature vectors of a list of spectra
+    :param spectra: list of (wavelength, reflectance, error) arrays
+    :param grid: common wavelength grid (nm)
+    :return: contiguous (no. of spectra, no. of grid points) array
+    """
+
+    return resample_spectra(*pack_spectra(spectra), grid)
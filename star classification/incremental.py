@@ -0,0 +1,145 @@
+# Imports
+import os
+
+import numpy as np
+
+from features import WAVELENGTH_GRID, resample_spectra
+from model_cache import load_model, model_filename, save_model
+from spectra import read_training_objects
+from spectrum_store import SpectrumStore, is_store
+
+# ----------------------------------
+
+# Asteroid classes (Bus-DeMeo taxonomy), declared up front since each chunk only holds some of them
+CLASSES = ['A', 'B', 'C', 'Cb', 'Cg', 'Cgh', 'Ch', 'D', 'K', 'L', 'O', 'Q', 'R', 'S', 'Sa', 'Sq', 'Sr', 'Sv', 'T',
+           'V', 'X', 'Xc', 'Xe', 'Xk']
+
+# Number of rows of the training data read at a time
+CHUNKSIZE = 10 ** 6
+
+# Fraction of the asteroids held out to measure the accuracy, and the largest number of them kept in memory
+HOLDOUT_FRACTION = 0.2
+HOLDOUT_SIZE = 10 ** 4
+
+# ----------------------------------
+
+
+def training_batches(filename, chunksize=CHUNKSIZE):
+    """
+    Reads the training data, from a CSV file or a spectrum store, in chunks of whole asteroids and turns each
+    chunk into feature vectors
+    :param filename: file location of training data, or of a spectrum store
+    :param chunksize: number of rows read at a time (None reads all of them at once)
+    :return: generator of (features, classifications) arrays
+    """
+
+    if is_store(filename):
+        store = SpectrumStore(filename)
+        for start, stop in store.batches(chunksize or store.offsets[-1]):
+            yield store.features(start, stop), store.labels[start:stop]
+        return
+
+    for rows, offsets in read_training_objects(filename, chunksize):
+        x = resample_spectra(rows['wavelength'].to_numpy(), rows['reflectance'].to_numpy(),
+                             rows['error'].to_numpy(), offsets)
+        yield x, rows['classification'].to_numpy()[offsets[:-1]]
+
+
+def held_out(index, fraction=HOLDOUT_FRACTION):
+    """
+    Decides which asteroids are held out, from a hash of their position in the training data, so the same
+    asteroids are held out every time the data is read
+    :param index: array of positions of the asteroids
+    :param fraction: fraction of the asteroids held out
+    :return: boolean array, True for the held out asteroids
+    """
+
+    hashed = (np.asarray(index, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+    return hashed < fraction * 2 ** 32
+
+
+class Holdout:
+    """
+    Uniform random sample (reservoir sample) of at most size held out asteroids, so the memory used does not
+    grow with the size of the training data
+    """
+
+    def __init__(self, size=HOLDOUT_SIZE, no_features=len(WAVELENGTH_GRID), seed=0):
+        self.x = np.empty((size, no_features))
+        self.y = np.empty(size, dtype=object)
+        self.size = size
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, x, y):
+        # fill the reservoir first
+        fill = min(max(self.size - self.seen, 0), len(y))
+        self.x[self.seen:self.seen + fill] = x[:fill]
+        self.y[self.seen:self.seen + fill] = y[:fill]
+
+        # then the n-th asteroid replaces a random one with probability size / n
+        seen = self.seen + np.arange(fill, len(y))
+        slot = (self.rng.random(len(seen)) * (seen + 1)).astype(np.int64)
+        replace = slot < self.size
+        self.x[slot[replace]] = x[fill:][replace]
+        self.y[slot[replace]] = y[fill:][replace]
+
+        self.seen += len(y)
+
+    def accuracy(self, classifier):
+        no_kept = min(self.seen, self.size)
+        if no_kept == 0:
+            return np.nan
+
+        # declared classes with no training data yet have a prior of zero
+        with np.errstate(divide='ignore'):
+            return np.mean(classifier.predict(self.x[:no_kept]) == self.y[:no_kept])
+
+
+def incremental_training(classifier, filename, classes=CLASSES, chunksize=CHUNKSIZE,
+                         holdout_fraction=HOLDOUT_FRACTION, holdout_size=HOLDOUT_SIZE, checkpoint=None):
+    """
+    Trains (or updates) the classifier on the training data one chunk at a time with partial_fit, so the memory
+    used stays the same however large the training data is. The progress is saved after every chunk, and an
+    interrupted run carries on from the last chunk saved
+    :param classifier: classifier object with a partial_fit method
+    :param filename: file location of training data
+    :param classes: list of every class the classifier can predict
+    :param chunksize: number of rows read at a time
+    :param holdout_fraction: fraction of the asteroids held out to measure the accuracy
+    :param holdout_size: largest number of held out asteroids kept in memory
+    :param checkpoint: fingerprint to save the progress under, or None not to save it
+    :return: trained classifier
+    """
+
+    checkpoint_name = f"{checkpoint}-checkpoint"
+    state = load_model(checkpoint_name) if checkpoint is not None else None
+    if state is not None:
+        classifier, no_chunks_done, holdout = state
+    else:
+        no_chunks_done, holdout = 0, Holdout(holdout_size)
+
+    no_asteroids = 0
+    for chunk_number, (x, y) in enumerate(training_batches(filename, chunksize)):
+        index = no_asteroids + np.arange(len(y))
+        no_asteroids += len(y)
+        if chunk_number < no_chunks_done:
+            continue
+
+        # leave out asteroids with no feature vector (no samples on the wavelength grid, or nothing to normalise by)
+        usable = np.isfinite(x).all(axis=1)
+        test = held_out(index, holdout_fraction)
+
+        holdout.add(x[usable & test], y[usable & test])
+        if (usable & ~test).any():
+            classifier.partial_fit(x[usable & ~test], y[usable & ~test], classes=classes)
+
+        if checkpoint is not None:
+            save_model((classifier, chunk_number + 1, holdout), checkpoint_name)
+
+    print(f"Accuracy: {holdout.accuracy(classifier)}")
+
+    if checkpoint is not None and os.path.exists(model_filename(checkpoint_name)):
+        os.remove(model_filename(checkpoint_name))
+
+    return classifier
@@ -4,10 +4,25 @@ from sklearn.metrics import confusion_matrix, accuracy_score, classification_rep
 from sklearn import datasets, preprocessing
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 from sklearn.naive_bayes import GaussianNB
+import sklearn
+import argparse
 import os
 
+from batch_classify import classify_directory, classify_store, predict_spectra
+from features import NORMALISATION_WAVELENGTH, WAVELENGTH_GRID
+from incremental import CHUNKSIZE, CLASSES, HOLDOUT_FRACTION, incremental_training, training_batches
+from model_cache import fingerprint, load_model, save_model
+from spectra import VISIBLE_MIN, VISIBLE_MAX, read_spectrum
+from spectrum_store import INDEX, is_store
+from templates import template_index
+
+# ----------------------------------
+
+# Fraction of the training data held out to measure the accuracy, and the seed of the split
+TEST_SIZE = 0.2
+RANDOM_STATE = 0
+
 # ----------------------------------
 
 
@@ -18,40 +33,121 @@ def main():
     :return: None
     """
 
-    # Generate gaussian classifier
-    classifier = GaussianNB()
+    parser = argparse.ArgumentParser(description='Classify the asteroid spectra in a directory.')
+    parser.add_argument('data_dir', nargs='?', default='data',
+                        help='directory holding the spectra, or a spectrum store')
+    parser.add_argument('--output', default='classifications.csv', help='results file (.csv or .parquet)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--training', nargs='+', default=['training_data.csv'],
+                        help='training data (CSV files or spectrum stores); files after the first update the '
+                             'classifier incrementally')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='train incrementally, reading this many rows of training data at a time')
+    parser.add_argument('--templates', action='store_true',
+                        help='classify by the nearest spectra of the training data instead of naive Bayes')
+    args = parser.parse_args()
+    if args.templates and (len(args.training) > 1 or args.chunksize is not None):
+        parser.error('--templates builds the index in memory from a single --training file, without --chunksize')
+
+    # load the trained classifier, or train it if the training data has changed
+    if args.templates:
+        classifier = template_index(args.training[0], training_parameters())
+    else:
+        classifier = trained_classifier(args.training, args.chunksize)
+
+    # classify all files in the data directory
+    if is_store(args.data_dir):
+        no_files, no_classified = classify_store(args.data_dir, classifier, args.output)
+    else:
+        no_files, no_classified = classify_directory(args.data_dir, classifier, args.output, args.workers)
+
+    print(f"Classified {no_classified} of {no_files} files in \'{args.data_dir}\', results in \'{args.output}\'")
+
+
+def training_parameters(incremental=False):
+    """
+    Parameters of the preprocessing and training, which are part of the fingerprint of a trained model
+    :param incremental: whether the classifier is trained incrementally
+    :return: dictionary of parameters
+    """
 
-    # train the classifier
-    classifier = training(classifier)
+    parameters = {'model': 'GaussianNB', 'sklearn': sklearn.__version__, 'visible': [VISIBLE_MIN, VISIBLE_MAX],
+                  'grid': WAVELENGTH_GRID.tolist(), 'normalisation': NORMALISATION_WAVELENGTH}
+    if incremental:
+        parameters.update({'mode': 'incremental', 'classes': CLASSES, 'holdout_fraction': HOLDOUT_FRACTION})
+    else:
+        parameters.update({'test_size': TEST_SIZE, 'random_state': RANDOM_STATE})
 
-    # loops through all files in 'data' directory
-    for filename in os.listdir('data'):
-        print(f"Reading data in file \'{filename}\'...\n")
-        filename = 'data/' + filename
-        classify(filename, classifier)
+    return parameters
 
 
-def training(classifier):
+def trained_classifier(filenames=('training_data.csv',), chunksize=None):
     """
-    Trains the classifier using training data in 'training_data.csv'
-    :param classifier:
-    :return:
+    Loads the classifier trained on the training data from disk, and only trains (and saves) it again when the
+    training data or the training parameters have changed. The first file trains the classifier and each
+    following file updates it incrementally; a model is saved after each file, so adding a file to the end of the
+    list only trains on the new file
+    :param filenames: file locations of training data
+    :param chunksize: number of rows read at a time when training incrementally (None trains on the first file
+                      in memory, unless there are several files)
+    :return: trained classifier
     """
 
-    # Load asteroid training dataset
-    asteroid_data_columns = ['wavelength', 'reflectance', 'error', 'classification']
-    asteroid_training_data = pd.read_csv(r'training_data.csv', skiprows=1, header=None, names=asteroid_data_columns)
+    incremental = chunksize is not None or len(filenames) > 1
+    parameters = training_parameters(incremental)
+
+    # each model's fingerprint covers its own file and the fingerprint of the model it updates
+    fingerprints = []
+    for filename in filenames:
+        previous = {'previous': fingerprints[-1]} if fingerprints else {}
+        source = os.path.join(filename, INDEX) if is_store(filename) else filename    # a store changes with its index
+        fingerprints.append(fingerprint(source, {**parameters, **previous}))
+
+    # start from the model trained on the most files
+    classifier, no_trained = None, 0
+    for i in reversed(range(len(filenames))):
+        classifier = load_model(fingerprints[i])
+        if classifier is not None:
+            no_trained = i + 1
+            break
+
+    if classifier is None and not incremental:
+        classifier = training(GaussianNB(), filenames[0])
+        save_model(classifier, fingerprints[0])
+        return classifier
+
+    if classifier is None:
+        classifier = GaussianNB()
+
+    for filename, model_fingerprint in zip(filenames[no_trained:], fingerprints[no_trained:]):
+        classifier = incremental_training(classifier, filename, chunksize=chunksize or CHUNKSIZE,
+                                          checkpoint=model_fingerprint)
+        save_model(classifier, model_fingerprint)
+
+    return classifier
+
+
+def training(classifier, filename='training_data.csv'):
+    """
+    Trains the classifier using training data in 'training_data.csv'
+    :param classifier: classifier object
+    :param filename: file location of training data, or of a spectrum store
+    :return: trained classifier
+    """
 
-    asteroid_training_data['wavelength'], asteroid_training_data['reflectance'], asteroid_training_data['error'] = sanitize(asteroid_training_data['wavelength'], asteroid_training_data['reflectance'], asteroid_training_data['error'])
+    # Load asteroid training dataset (only the rows within the visible spectrum), one row per asteroid with its
+    # spectrum resampled onto the wavelength grid
+    batches = list(training_batches(filename, chunksize=None))
+    x = np.concatenate([x for x, _ in batches])    # Independent variable (spectrum)
+    y = np.concatenate([y for _, y in batches])    # Dependent variable (measure being modelled =
+                                                   # asteroid type/classification)
 
-    # data processing
-    feature_columns = ['reflectance']    # Independent variable (measured inputs = visible wavelength)
-    target_columns = ['classification']     # Dependent variable (measure being modelled = asteroid type/classification)
-    x = asteroid_training_data[feature_columns]
-    y = asteroid_training_data[target_columns]
+    # leave out asteroids with no feature vector (no samples on the wavelength grid, or nothing to normalise by)
+    usable = np.isfinite(x).all(axis=1)
+    x, y = x[usable], y[usable]
 
     # Split data into test and train data
-    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
 
     # train the classifier model
     classifier.fit(x_train, y_train)
@@ -73,41 +169,16 @@ def classify(filename, classifier):
     :return: Asteroid classification type
     """
 
-    wavelength, reflectance, ep = np.loadtxt(filename, unpack=True)
-
-    # -------------
-
-    # sanitize data
-    wavelength, reflectance, ep = sanitize(wavelength, reflectance, ep)
+    # read and sanitize data
+    spectrum = read_spectrum(filename)
 
     # -------------
     # predict asteroid classification using test data
-    prediction = classifier.predict(reflectance)
+    prediction = predict_spectra(classifier, [spectrum])[0]
 
     print(f"Prediction for \'{filename}\' is {prediction}\n")
 
-
-def sanitize(wavelength, reflectance, error):
-    """
-    Make sure wavelength is within the visible spectrum
-    :param wavelength:
-    :param reflectance:
-    :param error:
-    :return: bool
-    """
-
-    wl, r, e = []
-
-    # Loop through all data rows
-    for i in range(len(wavelength)):
-        # Check if wavelength is within the visible spectrum
-        if 380 < wavelength < 750:
-            wl.append(wavelength[i])    # Append wavelength to sanitized data
-            r.append(reflectance[i])    # Append reflectance to sanitized data
-            e.append(error[i])             # Append e to sanitized data
-
-    # return sanitized data
-    return wl, r, e
+    return prediction
 
 
 # main
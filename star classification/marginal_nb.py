@@ -0,0 +1,141 @@
+# Imports
+import numpy as np
+from scipy.special import logsumexp
+from sklearn.base import BaseEstimator, ClassifierMixin
+
+# ----------------------------------
+
+
+class MarginalGaussianNB(ClassifierMixin, BaseEstimator):
+    """
+    Gaussian naive Bayes classifier for features with missing values (NaN). Since the features are independent
+    given the class, marginalising over a missing feature just drops its term from the log likelihood, so each
+    row is classified using only the features it has. The likelihoods of all the rows, whatever features they
+    are missing, are evaluated together with matrix products
+    """
+
+    def __init__(self, var_smoothing=1e-9, chunk_size=2 ** 16):
+        self.var_smoothing = var_smoothing
+        self.chunk_size = chunk_size
+
+    def fit(self, X, y):
+        """
+        Fits the classifier, from the observed values of each feature only
+        :param X: (no. of rows, no. of features) array, with NaN for missing values
+        :param y: array of classifications
+        :return: self
+        """
+
+        # start from scratch, as if the classifier had never been fitted
+        for attribute in ['classes_', 'class_count_', 'count_', 'sum_', 'sum_squares_', 'theta_', 'var_',
+                          'class_prior_']:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        return self.partial_fit(X, y, classes=np.unique(y))
+
+    def partial_fit(self, X, y, classes=None):
+        """
+        Updates the classifier with more training data
+        :param X: (no. of rows, no. of features) array, with NaN for missing values
+        :param y: array of classifications
+        :param classes: list of every class (needed on the first call)
+        :return: self
+        """
+
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y)
+
+        if not hasattr(self, 'classes_'):
+            self.classes_ = np.unique(classes)
+        if not hasattr(self, 'count_'):
+            shape = (len(self.classes_), X.shape[1])
+            self.class_count_ = np.zeros(len(self.classes_))
+            self.count_, self.sum_, self.sum_squares_ = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+        known = np.isin(y, self.classes_)
+        if not known.all():
+            raise ValueError(f"Classes {sorted(set(y[~known]))} are not in the list of classes")
+        label = np.searchsorted(self.classes_, y)
+
+        # sums of the observed values of each feature, per class
+        observed = np.isfinite(X)
+        values = np.where(observed, X, 0)
+        one_hot = np.zeros((len(y), len(self.classes_)))
+        one_hot[np.arange(len(y)), label] = 1
+
+        self.class_count_ += one_hot.sum(axis=0)
+        self.count_ += one_hot.T @ observed
+        self.sum_ += one_hot.T @ values
+        self.sum_squares_ += one_hot.T @ values ** 2
+
+        self._update_parameters()
+
+        return self
+
+    def _update_parameters(self):
+        # mean and variance of each feature, per class and over all the classes
+        total_count = self.count_.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            overall_mean = self.sum_.sum(axis=0) / total_count
+            overall_var = self.sum_squares_.sum(axis=0) / total_count - overall_mean ** 2
+            mean = self.sum_ / self.count_
+            var = self.sum_squares_ / self.count_ - mean ** 2
+
+        overall_mean = np.nan_to_num(overall_mean)
+        overall_var = np.nan_to_num(np.maximum(overall_var, 0), nan=1.0)
+        epsilon = self.var_smoothing * max(np.max(overall_var), 1e-300)
+
+        # a class with no values of a feature falls back on the distribution of the feature over all the classes
+        unseen = self.count_ == 0
+        self.theta_ = np.where(unseen, overall_mean, mean)
+        self.var_ = np.where(unseen, overall_var, np.maximum(var, 0)) + epsilon
+
+        with np.errstate(divide='ignore'):
+            self.class_prior_ = self.class_count_ / self.class_count_.sum()
+
+    def _joint_log_likelihood(self, X):
+        X = np.asarray(X, dtype=float)
+        observed = np.isfinite(X)
+        values = np.where(observed, X, 0)
+
+        # sum over the observed features j of -log(2 pi var_j) / 2 - (x_j - mean_j)^2 / (2 var_j), for every class
+        inverse_var = 1 / self.var_
+        with np.errstate(divide='ignore'):
+            log_prior = np.log(self.class_prior_)
+
+        return (log_prior
+                - 0.5 * observed @ np.log(2 * np.pi * self.var_).T
+                - 0.5 * (values ** 2) @ inverse_var.T
+                + values @ (self.theta_ * inverse_var).T
+                - 0.5 * observed @ (self.theta_ ** 2 * inverse_var).T)
+
+    def predict_log_proba(self, X):
+        """
+        Log probability of each class
+        :param X: (no. of rows, no. of features) array, with NaN for missing values
+        :return: (no. of rows, no. of classes) array
+        """
+
+        X = np.asarray(X, dtype=float)
+        log_proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), self.chunk_size):
+            jll = self._joint_log_likelihood(X[start:start + self.chunk_size])
+            log_proba[start:start + self.chunk_size] = jll - logsumexp(jll, axis=1, keepdims=True)
+        return log_proba
+
+    def predict_proba(self, X):
+        return np.exp(self.predict_log_proba(X))
+
+    def predict(self, X):
+        """
+        Most probable class of each row
+        :param X: (no. of rows, no. of features) array, with NaN for missing values
+        :return: array of classifications
+        """
+
+        X = np.asarray(X, dtype=float)
+        prediction = np.empty(len(X), dtype=self.classes_.dtype)
+        for start in range(0, len(X), self.chunk_size):
+            jll = self._joint_log_likelihood(X[start:start + self.chunk_size])
+            prediction[start:start + self.chunk_size] = self.classes_[np.argmax(jll, axis=1)]
+        return prediction
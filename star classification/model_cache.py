@@ -0,0 +1,109 @@
+# Imports
+import hashlib
+import json
+import os
+import pickle
+
+# ----------------------------------
+
+# Directory holding the trained models
+MODEL_DIR = 'models'
+
+# Digests of the training files, so unchanged files are not hashed again
+DIGEST_CACHE = 'digests.json'
+
+# ----------------------------------
+
+
+def file_digest(filename, model_dir=MODEL_DIR):
+    """
+    SHA-256 digest of the contents of a file. The digest is cached together with the size and modification time
+    of the file, and only computed again when they change
+    :param filename: file location
+    :param model_dir: directory holding the cache of digests
+    :return: hexadecimal digest
+    """
+
+    stat = os.stat(filename)
+    stamp = [stat.st_size, stat.st_mtime]
+    key = os.path.abspath(filename)
+
+    # a missing or corrupt cache is treated as empty
+    cache_filename = os.path.join(model_dir, DIGEST_CACHE)
+    try:
+        with open(cache_filename) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if not isinstance(cache, dict):
+        cache = {}
+
+    entry = cache.get(key)
+    if entry is not None and entry['stamp'] == stamp:
+        return entry['digest']
+
+    # hash the file in blocks, so large files are not read into memory at once
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    # written to a temporary file of this process first, so runs in parallel never read a partly written cache
+    cache[key] = {'stamp': stamp, 'digest': digest.hexdigest()}
+    os.makedirs(model_dir, exist_ok=True)
+    temporary = f"{cache_filename}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(temporary, cache_filename)
+
+    return digest.hexdigest()
+
+
+def fingerprint(filename, parameters, model_dir=MODEL_DIR):
+    """
+    Fingerprint of a trained model: a hash of the training data and of the parameters used to preprocess it and
+    train the model
+    :param filename: file location of training data
+    :param parameters: dictionary of parameters (must be JSON serializable)
+    :param model_dir: directory holding the cache of digests
+    :return: hexadecimal fingerprint
+    """
+
+    key = json.dumps({'data': file_digest(filename, model_dir), 'parameters': parameters}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def model_filename(fingerprint, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"{fingerprint}.pkl")
+
+
+def load_model(fingerprint, model_dir=MODEL_DIR):
+    """
+    Loads a trained model
+    :param fingerprint: fingerprint of the model
+    :param model_dir: directory holding the trained models
+    :return: model, or None if there is no model with this fingerprint
+    """
+
+    try:
+        with open(model_filename(fingerprint, model_dir), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save_model(model, fingerprint, model_dir=MODEL_DIR):
+    """
+    Saves a trained model. The model is written to a temporary file first, so a model interrupted while being
+    saved is never loaded
+    :param model: trained model
+    :param fingerprint: fingerprint of the model
+    :param model_dir: directory holding the trained models
+    :return: None
+    """
+
+    os.makedirs(model_dir, exist_ok=True)
+    filename = model_filename(fingerprint, model_dir)
+    with open(filename + '.tmp', 'wb') as f:
+        pickle.dump(model, f)
+    os.replace(filename + '.tmp', filename)
@@ -0,0 +1,115 @@
+# Imports
+import numpy as np
+import pandas as pd
+
+from features import object_offsets
+
+# ----------------------------------
+
+# Visible spectrum (nm)
+VISIBLE_MIN = 380
+VISIBLE_MAX = 750
+
+# Columns of 'training_data.csv'
+TRAINING_COLUMNS = ['wavelength', 'reflectance', 'error', 'classification']
+
+# ----------------------------------
+
+
+def visible(wavelength):
+    """
+    Finds which wavelengths are within the visible spectrum
+    :param wavelength: array of wavelengths (nm)
+    :return: boolean mask, True where the wavelength is visible
+    """
+
+    wavelength = np.asarray(wavelength, dtype=float)
+    return (wavelength > VISIBLE_MIN) & (wavelength < VISIBLE_MAX)
+
+
+def sanitize(wavelength, reflectance, error):
+    """
+    Make sure wavelength is within the visible spectrum
+    :param wavelength: array of wavelengths (nm)
+    :param reflectance: array of reflectances
+    :param error: array of errors on the reflectance
+    :return: wavelength, reflectance and error arrays, keeping only the visible wavelengths
+    """
+
+    mask = visible(wavelength)
+
+    # return sanitized data
+    return np.asarray(wavelength)[mask], np.asarray(reflectance)[mask], np.asarray(error)[mask]
+
+
+def read_training_data(filename='training_data.csv', chunksize=None):
+    """
+    Reads the training data in chunks, keeping only the rows within the visible spectrum, so files larger than
+    memory can be filtered and used chunk by chunk
+    :param filename: file location of training data
+    :param chunksize: number of rows read at a time (None reads the whole file at once)
+    :return: generator of sanitized DataFrames
+    """
+
+    dtypes = {'wavelength': np.float64, 'reflectance': np.float64, 'error': np.float64, 'classification': str}
+    chunks = pd.read_csv(filename, skiprows=1, header=None, names=TRAINING_COLUMNS, dtype=dtypes,
+                         chunksize=chunksize)
+
+    # read_csv returns a single DataFrame when not reading in chunks
+    if chunksize is None:
+        chunks = [chunks]
+
+    for chunk in chunks:
+        yield chunk[visible(chunk['wavelength'].to_numpy())]
+
+
+def read_training_objects(filename='training_data.csv', chunksize=None):
+    """
+    Reads the training data in chunks of whole asteroids. The last asteroid of a chunk may carry on in the next
+    chunk, so it is kept back and joined to the next chunk
+    :param filename: file location of training data
+    :param chunksize: number of rows read at a time (None reads the whole file at once)
+    :return: generator of (sanitized DataFrame, offsets array of the asteroids in it)
+    """
+
+    carry = None
+    for chunk in read_training_data(filename, chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        offsets = object_offsets(chunk['wavelength'].to_numpy(), chunk['classification'].to_numpy())
+
+        carry = chunk.iloc[offsets[-2]:]
+        yield chunk.iloc[:offsets[-2]], offsets[:-1]
+
+    if carry is not None and len(carry):
+        yield carry, np.array([0, len(carry)])
+
+
+def read_spectrum(filename):
+    """
+    Reads a spectrum from a text file with wavelength, reflectance and error columns
+    :param filename: file location of data
+    :return: wavelength, reflectance and error arrays, keeping only the visible wavelengths
+    """
+
+    wavelength, reflectance, error = np.loadtxt(filename, unpack=True, ndmin=2)
+
+    return sanitize(wavelength, reflectance, error)
+
+
+def read_spectra(filenames):
+    """
+    Reads and sanitizes a list of spectra. Runs in a worker process, so a file which can not be read is returned
+    with its error instead of stopping the batch
+    :param filenames: list of file locations
+    :return: list of (filename, (wavelength, reflectance, error) arrays or None, error message or None)
+    """
+
+    spectra = []
+    for filename in filenames:
+        try:
+            spectra.append((filename, read_spectrum(filename), None))
+        except Exception as e:
+            spectra.append((filename, None, f"{type(e).__name__}: {e}"))
+
+    return spectra
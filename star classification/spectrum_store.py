@@ -0,0 +1,262 @@
+# Imports
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import resample_spectra
+from spectra import read_spectra, read_training_objects
+
+# ----------------------------------
+
+# Directory holding the spectrum stores
+STORE_DIR = 'spectra_store'
+
+# Index file of a store, and the binary files of its columns
+INDEX = 'index.json'
+OFFSETS = 'offsets.i8'
+COLUMNS = ['wavelength', 'reflectance', 'error']
+
+# Number of files parsed by a worker process per task
+FILES_PER_TASK = 64
+
+# ----------------------------------
+
+
+def is_store(path):
+    """
+    Checks whether a path is a spectrum store
+    :param path: path to check
+    :return: bool
+    """
+
+    return os.path.isfile(os.path.join(path, INDEX))
+
+
+def file_stamp(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+class SpectrumStore:
+    """
+    Spectra stored column by column: the wavelength, reflectance and error of every object one after the other
+    in flat binary arrays, and an offsets array, object i being rows offsets[i] to offsets[i + 1]. The columns are
+    memory mapped, so reading a spectrum does not copy it or parse any text
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX)) as f:
+            self.index = json.load(f)
+
+        self.names = self.index['names']
+        self.labels = None if self.index['labels'] is None else np.array(self.index['labels'], dtype=object)
+        self.errors = self.index['errors']
+        self.offsets = np.fromfile(os.path.join(path, OFFSETS), dtype='<i8')
+
+        no_rows = int(self.offsets[-1])
+        self.columns = {column: np.memmap(os.path.join(path, column + '.f8'), dtype='<f8', mode='r',
+                                          shape=(no_rows,)) if no_rows else np.empty(0)
+                        for column in COLUMNS}
+
+    def __len__(self):
+        return len(self.names)
+
+    def spectrum(self, i):
+        """
+        Spectrum of one object, as views of the memory mapped columns
+        :param i: number of the object
+        :return: wavelength, reflectance and error arrays
+        """
+
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        return tuple(self.columns[column][rows] for column in COLUMNS)
+
+    def features(self, start=0, stop=None):
+        """
+        Feature vectors of a range of objects
+        :param start: number of the first object
+        :param stop: number of the object after the last one (None for the end of the store)
+        :return: contiguous (no. of objects, no. of grid points) array
+        """
+
+        stop = len(self) if stop is None else stop
+        return resample_spectra(*(self.columns[column] for column in COLUMNS), self.offsets[start:stop + 1])
+
+    def batches(self, no_rows):
+        """
+        Splits the objects into ranges of about no_rows rows (and at least one object)
+        :param no_rows: number of rows per range
+        :return: generator of (start, stop) object numbers
+        """
+
+        start = 0
+        while start < len(self):
+            stop = int(np.searchsorted(self.offsets, self.offsets[start] + no_rows, side='right')) - 1
+            stop = min(max(stop, start + 1), len(self))
+            yield start, stop
+            start = stop
+
+
+class StoreWriter:
+    """
+    Writes a spectrum store one batch of objects at a time. The store is written next to its final location and
+    only replaces the old store once it is complete
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+
+        self.files = {column: open(os.path.join(self.tmp_path, column + '.f8'), 'wb') for column in COLUMNS}
+        self.lengths = []
+        self.names = []
+        self.labels = []
+
+    def append(self, wavelength, reflectance, error, offsets, names, labels=None):
+        """
+        Appends objects to the store
+        :param wavelength: flat array of wavelengths (nm)
+        :param reflectance: flat array of reflectances
+        :param error: flat array of errors on the reflectance
+        :param offsets: offsets array of the objects in the flat arrays
+        :param names: list of names of the objects
+        :param labels: list of classifications of the objects, or None
+        :return: None
+        """
+
+        rows = slice(offsets[0], offsets[-1])
+        for column, values in zip(COLUMNS, (wavelength, reflectance, error)):
+            np.asarray(values[rows], dtype='<f8').tofile(self.files[column])
+
+        self.lengths.extend(np.diff(offsets).tolist())
+        self.names.extend(names)
+        if labels is not None:
+            self.labels.extend(labels)
+
+    def close(self, sources, errors=None):
+        """
+        Finishes the store and puts it in place of the old one
+        :param sources: dictionary of the size and modification time of every source file
+        :param errors: dictionary of the error message of every source file which could not be read
+        :return: None
+        """
+
+        for f in self.files.values():
+            f.close()
+
+        np.concatenate([[0], np.cumsum(self.lengths, dtype=np.int64)]).astype('<i8').tofile(
+            os.path.join(self.tmp_path, OFFSETS))
+
+        index = {'names': self.names, 'labels': self.labels if self.labels else None, 'sources': sources,
+                 'errors': errors or {}}
+        with open(os.path.join(self.tmp_path, INDEX), 'w') as f:
+            json.dump(index, f)
+
+        old_path = self.path + '.old'
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def import_directory(data_dir='data', path=os.path.join(STORE_DIR, 'data'), workers=None):
+    """
+    Packs every spectrum in a directory into a spectrum store. Files which have not changed since the last import
+    are copied from the old store instead of being parsed again, and the store is left as it is if no file has
+    changed
+    :param data_dir: directory holding the spectra
+    :param path: location of the store
+    :param workers: number of worker processes parsing the files
+    :return: number of files parsed
+    """
+
+    filenames = sorted(entry.path for entry in os.scandir(data_dir) if entry.is_file())
+    sources = {filename: file_stamp(filename) for filename in filenames}
+
+    old = SpectrumStore(path) if is_store(path) else None
+    old_sources = old.index['sources'] if old is not None else {}
+    if old is not None and old_sources == sources:
+        return 0
+
+    # parse the new and changed files
+    changed = [filename for filename in filenames if old_sources.get(filename) != sources[filename]]
+    tasks = [changed[i:i + FILES_PER_TASK] for i in range(0, len(changed), FILES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parsed = {filename: (spectrum, error) for task in executor.map(read_spectra, tasks)
+                  for filename, spectrum, error in task}
+
+    old_numbers = {name: i for i, name in enumerate(old.names)} if old is not None else {}
+    old_errors = old.errors if old is not None else {}
+
+    writer = StoreWriter(path)
+    errors = {}
+    for filename in filenames:
+        if filename in parsed:
+            spectrum, error = parsed[filename]
+        elif filename in old_numbers:
+            spectrum, error = old.spectrum(old_numbers[filename]), None
+        else:
+            spectrum, error = None, old_errors[filename]
+
+        if error is not None:
+            errors[filename] = error
+            continue
+        writer.append(*spectrum, [0, len(spectrum[0])], [filename])
+
+    writer.close(sources, errors)
+
+    return len(changed)
+
+
+def import_training_data(filename='training_data.csv', path=os.path.join(STORE_DIR, 'training'),
+                         chunksize=10 ** 6):
+    """
+    Packs the training data into a spectrum store, one object per asteroid, reading it in chunks. The store is
+    left as it is if the training data has not changed since the last import
+    :param filename: file location of training data
+    :param path: location of the store
+    :param chunksize: number of rows read at a time
+    :return: number of asteroids imported
+    """
+
+    sources = {filename: file_stamp(filename)}
+    if is_store(path) and SpectrumStore(path).index['sources'] == sources:
+        return 0
+
+    writer = StoreWriter(path)
+    for rows, offsets in read_training_objects(filename, chunksize):
+        number = len(writer.names)
+        writer.append(*(rows[column].to_numpy() for column in COLUMNS), offsets,
+                      [str(number + i) for i in range(len(offsets) - 1)],
+                      rows['classification'].to_numpy()[offsets[:-1]].tolist())
+
+    writer.close(sources)
+
+    return len(writer.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack spectra into binary spectrum stores.')
+    parser.add_argument('--data', default='data', help='directory holding the spectra to classify')
+    parser.add_argument('--training', default='training_data.csv', help='training data')
+    parser.add_argument('--store', default=STORE_DIR, help='directory holding the stores')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.data):
+        no_parsed = import_directory(args.data, os.path.join(args.store, 'data'), args.workers)
+        print(f"Parsed {no_parsed} files in \'{args.data}\'")
+    if os.path.isfile(args.training):
+        no_imported = import_training_data(args.training, os.path.join(args.store, 'training'))
+        print(f"Imported {no_imported} asteroids from \'{args.training}\'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Imports
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from marginal_nb import MarginalGaussianNB
+
+# ----------------------------------
+
+# Stellar parameters used as features (columns of the catalogues)
+STELLAR_PARAMETERS = ['mass', 'luminosity', 'temperature', 'diameter', 'age', 'gravity']
+
+# Parameters spanning orders of magnitude, which are used as log10
+LOG_PARAMETERS = ['mass', 'luminosity', 'temperature', 'diameter', 'age']
+
+# Number of catalogue rows read at a time
+CHUNKSIZE = 10 ** 6
+
+# ----------------------------------
+
+
+def stellar_features(catalogue):
+    """
+    Feature matrix of a catalogue of stars. Missing parameters (missing columns, empty values, or impossible
+    values such as a negative mass) are NaN
+    :param catalogue: DataFrame with some of the STELLAR_PARAMETERS columns
+    :return: contiguous (no. of stars, no. of parameters) array
+    """
+
+    x = np.full((len(catalogue), len(STELLAR_PARAMETERS)), np.nan)
+    for i, parameter in enumerate(STELLAR_PARAMETERS):
+        if parameter not in catalogue.columns:
+            continue
+        values = pd.to_numeric(catalogue[parameter], errors='coerce').to_numpy(dtype=float)
+        if parameter in LOG_PARAMETERS:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.where(values > 0, np.log10(values), np.nan)
+        x[:, i] = values
+
+    return x
+
+
+def read_catalogue(filename, chunksize=CHUNKSIZE):
+    """
+    Reads a catalogue of stars in chunks
+    :param filename: file location of the catalogue (CSV)
+    :param chunksize: number of rows read at a time
+    :return: generator of (DataFrame, feature matrix)
+    """
+
+    for chunk in pd.read_csv(filename, chunksize=chunksize):
+        yield chunk, stellar_features(chunk)
+
+
+def train_stellar(filename, chunksize=CHUNKSIZE):
+    """
+    Trains the classifier on a catalogue of classified stars, with a 'classification' column
+    :param filename: file location of the training catalogue
+    :param chunksize: number of rows read at a time
+    :return: trained classifier
+    """
+
+    # the classes are read first, so the catalogue never has to be in memory at once
+    classes = set()
+    for chunk in pd.read_csv(filename, usecols=['classification'], dtype=str, chunksize=chunksize):
+        classes.update(chunk['classification'])
+
+    classifier = MarginalGaussianNB()
+    for chunk, x in read_catalogue(filename, chunksize):
+        classifier.partial_fit(x, chunk['classification'].astype(str).to_numpy(), classes=sorted(classes))
+
+    return classifier
+
+
+def classify_catalogue(filename, classifier, output, chunksize=CHUNKSIZE):
+    """
+    Classifies every star of a catalogue, whatever parameters it is missing, and writes the catalogue with the
+    classification, its probability and the number of parameters used
+    :param filename: file location of the catalogue
+    :param classifier: trained classifier
+    :param output: file location of the results (CSV)
+    :param chunksize: number of rows read at a time
+    :return: number of stars classified
+    """
+
+    no_stars = 0
+    for i, (chunk, x) in enumerate(read_catalogue(filename, chunksize)):
+        log_proba = classifier.predict_log_proba(x)
+        best = np.argmax(log_proba, axis=1)
+
+        chunk['classification'] = classifier.classes_[best]
+        chunk['probability'] = np.exp(log_proba[np.arange(len(chunk)), best])
+        chunk['no_parameters'] = np.isfinite(x).sum(axis=1)
+        chunk.to_csv(output, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+        no_stars += len(chunk)
+
+    return no_stars
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify stars from incomplete stellar parameters.')
+    parser.add_argument('training', help='catalogue of classified stars (CSV with a classification column)')
+    parser.add_argument('catalogue', help='catalogue of stars to classify (CSV)')
+    parser.add_argument('output', help='CSV file to write the classifications to')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='number of rows read at a time')
+    args = parser.parse_args()
+
+    classifier = train_stellar(args.training, args.chunksize)
+    no_stars = classify_catalogue(args.catalogue, classifier, args.output, args.chunksize)
+
+    print(f"Classified {no_stars} stars, results in \'{args.output}\'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Imports
+import os
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.neighbors import BallTree, KDTree
+
+from incremental import training_batches
+from model_cache import fingerprint, load_model, save_model
+from spectrum_store import INDEX, is_store
+
+# ----------------------------------
+
+# Number of nearest templates which vote on the classification
+NO_NEIGHBOURS = 5
+
+# Number of principal components the templates are reduced to (None keeps the whole spectrum)
+NO_COMPONENTS = 8
+
+# ----------------------------------
+
+
+class TemplateIndex:
+    """
+    Classifies spectra by the labelled reference spectra (templates) nearest to them. The templates' feature
+    vectors are optionally reduced by PCA and put in a KD-tree (or ball tree), so a query only looks at a few
+    leaves of the tree instead of the whole library. Has the same fit / predict methods as the other classifiers
+    """
+
+    def __init__(self, no_neighbours=NO_NEIGHBOURS, no_components=NO_COMPONENTS, tree='kd', leaf_size=40):
+        self.no_neighbours = no_neighbours
+        self.no_components = no_components
+        self.tree = tree
+        self.leaf_size = leaf_size
+
+    def fit(self, x, y):
+        """
+        Builds the index of the templates
+        :param x: (no. of templates, no. of features) array
+        :param y: array of classifications of the templates
+        :return: self
+        """
+
+        x = np.asarray(x, dtype=float)
+        self.classes_, self.labels_ = np.unique(np.asarray(y), return_inverse=True)
+
+        self.pca_ = None
+        if self.no_components is not None and self.no_components < x.shape[1]:
+            self.pca_ = PCA(n_components=self.no_components).fit(x)
+
+        tree_class = KDTree if self.tree == 'kd' else BallTree
+        self.tree_ = tree_class(self.transform(x), leaf_size=self.leaf_size)
+
+        return self
+
+    def transform(self, x):
+        x = np.asarray(x, dtype=float)
+        return np.ascontiguousarray(self.pca_.transform(x) if self.pca_ is not None else x)
+
+    def kneighbors(self, x, no_neighbours=None):
+        """
+        Finds the nearest templates of a batch of spectra
+        :param x: (no. of spectra, no. of features) array
+        :param no_neighbours: number of templates to find (NO_NEIGHBOURS by default)
+        :return: (no. of spectra, no. of neighbours) arrays of the distances and template numbers
+        """
+
+        z = self.transform(x)
+        no_neighbours = min(no_neighbours or self.no_neighbours, self.tree_.data.shape[0])
+
+        # a dual tree search is faster for large batches
+        return self.tree_.query(z, k=no_neighbours, dualtree=len(z) > 1000)
+
+    def predict_proba(self, x):
+        """
+        Fraction of the votes of the nearest templates for each class, each template voting with weight one over
+        its distance
+        :param x: (no. of spectra, no. of features) array
+        :return: (no. of spectra, no. of classes) array
+        """
+
+        distance, template = self.kneighbors(x)
+        weight = 1 / np.maximum(distance, 1e-12)
+
+        votes = np.zeros((len(distance), len(self.classes_)))
+        np.add.at(votes, (np.arange(len(distance))[:, None], self.labels_[template]), weight)
+
+        return votes / votes.sum(axis=1, keepdims=True)
+
+    def predict(self, x):
+        """
+        Classification of each spectrum
+        :param x: (no. of spectra, no. of features) array
+        :return: array of classifications
+        """
+
+        return self.classes_[np.argmax(self.predict_proba(x), axis=1)]
+
+
+def template_index(filename, parameters, no_neighbours=NO_NEIGHBOURS, no_components=NO_COMPONENTS, tree='kd'):
+    """
+    Loads the template index of the training data from disk, and only builds (and saves) it again when the
+    training data, the preprocessing or the parameters of the index have changed
+    :param filename: file location of training data, or of a spectrum store
+    :param parameters: dictionary of the preprocessing parameters (main.training_parameters()), which are part of
+                       the fingerprint of the index together with its own parameters
+    :param no_neighbours: number of nearest templates which vote on the classification
+    :param no_components: number of principal components (None keeps the whole spectrum)
+    :param tree: 'kd' for a KD-tree, 'ball' for a ball tree
+    :return: TemplateIndex
+    """
+
+    source = os.path.join(filename, INDEX) if is_store(filename) else filename
+    parameters = {**parameters, 'model': 'TemplateIndex', 'no_neighbours': no_neighbours,
+                  'no_components': no_components, 'tree': tree}
+    index_fingerprint = fingerprint(source, parameters)
+
+    index = load_model(index_fingerprint)
+    if index is None:
+        batches = list(training_batches(filename, chunksize=None))
+        x = np.concatenate([x for x, _ in batches])
+        y = np.concatenate([y for _, y in batches])
+        usable = np.isfinite(x).all(axis=1)
+
+        index = TemplateIndex(no_neighbours, no_components, tree).fit(x[usable], y[usable])
+        save_model(index, index_fingerprint)
+
+    return index
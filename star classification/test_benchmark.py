@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from benchmark import benchmark, cross_validation_splits
+
+
+def write_training_data(filename, counts, seed=0):
+    # Spectra of different slopes for each class, with some noise
+    rng = np.random.default_rng(seed)
+    wavelength = np.arange(400, 741, 20, dtype=float)
+    rows = []
+    for slope, (classification, count) in enumerate(counts.items()):
+        for _ in range(count):
+            reflectance = 1 + slope * (wavelength - 550) / 500 + rng.normal(0, 0.02, len(wavelength))
+            rows.append(pd.DataFrame({'wavelength': wavelength, 'reflectance': reflectance, 'error': 0.01,
+                                      'classification': classification}))
+    pd.concat(rows).to_csv(filename, index=False)
+
+
+def test_folds_are_stratified(tmp_path):
+    counts = {'C': 10, 'S': 20, 'X': 5}
+    write_training_data(tmp_path / 'training.csv', counts)
+
+    results = benchmark(str(tmp_path / 'training.csv'), configurations=('GaussianNB',), folds=5, repeats=2,
+                        workers=1)
+    result = results['configurations']['GaussianNB']
+
+    assert results['no_objects'] == 35 and results['classes'] == ['C', 'S', 'X']
+    # every object is tested once per repeat, and every fold holds the same share of each class
+    assert np.sum(result['confusion_matrix'], axis=1).tolist() == [20, 40, 10]
+    assert [result['classification_report'][c]['support'] for c in 'CSX'] == [2, 4, 1]
+    assert result['accuracy']['low'] <= result['accuracy']['mean'] <= result['accuracy']['high']
+
+
+def test_cross_validation_splits():
+    y = np.repeat(['C', 'S', 'X'], [10, 20, 5])
+    splits = cross_validation_splits(y, folds=5, repeats=3, seed=0)
+
+    assert len(splits) == 15
+    for train, test in splits:
+        assert len(np.intersect1d(train, test)) == 0 and len(train) + len(test) == len(y)
+        assert [np.sum(y[test] == c) for c in 'CSX'] == [2, 4, 1]
+    for repeat in range(3):
+        tested = np.concatenate([test for _, test in splits[5 * repeat:5 * (repeat + 1)]])
+        assert np.array_equal(np.sort(tested), np.arange(len(y)))
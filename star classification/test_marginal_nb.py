@@ -0,0 +1,16 @@
+import numpy as np
+
+from marginal_nb import MarginalGaussianNB
+
+
+def test_refit_with_different_classes():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((100, 3))
+
+    classifier = MarginalGaussianNB().fit(X, rng.choice(['A', 'B'], 100))
+    classifier.fit(X + 5, rng.choice(['C', 'D', 'E'], 100))
+
+    assert list(classifier.classes_) == ['C', 'D', 'E']
+    assert classifier.class_count_.sum() == 100
+    assert classifier.theta_.shape == (3, 3)
+    assert set(classifier.predict(X + 5)) <= {'C', 'D', 'E'}
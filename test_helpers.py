@@ -0,0 +1,34 @@
+import numpy as np
+import pygame
+
+from helpers import Graph
+
+
+def test_graph_ring_buffers_wrap_around():
+    graph = Graph(0, 0, 4, 20, no_series=2, samples_per_column=3, capacity=10)
+    samples = np.arange(80, dtype=float).reshape(40, 2)
+    samples[31, 1] = np.nan  # a gap in one series
+
+    # Uneven batches, one of them longer than the capacity
+    screen = pygame.Surface((50, 50))
+    for start, stop in [(0, 1), (1, 5), (5, 18), (18, 19), (19, 40)]:
+        graph.append(samples[start:stop])
+        graph.draw(screen)
+
+    assert graph.no_samples == 40
+    assert np.array_equal(graph.data(), samples[-10:], equal_nan=True)
+
+    # 13 complete columns, of which the last 4 (the width of the graph) are kept
+    assert graph.no_columns == 13
+    for column in range(9, 13):
+        values = samples[3 * column:3 * (column + 1)]
+        assert np.array_equal(graph.column_min[column % 4], np.nanmin(values, axis=0))
+        assert np.array_equal(graph.column_max[column % 4], np.nanmax(values, axis=0))
+    assert np.array_equal(graph._pending, samples[39:])
+
+
+def test_graph_single_series():
+    graph = Graph(0, 0, 10, 10, samples_per_column=2, capacity=5)
+    graph.append([1., 2., 3.])
+    assert np.array_equal(graph.data(), [[1.], [2.], [3.]])
+    assert graph.no_columns == 1 and graph.column_min[0, 0] == 1 and graph.column_max[0, 0] == 2